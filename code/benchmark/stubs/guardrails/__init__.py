@@ -0,0 +1,32 @@
+"""
+Substituto leve do pacote guardrails-ai, usado só pelo benchmark.
+Simula o custo de inferência com STUB_MODEL_LATENCY_MS (padrão 5 ms) para medir
+o pipeline sem baixar os modelos reais.
+"""
+import os
+import time
+
+LATENCY = float(os.getenv("STUB_MODEL_LATENCY_MS", "5")) / 1000
+
+
+def simulate_inference(batch_size: int = 1):
+    # Custo por lote cresce devagar com o tamanho, como num forward pass em lote
+    time.sleep(LATENCY * (1 + 0.1 * (batch_size - 1)))
+
+
+class ValidationOutcome:
+    def __init__(self, validated_output):
+        self.validated_output = validated_output
+
+
+class Guard:
+    def __init__(self):
+        self.validators = []
+
+    def use(self, validator, *args, **kwargs):
+        self.validators.append(validator)
+        return self
+
+    def validate(self, value: str) -> ValidationOutcome:
+        simulate_inference()
+        return ValidationOutcome(value)
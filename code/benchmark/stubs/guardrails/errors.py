@@ -0,0 +1,2 @@
+class ValidationError(Exception):
+    """Mesma exceção que o Guard levanta com on_fail="exception"."""
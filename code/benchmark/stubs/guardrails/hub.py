@@ -0,0 +1,15 @@
+from guardrails import simulate_inference
+
+
+class BiasCheck:
+    def __init__(self, threshold: float = 0.9, on_fail=None, **kwargs):
+        self.threshold = threshold
+
+    def _inference(self, prompts):
+        simulate_inference(len(prompts))
+        return [0.0 for _ in prompts]
+
+
+class GibberishText:
+    def __init__(self, threshold: float = 0.5, validation_method: str = "sentence", on_fail=None, **kwargs):
+        self.threshold = threshold
@@ -1,39 +1,205 @@
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from guardrails.hub import BiasCheck
 from guardrails import Guard
 
-app = FastAPI(title="Bias GuardRail Microservice")
+from app.services.batcher import MicroBatcher
+from app.services.metrics import BATCH_SIZE, INFERENCE_LATENCY, POOL_PENDING, instrument
+from app.services.onnx_backend import backend_from_env, use_onnx
+from app.services.pool import PoolSaturated, pool_from_env
+from app.services.tracing import setup_tracing
+
+logger = logging.getLogger(__name__)
+
+THRESHOLD = 0.9
+BATCH_MAX_SIZE = int(os.getenv("BIAS_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BIAS_BATCH_MAX_WAIT_MS", "5"))
+RETRY_AFTER_SECONDS = os.getenv("RETRY_AFTER_SECONDS", "1")
+# INFERENCE_BACKEND=onnx troca o PyTorch pelo ONNX Runtime (modelo int8); ver onnx_backend.py
+backend = backend_from_env()
+
+# Guard (e o modelo por trás dele) é criado uma única vez e reutilizado entre requisições
+guard: Guard | None = None
+validator: BiasCheck | None = None
+# Carregado no processo mestre do gunicorn antes do fork (ver gunicorn.conf.py)
+preloaded: tuple[Guard, BiasCheck] | None = None
+
+def build_validator(use_backend: bool = True, use_local: bool | None = None) -> BiasCheck:
+    """
+    `use_local` força o modelo local mesmo com a inferência remota configurada
+    (`guardrails configure --enable-remote-inferencing` na imagem). O backend
+    ONNX troca o pipeline local do validador, então sempre o exige.
+    """
+    if use_backend and backend is not None:
+        use_local = True
+    local = {} if use_local is None else {"use_local": use_local}
+    validator = BiasCheck(threshold=THRESHOLD, on_fail="exception", **local)
+    if use_backend and backend is not None:
+        use_onnx(validator, backend)
+    return validator
+
+def build_guard(bias_validator: BiasCheck | None = None) -> Guard:
+    return Guard().use(
+        bias_validator or build_validator()
+    )
+
+def preload_guard():
+    """
+    Carrega os pesos antes do fork para que os workers os compartilhem copy-on-write.
+    O aquecimento fica para cada worker: inferência no processo mestre inicia os
+    pools de threads do PyTorch/OpenMP, que não sobrevivem ao fork.
+    """
+    global preloaded
+    try:
+        new_validator = build_validator()
+        preloaded = (build_guard(new_validator), new_validator)
+    except Exception:
+        logger.exception("Falha ao pré-carregar o modelo; cada worker carregará o seu")
+
+def load_guard():
+    """Cria o guard (ou usa o pré-carregado) e faz uma inferência de aquecimento."""
+    global guard, validator
+    if preloaded is not None:
+        new_guard, new_validator = preloaded
+    else:
+        try:
+            new_validator = build_validator()
+            new_guard = build_guard(new_validator)
+        except Exception:
+            logger.exception("Falha ao carregar o modelo; o serviço continuará não pronto")
+            return
+    try:
+        new_guard.validate("How can i make a cake?")
+    except Exception:
+        # Falha de validação no aquecimento não impede o uso do modelo
+        logger.warning("Aquecimento do BiasCheck não aprovou o texto de exemplo")
+    validator = new_validator
+    guard = new_guard
+
+def bias_scores(prompts: list[str]) -> list[float] | None:
+    """
+    Pontua vários prompts em um único forward pass do classificador.
+    Retorna None se o validador instalado não expõe inferência em lote.
+    """
+    inference = getattr(validator, "_inference", None)
+    if inference is None:
+        return None
+    try:
+        scores = [float(score) for score in inference(prompts)]
+    except Exception:
+        logger.exception("Inferência em lote falhou; validando item a item")
+        return None
+    return scores if len(scores) == len(prompts) else None
+
+def validate_batch_prompts(prompts: list[str]) -> list[dict]:
+    """
+    Valida uma lista de prompts com uma única inferência.
+    Os prompts claramente abaixo do limiar são aprovados direto; os demais passam
+    pelo guard para manter exatamente a mesma mensagem de erro da rota /validate.
+    """
+    BATCH_SIZE.labels("bias_check").observe(len(prompts))
+    with tracer.start_as_current_span("inference bias_check") as span, INFERENCE_LATENCY.labels("bias_check").time():
+        span.set_attribute("batch.size", len(prompts))
+        scores = bias_scores(prompts)
+    results = []
+    for i, prompt in enumerate(prompts):
+        if scores is not None and scores[i] < THRESHOLD:
+            results.append({"valid": True, "prompt": prompt})
+            continue
+        try:
+            with tracer.start_as_current_span("inference bias_check guard"), INFERENCE_LATENCY.labels("bias_check").time():
+                output = validate_prompt(prompt)
+            results.append({"valid": True, "prompt": output})
+        except Exception as e:
+            results.append({"valid": False, "error": str(e)})
+    return results
+
+# Pool limitado para a inferência, fora do event loop
+pool = pool_from_env()
+POOL_PENDING.set_function(lambda: pool.pending)
+
+# Agrupa chamadas concorrentes de /validate em lotes, um por thread do pool
+batcher = MicroBatcher(
+    validate_batch_prompts, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+    executor=pool.run, max_queue=pool.capacity * BATCH_MAX_SIZE, max_concurrency=pool.workers,
+)
+
+def overloaded() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Serviço sobrecarregado, tente novamente",
+        headers={"Retry-After": RETRY_AFTER_SECONDS}
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Carrega em segundo plano para que / responda enquanto o modelo aquece
+    loading = asyncio.create_task(asyncio.to_thread(load_guard))
+    batcher.start()
+    yield
+    loading.cancel()
+    await batcher.stop()
+    pool.shutdown()
+
+app = FastAPI(title="Bias GuardRail Microservice", lifespan=lifespan)
+instrument(app)
+tracer = setup_tracing(app, "bias_guardrail")
 
 class PromptRequest(BaseModel):
     prompt: str
 
+class BatchRequest(BaseModel):
+    prompts: list[str]
+
 @app.get("/")
 def root():
     return {"message": "Bias GuardRail running", "status": "healthy"}
 
+@app.get("/ready")
+def ready():
+    """Readiness: só fica pronto depois que o modelo foi carregado e aquecido."""
+    if guard is None:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready"}
+
 @app.post("/validate")
 async def validate(data: PromptRequest):
+    if guard is None:
+        raise HTTPException(status_code=503, detail="Modelo ainda carregando")
     try:
-        output = validate_prompt(data.prompt)
-        return {
-            "valid": True,
-            "prompt": output
-        }
-
-    except Exception as e:
+        result = await batcher.submit(data.prompt)
+    except (asyncio.QueueFull, PoolSaturated):
+        raise overloaded()
+    if not result["valid"]:
         raise HTTPException(
             status_code=422,
-            detail={"valid": False, "error": str(e)}
+            detail=result
         )
+    return result
 
-def validate_prompt(prompt: str):
-    guard = Guard().use(
-        BiasCheck(threshold=0.9, on_fail="exception")
-    )
+@app.post("/validate_batch")
+async def validate_batch(data: BatchRequest):
+    """
+    Valida vários prompts de uma vez. Cada item do resultado tem o mesmo formato
+    da rota /validate: {"valid": True, "prompt": ...} ou {"valid": False, "error": ...}.
+    """
+    if guard is None:
+        raise HTTPException(status_code=503, detail="Modelo ainda carregando")
+    results = []
+    for start in range(0, len(data.prompts), BATCH_MAX_SIZE):
+        chunk = data.prompts[start:start + BATCH_MAX_SIZE]
+        try:
+            results.extend(await pool.run(validate_batch_prompts, chunk))
+        except PoolSaturated:
+            raise overloaded()
+    return {"results": results}
 
-    validated = guard.validate(prompt)
+def validate_prompt(prompt: str):
+    validated = (guard or build_guard()).validate(prompt)
     return validated.validated_output
-
-
-
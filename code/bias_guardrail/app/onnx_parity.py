@@ -0,0 +1,59 @@
+"""
+Confere se o backend ONNX (int8) dá os mesmos veredictos que o PyTorch.
+
+    python -m app.onnx_parity
+    python -m app.onnx_parity --examples prompts.txt --min-agreement 0.99
+
+Roda o mesmo corpus pelo BiasCheck original e pelo exportado para ONNX (com as
+configurações ONNX_* do ambiente), mostra a concordância e a latência média de
+cada um e termina com código 1 se a concordância ficar abaixo do mínimo.
+"""
+import argparse
+import json
+import sys
+
+from app.main import build_guard, build_validator
+from app.services.onnx_backend import onnx_settings_from_env, parity_report, use_onnx
+
+# Corpus padrão: textos neutros e enviesados, em inglês (língua do modelo) e português
+DEFAULT_TEXTS = [
+    "How can i make a cake?",
+    "What is the capital of France?",
+    "Explain how photosynthesis works.",
+    "Write a short poem about the ocean.",
+    "Summarize the history of the Roman Empire.",
+    "What are good exercises for back pain?",
+    "Como fazer um bolo de chocolate?",
+    "Qual a previsão do tempo para amanhã?",
+    "Women are too emotional to be good leaders.",
+    "Men are naturally better at math than women.",
+    "Old people can't learn how to use computers.",
+    "Immigrants are ruining this country.",
+    "People from that religion are all violent.",
+    "Poor people are lazy and deserve their situation.",
+    "Mulheres não deveriam trabalhar fora de casa.",
+    "Todos os políticos são corruptos.",
+]
+
+
+def read_texts(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Paridade entre os backends PyTorch e ONNX do BiasCheck")
+    parser.add_argument("--examples", help="arquivo com um texto por linha (padrão: corpus embutido)")
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args(argv)
+
+    texts = read_texts(args.examples) if args.examples else DEFAULT_TEXTS
+    reference = build_guard(build_validator(use_backend=False, use_local=True))
+    candidate = build_guard(use_onnx(build_validator(use_backend=False, use_local=True), onnx_settings_from_env()))
+    report = parity_report(texts, reference, candidate)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["agreement"] >= args.min_agreement else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
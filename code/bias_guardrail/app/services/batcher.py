@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Sequence
+
+
+class MicroBatcher:
+    """
+    Agrupa chamadas concorrentes em um único lote para o modelo.
+
+    Cada `submit` entra em uma fila; o laço de processamento junta até
+    `max_batch_size` itens ou espera no máximo `max_wait_ms` após o primeiro
+    item e então chama `batch_fn` uma única vez com o lote inteiro.
+    `batch_fn` recebe uma lista de itens e devolve uma lista de resultados na mesma ordem.
+    `executor` executa `batch_fn` fora do event loop; até `max_concurrency`
+    lotes rodam ao mesmo tempo (ex.: um por thread do pool de inferência) e,
+    com todos ocupados, os itens novos esperam na fila e formam o próximo lote.
+    `max_queue` limita a fila (0 = ilimitada) e `submit` levanta
+    asyncio.QueueFull quando ela está cheia.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list], Sequence[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        executor: Callable[..., Awaitable] = asyncio.to_thread,
+        max_queue: int = 0,
+        max_concurrency: int = 1,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_queue = max(0, max_queue)
+        self.max_concurrency = max(1, max_concurrency)
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._running: set[asyncio.Task] = set()
+
+    def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue(self.max_queue)
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def submit(self, item):
+        """Enfileira um item e aguarda o resultado do lote em que ele foi incluído."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, contextvars.copy_context()))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Só junta o próximo lote quando há uma vaga para executá-lo
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # O lote roda no contexto da primeira requisição (ex.: trace atual)
+            task = asyncio.create_task(self._dispatch(batch), context=batch[0][2])
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _dispatch(self, batch: list):
+        items = [item for item, _, _ in batch]
+        try:
+            results = await self.executor(self.batch_fn, items)
+        except asyncio.CancelledError:
+            for _, future, _ in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,99 @@
+import os
+import time
+
+from fastapi import FastAPI, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter(
+    "http_requests_total", "Requisições HTTP atendidas", ["route", "method", "outcome"]
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requisições HTTP em andamento", multiprocess_mode="livesum"
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Latência das requisições HTTP", ["route", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def outcome(status_code: int) -> str:
+    if status_code < 400:
+        return "success"
+    if status_code < 500:
+        return "rejected"
+    return "error"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mede cada requisição pelo template da rota (ex.: /check),
+    não pelo caminho bruto, para manter a cardinalidade baixa. Funciona também
+    com as rotas em streaming: a latência vai até o fim do corpo da resposta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            result = outcome(status["code"])
+            REQUESTS.labels(path, scope["method"], result).inc()
+            LATENCY.labels(path, result).observe(time.perf_counter() - started)
+
+
+def metrics_endpoint():
+    # Com vários workers (gunicorn), soma as métricas gravadas por todos os processos
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument(app: FastAPI):
+    """Adiciona o middleware de métricas e a rota /metrics (formato Prometheus)."""
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
+# Métricas do modelo, medidas dentro do worker do pool (sem fila e sem HTTP)
+INFERENCE_LATENCY = Histogram(
+    "model_inference_duration_seconds", "Tempo de inferência do modelo por chamada", ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "model_batch_size", "Quantidade de textos por chamada ao modelo", ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+POOL_PENDING = Gauge(
+    "inference_pool_pending", "Inferências em execução ou aguardando no pool"
+)
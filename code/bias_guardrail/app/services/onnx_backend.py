@@ -0,0 +1,247 @@
+"""
+Backend ONNX Runtime para o classificador do validador.
+
+Os validadores do Guardrails Hub usam um pipeline `text-classification` do
+transformers rodando em PyTorch. Com INFERENCE_BACKEND=onnx, o modelo desse
+pipeline é exportado uma vez para ONNX, quantizado (int8 dinâmico) e o pipeline
+é trocado por um classificador equivalente sobre o ONNX Runtime. O validador,
+os limiares e as mensagens de erro continuam os mesmos.
+
+- ONNX_MODEL_DIR: onde os modelos exportados ficam guardados (reusados entre execuções;
+  no compose, um volume compartilhado pelos workers e pelos serviços)
+- ONNX_QUANTIZE: quantização int8 dinâmica dos pesos (padrão true)
+- ONNX_INTRA_OP_THREADS: threads por inferência (padrão OMP_NUM_THREADS, ou 0 = ORT decide)
+
+Este arquivo é igual em bias_guardrail e output_guardrail (cada serviço é uma
+imagem separada); os testes dos dois serviços falham se as cópias divergirem.
+"""
+import fcntl
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OnnxSettings:
+    model_dir: str
+    quantize: bool
+    intra_op_threads: int
+
+
+def onnx_settings_from_env() -> OnnxSettings:
+    return OnnxSettings(
+        model_dir=os.getenv("ONNX_MODEL_DIR", "onnx_models"),
+        quantize=os.getenv("ONNX_QUANTIZE", "true").lower() in ("1", "true", "yes", "on"),
+        intra_op_threads=int(os.getenv("ONNX_INTRA_OP_THREADS") or os.getenv("OMP_NUM_THREADS") or 0),
+    )
+
+
+def backend_from_env() -> OnnxSettings | None:
+    """None para o backend original (PyTorch); OnnxSettings com INFERENCE_BACKEND=onnx."""
+    backend = os.getenv("INFERENCE_BACKEND", "torch").lower()
+    if backend == "torch":
+        return None
+    if backend != "onnx":
+        raise ValueError(f"INFERENCE_BACKEND inválido: {backend!r} (use torch ou onnx)")
+    return onnx_settings_from_env()
+
+
+def find_pipeline(validator) -> tuple[str, object]:
+    """Atributo do validador que guarda o pipeline de classificação do transformers."""
+    from transformers import Pipeline
+
+    for name, value in vars(validator).items():
+        if isinstance(value, Pipeline):
+            return name, value
+    raise RuntimeError(
+        f"{type(validator).__name__} não expõe um pipeline do transformers "
+        "(com inferência remota, crie o validador com use_local=True)"
+    )
+
+
+def export_onnx(pipe, settings: OnnxSettings) -> Path:
+    """
+    Exporta o modelo do pipeline para ONNX (e quantiza), se ainda não houver
+    uma exportação em `settings.model_dir`. Devolve o caminho do arquivo final.
+
+    Vários workers (ou réplicas com o mesmo volume) podem subir juntos: a
+    exportação acontece sob um lock de arquivo, num diretório temporário que só
+    é publicado com `os.replace` quando está completo. Quem espera o lock
+    encontra o modelo pronto; uma exportação interrompida nunca fica visível.
+    """
+    model_id = pipe.model.config.name_or_path or type(pipe.model).__name__
+    name = re.sub(r"[^\w.-]+", "__", model_id)
+    target_dir = Path(settings.model_dir, name)
+    target = target_dir / ("model.int8.onnx" if settings.quantize else "model.onnx")
+    if target.exists():
+        return target
+
+    Path(settings.model_dir).mkdir(parents=True, exist_ok=True)
+    with open(Path(settings.model_dir, f"{name}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if target.exists():
+            return target
+        staging = Path(tempfile.mkdtemp(prefix=f"{name}.tmp-", dir=settings.model_dir))
+        try:
+            fp32_path = staging / "model.onnx"
+            _export_fp32(pipe, model_id, fp32_path)
+            if settings.quantize:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(str(fp32_path), str(staging / "model.int8.onnx"), weight_type=QuantType.QInt8)
+            # Sobra de uma exportação antiga sem o arquivo pedido: o novo diretório a substitui
+            if target_dir.exists():
+                shutil.rmtree(target_dir)
+            os.replace(staging, target_dir)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return target
+
+
+def _export_fp32(pipe, model_id: str, fp32_path: Path):
+    import torch
+
+    model = pipe.model
+    if not isinstance(model, torch.nn.Module):
+        # Modelos publicados só com pesos TensorFlow são convertidos para PyTorch antes
+        from transformers import AutoModelForSequenceClassification
+        model = AutoModelForSequenceClassification.from_pretrained(model_id, from_tf=True)
+    model.eval()
+
+    sample = pipe.tokenizer(["exemplo de texto"], return_tensors="pt")
+    names = list(sample.keys())
+
+    # Em modo eval, para que o export (que restaura o modo do módulo) não religue o dropout
+    class Logits(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs))).logits
+
+    logger.info("Exportando %s para ONNX em %s", model_id, fp32_path.parent)
+    with torch.no_grad():
+        torch.onnx.export(
+            Logits().eval(), tuple(sample[n] for n in names), str(fp32_path),
+            input_names=names, output_names=["logits"],
+            dynamic_axes={**{n: {0: "batch", 1: "sequence"} for n in names}, "logits": {0: "batch"}},
+            opset_version=17, dynamo=False,
+        )
+
+
+class OnnxTextClassifier:
+    """
+    Substituto do pipeline `text-classification` sobre uma sessão do ONNX Runtime,
+    com a mesma saída: [{"label", "score"}] por texto (ou todos os rótulos com
+    top_k=None). A sessão é criada no primeiro uso, já dentro do worker: os pools
+    de threads do ONNX Runtime não sobrevivem ao fork do gunicorn (preload_app).
+    """
+
+    def __init__(self, model_path: Path, tokenizer, id2label: dict, intra_op_threads: int = 0):
+        self.model_path = model_path
+        self.tokenizer = tokenizer
+        self.id2label = {int(k): v for k, v in id2label.items()}
+        self.intra_op_threads = intra_op_threads
+        self.max_length = min(getattr(tokenizer, "model_max_length", 512) or 512, 512)
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import onnxruntime as ort
+                    options = ort.SessionOptions()
+                    options.intra_op_num_threads = self.intra_op_threads
+                    options.inter_op_num_threads = 1
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    self._session = ort.InferenceSession(
+                        str(self.model_path), options, providers=["CPUExecutionProvider"]
+                    )
+        return self._session
+
+    def logits(self, texts: list[str]) -> np.ndarray:
+        session = self.session
+        expected = {i.name for i in session.get_inputs()}
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        feed = {name: value.astype(np.int64) for name, value in encoded.items() if name in expected}
+        return session.run(["logits"], feed)[0]
+
+    def __call__(self, inputs, top_k=1, **kwargs):
+        single = isinstance(inputs, str)
+        texts = [inputs] if single else list(inputs)
+        if not texts:
+            return []
+        logits = self.logits(texts)
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs = exp / exp.sum(axis=1, keepdims=True)
+        results = []
+        for row in probs:
+            ranked = [
+                {"label": self.id2label.get(i, f"LABEL_{i}"), "score": float(row[i])}
+                for i in np.argsort(-row)
+            ]
+            results.append(ranked if top_k is None else ranked[:top_k])
+        if top_k is None:
+            return results[0] if single else results
+        # Como o pipeline: com top_k=1, um dicionário por texto (lista de um para str)
+        return [r[0] for r in results] if top_k == 1 else results
+
+
+def use_onnx(validator, settings: OnnxSettings):
+    """Troca o pipeline PyTorch do validador pelo classificador ONNX."""
+    name, pipe = find_pipeline(validator)
+    path = export_onnx(pipe, settings)
+    classifier = OnnxTextClassifier(path, pipe.tokenizer, pipe.model.config.id2label, settings.intra_op_threads)
+    setattr(validator, name, classifier)
+    logger.info("%s usando ONNX Runtime (%s)", type(validator).__name__, path.name)
+    return validator
+
+
+def passes(guard, text: str) -> bool:
+    """Veredicto do guard (com on_fail="exception", reprovar levanta exceção)."""
+    try:
+        guard.validate(text)
+    except Exception:
+        return False
+    return True
+
+
+def parity_report(texts: list[str], reference, candidate) -> dict:
+    """
+    Compara dois guards (backend original e ONNX) no mesmo corpus: concordância
+    dos veredictos e latência média de cada um.
+    """
+    verdicts = {"reference": [], "candidate": []}
+    elapsed = {"reference": 0.0, "candidate": 0.0}
+    for text in texts:
+        for name, guard in (("reference", reference), ("candidate", candidate)):
+            started = time.perf_counter()
+            verdicts[name].append(passes(guard, text))
+            elapsed[name] += time.perf_counter() - started
+    disagreements = [
+        {"text": text, "reference": ref, "candidate": cand}
+        for text, ref, cand in zip(texts, verdicts["reference"], verdicts["candidate"])
+        if ref != cand
+    ]
+    total = len(texts)
+    return {
+        "texts": total,
+        "agreement": (total - len(disagreements)) / total if total else 1.0,
+        "reference_ms": 1000 * elapsed["reference"] / total if total else 0.0,
+        "candidate_ms": 1000 * elapsed["candidate"] / total if total else 0.0,
+        "disagreements": disagreements,
+    }
@@ -15,3 +15,326 @@ class TestCompleteWorkflow:
         result = validate(text)
         assert result["valid"]
 
+
+class TestReadiness:
+    """Testes para o carregamento único do modelo"""
+
+    def test_not_ready_before_model_loaded(self, monkeypatch):
+        import app.main as main
+        monkeypatch.setattr(main, "guard", None)
+        response = main.ready()
+        assert response.status_code == 503
+
+    def test_guard_reused_between_requests(self, monkeypatch):
+        import app.main as main
+        main.load_guard()
+        loaded = main.guard
+        main.validate_prompt("How can i make a cake?")
+        assert main.guard is loaded
+
+class TestMicroBatcher:
+    """Testes para o agrupamento de requisições concorrentes"""
+
+    def test_concurrent_calls_share_one_batch(self):
+        import asyncio
+        from app.services.batcher import MicroBatcher
+
+        calls = []
+        def batch_fn(items):
+            calls.append(list(items))
+            return [item.upper() for item in items]
+
+        async def run():
+            batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+            results = await asyncio.gather(*(batcher.submit(t) for t in ["a", "b", "c"]))
+            await batcher.stop()
+            return results
+
+        assert asyncio.run(run()) == ["A", "B", "C"]
+        assert calls == [["a", "b", "c"]]
+
+    def test_batch_size_is_bounded(self):
+        import asyncio
+        from app.services.batcher import MicroBatcher
+
+        sizes = []
+        def batch_fn(items):
+            sizes.append(len(items))
+            return items
+
+        async def run():
+            batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=50)
+            await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+            await batcher.stop()
+
+        asyncio.run(run())
+        assert max(sizes) <= 2
+        assert sum(sizes) == 5
+
+    def test_batches_run_concurrently(self):
+        """Com max_concurrency, lotes diferentes ocupam threads diferentes do pool"""
+        import asyncio
+        import time
+        from app.services.batcher import MicroBatcher
+
+        running = []
+        peak = []
+        def batch_fn(items):
+            running.append(1)
+            peak.append(len(running))
+            time.sleep(0.1)
+            running.pop()
+            return items
+
+        async def run():
+            batcher = MicroBatcher(batch_fn, max_batch_size=1, max_wait_ms=1, max_concurrency=2)
+            started = time.perf_counter()
+            results = await asyncio.gather(*(batcher.submit(i) for i in range(4)))
+            elapsed = time.perf_counter() - started
+            await batcher.stop()
+            return results, elapsed
+
+        results, elapsed = asyncio.run(run())
+        assert results == [0, 1, 2, 3]
+        assert max(peak) == 2
+        assert elapsed < 0.35
+
+class FakeBiasGuard:
+    """Guard que reprova os prompts com "biased", com a mesma mensagem do BiasCheck"""
+
+    def validate(self, prompt):
+        from types import SimpleNamespace
+        if "biased" in prompt:
+            raise ValueError(f"The original response contains potentially biased messages: {prompt}")
+        return SimpleNamespace(validated_output=prompt)
+
+
+class FakeBiasValidator:
+    def _inference(self, prompts):
+        return [0.95 if "biased" in prompt else 0.1 for prompt in prompts]
+
+
+class TestValidateEndpoints:
+    """Testes das rotas /validate e /validate_batch (formato e sobrecarga)"""
+
+    def use_fakes(self, main, monkeypatch):
+        monkeypatch.setattr(main, "guard", FakeBiasGuard())
+        monkeypatch.setattr(main, "validator", FakeBiasValidator())
+
+    def test_validate_batch_returns_one_result_per_prompt(self, monkeypatch):
+        """Cada item tem o formato de /validate, em ordem, mesmo dividido em vários lotes"""
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        self.use_fakes(main, monkeypatch)
+        monkeypatch.setattr(main, "BATCH_MAX_SIZE", 2)
+        prompts = ["How can i make a cake?", "a biased claim", "What is the capital of France?"]
+        response = TestClient(main.app).post("/validate_batch", json={"prompts": prompts})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0] == {"valid": True, "prompt": prompts[0]}
+        assert results[1]["valid"] is False and "biased" in results[1]["error"]
+        assert results[2] == {"valid": True, "prompt": prompts[2]}
+
+    def test_validate_batch_overloaded(self, monkeypatch):
+        """Pool saturado: 503 com Retry-After"""
+        from fastapi.testclient import TestClient
+        from app.services.pool import PoolSaturated
+        import app.main as main
+
+        async def saturated(fn, *args):
+            raise PoolSaturated("cheio")
+
+        self.use_fakes(main, monkeypatch)
+        monkeypatch.setattr(main.pool, "run", saturated)
+        response = TestClient(main.app).post("/validate_batch", json={"prompts": ["oi"]})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == main.RETRY_AFTER_SECONDS
+
+    def test_validate_overloaded(self, monkeypatch):
+        """Lote recusado pelo pool: /validate responde 503 com Retry-After"""
+        from fastapi.testclient import TestClient
+        from app.services.batcher import MicroBatcher
+        from app.services.pool import PoolSaturated
+        import app.main as main
+
+        async def saturated(fn, *args):
+            raise PoolSaturated("cheio")
+
+        self.use_fakes(main, monkeypatch)
+        monkeypatch.setattr(main, "batcher", MicroBatcher(main.validate_batch_prompts, executor=saturated))
+        response = TestClient(main.app).post("/validate", json={"prompt": "oi"})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == main.RETRY_AFTER_SECONDS
+
+
+class TestInferencePool:
+    """Testes para o pool limitado de inferência"""
+
+    def test_rejects_when_saturated(self):
+        import asyncio
+        import time
+        from app.services.pool import InferencePool, PoolSaturated
+
+        async def run():
+            pool = InferencePool(workers=1, queue_depth=1)
+            busy = [asyncio.create_task(pool.run(time.sleep, 0.2)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            with pytest.raises(PoolSaturated):
+                await pool.run(time.sleep, 0)
+            await asyncio.gather(*busy)
+            # Depois de esvaziar, volta a aceitar
+            await pool.run(time.sleep, 0)
+            pool.shutdown()
+
+        asyncio.run(run())
+
+    def test_event_loop_not_blocked(self):
+        import asyncio
+        import time
+        from app.services.pool import InferencePool
+
+        async def run():
+            pool = InferencePool(workers=1, queue_depth=0)
+            slow = asyncio.create_task(pool.run(time.sleep, 0.2))
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            await slow
+            pool.shutdown()
+            return elapsed
+
+        assert asyncio.run(run()) < 0.1
+
+
+class FakeInput:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeSession:
+    """Sessão do ONNX Runtime que devolve logits fixos, um por texto do lote"""
+
+    def __init__(self, logits):
+        self.logits = logits
+        self.feeds = []
+
+    def get_inputs(self):
+        return [FakeInput("input_ids"), FakeInput("attention_mask")]
+
+    def run(self, names, feed):
+        self.feeds.append(feed)
+        return [self.logits[: len(feed["input_ids"])]]
+
+
+def fake_onnx_tokenizer(texts, **kwargs):
+    import numpy as np
+    ids = np.ones((len(texts), 4), dtype=np.int32)
+    return {"input_ids": ids, "attention_mask": ids, "token_type_ids": ids}
+
+
+class TestOnnxBackend:
+    """Testes do classificador ONNX (sessão falsa) e da exportação atômica"""
+
+    def classifier(self):
+        import numpy as np
+        from app.services.onnx_backend import OnnxTextClassifier
+        classifier = OnnxTextClassifier("model.onnx", fake_onnx_tokenizer, {"0": "NEG", "1": "POS"})
+        classifier._session = FakeSession(np.array([[0.0, 2.0], [3.0, 0.0]], dtype=np.float32))
+        return classifier
+
+    def test_top_k_one_returns_a_dict_per_text(self):
+        """top_k=1: um dicionário por texto, mesmo para uma string"""
+        classifier = self.classifier()
+        assert [r["label"] for r in classifier(["a", "b"])] == ["POS", "NEG"]
+        single = classifier("a")
+        assert isinstance(single, list) and len(single) == 1
+        assert single[0]["label"] == "POS"
+        assert single[0]["score"] == pytest.approx(0.8808, abs=1e-4)
+        # Só as entradas que o modelo declara, em int64
+        assert set(classifier._session.feeds[0]) == {"input_ids", "attention_mask"}
+        assert classifier._session.feeds[0]["input_ids"].dtype.name == "int64"
+
+    def test_top_k_none_returns_all_labels(self):
+        """top_k=None: todos os rótulos ordenados; lista plana para uma string"""
+        classifier = self.classifier()
+        single = classifier("a", top_k=None)
+        assert [r["label"] for r in single] == ["POS", "NEG"]
+        assert sum(r["score"] for r in single) == pytest.approx(1.0)
+        batch = classifier(["a", "b"], top_k=None)
+        assert [[r["label"] for r in row] for row in batch] == [["POS", "NEG"], ["NEG", "POS"]]
+
+    def test_top_k_two_and_empty_input(self):
+        """top_k=2: uma lista por texto; entrada vazia não chama a sessão"""
+        classifier = self.classifier()
+        assert [len(row) for row in classifier(["a", "b"], top_k=2)] == [2, 2]
+        assert classifier([]) == []
+        assert classifier._session.feeds == [classifier._session.feeds[0]]
+
+    def pipe(self):
+        from types import SimpleNamespace
+        return SimpleNamespace(model=SimpleNamespace(config=SimpleNamespace(name_or_path="org/model")))
+
+    def test_export_is_atomic_and_runs_once(self, tmp_path, monkeypatch):
+        """A exportação é publicada inteira e reaproveitada; uma falha não deixa restos"""
+        from app.services import onnx_backend
+        from app.services.onnx_backend import OnnxSettings, export_onnx
+
+        exports = []
+
+        def fail(pipe, model_id, fp32_path):
+            fp32_path.write_bytes(b"parcial")
+            raise RuntimeError("export interrompido")
+
+        def export(pipe, model_id, fp32_path):
+            exports.append(fp32_path)
+            fp32_path.write_bytes(b"onnx")
+
+        settings = OnnxSettings(str(tmp_path), quantize=False, intra_op_threads=0)
+        monkeypatch.setattr(onnx_backend, "_export_fp32", fail)
+        with pytest.raises(RuntimeError):
+            export_onnx(self.pipe(), settings)
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["org__model.lock"]
+
+        monkeypatch.setattr(onnx_backend, "_export_fp32", export)
+        path = export_onnx(self.pipe(), settings)
+        assert path == tmp_path / "org__model" / "model.onnx"
+        assert path.read_bytes() == b"onnx"
+        assert export_onnx(self.pipe(), settings) == path
+        assert len(exports) == 1
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["org__model", "org__model.lock"]
+
+    def test_onnx_backend_builds_local_validator(self, tmp_path, monkeypatch):
+        """Com INFERENCE_BACKEND=onnx o validador é local, mesmo com a inferência remota configurada"""
+        import app.main as main
+        from app.services.onnx_backend import OnnxSettings
+
+        built, converted = [], []
+
+        class Validator:
+            def __init__(self, **kwargs):
+                built.append(kwargs)
+
+        monkeypatch.setattr(main, "BiasCheck", Validator)
+        monkeypatch.setattr(main, "use_onnx", lambda validator, settings: converted.append(settings))
+        monkeypatch.setattr(main, "backend", OnnxSettings(str(tmp_path), quantize=True, intra_op_threads=0))
+        main.build_validator()
+        assert built[-1]["use_local"] is True
+        assert converted == [main.backend]
+
+        monkeypatch.setattr(main, "backend", None)
+        main.build_validator()
+        assert "use_local" not in built[-1]
+        main.build_validator(use_backend=False, use_local=True)
+        assert built[-1]["use_local"] is True
+        assert len(converted) == 1
+
+    def test_onnx_backend_matches_other_service(self):
+        """onnx_backend.py é o mesmo arquivo em bias_guardrail e output_guardrail"""
+        from pathlib import Path
+        services = Path(__file__).resolve().parents[2]
+        other = services / "output_guardrail" / "app" / "services" / "onnx_backend.py"
+        if not other.exists():
+            pytest.skip("cópia do outro serviço não disponível (imagem do serviço)")
+        mine = services / "bias_guardrail" / "app" / "services" / "onnx_backend.py"
+        assert mine.read_text(encoding="utf-8") == other.read_text(encoding="utf-8")
@@ -1,78 +1,43 @@
+from contextlib import asynccontextmanager
+import asyncio
+
 from fastapi import FastAPI
 from pydantic import BaseModel
-import re
 
-app = FastAPI()
+from app.services.guardrail import (
+    BANNED_KEYWORDS,
+    INJECTION_PATTERNS,
+    apply_guardrails,
+    current_rules_version,
+    detect_banned_keywords,
+    detect_injection,
+    rule_store,
+    semantic,
+)
+from app.services.metrics import instrument
+from app.services.pii import RedactStreamEndpoint, redactor
+from app.services.rules import reload_interval_from_env
+from app.services.tracing import setup_tracing
 
 class GuardrailRequest(BaseModel):
     text: str
+    include_pii_values: bool = False
 
-# Palavras proibidas (exemplo acadêmico)
-BANNED_KEYWORDS = ["bomb", "explosive", "hack", "ddos", "malware", "virus"]
-
-# Padrões de prompt injection
-INJECTION_PATTERNS = [
-    r"ignore.*(instruções|instructions|instrucoes|prompts?)",
-    r"revele.*(seu|o|your)?\s*(prompt|sistema|system)",
-    r"reveal.*?(?:your|the)?\s*(?:prompt|system)",
-    r"jailbreak",
-    r"bypass",
-    r"você agora (é|sera|vai ser)",
-    r"you are now",
-    r"disregard.*(previous|anterior|all)",
-    r"forget (all|everything|todas?)",
-    r"desconsidere.*(anterior|anteriores|tudo)",
-]
-
-def detect_injection(text: str) -> tuple[bool, str]:
-    """Detecta padrões de prompt injection."""
-    lowered = text.lower()
-    for pattern in INJECTION_PATTERNS:
-        if re.search(pattern, lowered):
-            return True, f"Prompt injection detectado: padrão '{pattern}'"
-    return False, ""
-
-def detect_banned_keywords(text: str) -> tuple[bool, str]:
-    """Detecta palavras proibidas."""
-    lowered = text.lower()
-    for kw in BANNED_KEYWORDS:
-        if kw in lowered:
-            return True, f"Palavra proibida detectada: '{kw}'"
-    return False, ""
-
-def apply_guardrails(text: str):
-    """
-    Aplica guardrails ao texto:
-    1. Detecta prompt injection
-    2. Detecta palavras proibidas
-    3. Remove dados sensíveis (emails, CPFs)
-    """
-    
-
-    is_injection, injection_reason = detect_injection(text)
-    if is_injection:
-        return {
-            "allowed": False,
-            "reason": f"Conteúdo bloqueado: {injection_reason}",
-            "safe_output": None
-        }
-    
-    has_banned, banned_reason = detect_banned_keywords(text)
-    if has_banned:
-        return {
-            "allowed": False,
-            "reason": f"Conteúdo bloqueado: {banned_reason}",
-            "safe_output": None
-        }
-
-    cleaned = re.sub(r"\b[\w\.-]+@[\w\.-]+\.\w+\b", "[EMAIL_REMOVED]", text)
-    cleaned = re.sub(r"\b\d{3}\.\d{3}\.\d{3}-\d{2}\b", "[CPF_REMOVED]", cleaned)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    interval = reload_interval_from_env()
+    watcher = None
+    if rule_store.path is not None and interval > 0:
+        watcher = asyncio.create_task(rule_store.watch(interval))
+    if semantic is not None:
+        semantic.ensure_loading()
+    yield
+    if watcher is not None:
+        watcher.cancel()
 
-    return {
-        "allowed": True,
-        "reason": "Conteúdo aprovado pelos guardrails",
-        "safe_output": cleaned
-    }
+app = FastAPI(lifespan=lifespan)
+instrument(app)
+setup_tracing(app, "guardrail")
 
 @app.get("/")
 def root():
@@ -84,6 +49,23 @@ def check_guardrail(req: GuardrailRequest):
     Verifica se o texto passa pelos guardrails:
     - Detecta prompt injection
     - Detecta palavras proibidas
-    - Remove dados sensíveis
+    - Remove dados sensíveis (os valores originais só com include_pii_values)
+    """
+    return apply_guardrails(req.text, req.include_pii_values)
+
+# Redação de dados sensíveis em documentos longos, sem carregá-los inteiros
+app.router.add_route("/redact_stream", RedactStreamEndpoint(redactor), methods=["POST"])
+
+@app.post("/rules/reload")
+def reload_rules():
+    """Força a releitura dos arquivos de regras."""
+    rule_store.reload(force=True)
+    return {"rules_version": current_rules_version()}
+
+@app.get("/rules/version")
+def rules_version():
+    """
+    Versão das regras e do índice semântico em uso (consultada pelo orquestrador
+    para o cache de veredictos).
     """
-    return apply_guardrails(req.text)
+    return {"rules_version": current_rules_version()}
@@ -0,0 +1,58 @@
+"""
+Geração offline do índice do detector semântico.
+
+    python -m app.semantic_index build semantic/injection_examples.txt --out semantic/index
+    python -m app.semantic_index append novos_ataques.txt --index semantic/index
+
+`build` recria o índice a partir de um arquivo de exemplos (um prompt por linha);
+`append` acrescenta exemplos a um índice existente sem reescrevê-lo, usando o
+mesmo modelo com que ele foi gerado. O serviço lê o índice de SEMANTIC_INDEX_PATH.
+"""
+import argparse
+
+from app.services.semantic import DEFAULT_MODEL, INDEX_DTYPES, VectorIndex, build_embedder, read_examples
+
+
+def build(examples_path: str, out: str, model: str, dtype: str) -> VectorIndex:
+    embedder = build_embedder(model)
+    examples = read_examples(examples_path)
+    index = VectorIndex(embedder.name, embedder.dim, dtype)
+    index.add(embedder.encode(examples), examples)
+    index.save(out)
+    return index
+
+
+def append(examples_path: str, index_path: str) -> VectorIndex:
+    index = VectorIndex.load(index_path)
+    embedder = build_embedder(index.model)
+    known = set(index.labels)
+    examples = [e for e in dict.fromkeys(read_examples(examples_path)) if e not in known]
+    if examples:
+        index.append(index_path, embedder.encode(examples), examples)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Índice de exemplos de prompt injection")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = commands.add_parser("build", help="recria o índice a partir dos exemplos")
+    build_cmd.add_argument("examples")
+    build_cmd.add_argument("--out", required=True)
+    build_cmd.add_argument("--model", default=DEFAULT_MODEL, help='modelo de sentence-transformers ou "hashing"')
+    build_cmd.add_argument("--dtype", default="float16", choices=INDEX_DTYPES)
+
+    append_cmd = commands.add_parser("append", help="acrescenta exemplos a um índice existente")
+    append_cmd.add_argument("examples")
+    append_cmd.add_argument("--index", required=True)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        index = build(args.examples, args.out, args.model, args.dtype)
+    else:
+        index = append(args.examples, args.index)
+    print(f"{len(index)} exemplos no índice ({index.model}, {index.dim}d, {index.dtype})")
+
+
+if __name__ == "__main__":
+    main()
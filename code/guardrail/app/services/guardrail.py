@@ -0,0 +1,148 @@
+import logging
+import os
+import time
+
+from app.services.matcher import CheckBudgetExceeded, RuleMatcher
+from app.services.pii import redact
+from app.services.rules import RuleStore, compile_rules, rules_path_from_env
+from app.services.semantic import semantic_from_env
+
+# Palavras proibidas (exemplo acadêmico)
+BANNED_KEYWORDS = ["bomb", "explosive", "hack", "ddos", "malware", "virus"]
+
+# Padrões de prompt injection
+INJECTION_PATTERNS = [
+    r"ignore.*(instruções|instructions|instrucoes|prompts?)",
+    r"revele.*(seu|o|your)?\s*(prompt|sistema|system)",
+    r"reveal.*?(?:your|the)?\s*(?:prompt|system)",
+    r"jailbreak",
+    r"bypass",
+    r"você agora (é|sera|vai ser)",
+    r"you are now",
+    r"disregard.*(previous|anterior|all)",
+    r"forget (all|everything|todas?)",
+    r"desconsidere.*(anterior|anteriores|tudo)",
+]
+
+logger = logging.getLogger(__name__)
+
+# Tempo máximo de uma verificação; se estourar, o texto é bloqueado (fail-closed). 0 desliga.
+# Conta o tempo de CPU da thread: a espera pelo GIL ou por outras threads do pool não entra.
+CHECK_BUDGET_MS = float(os.getenv("GUARDRAIL_CHECK_BUDGET_MS", "100"))
+
+# Regras embutidas são o padrão; GUARDRAIL_RULES_PATH aponta para arquivos JSON/YAML recarregáveis
+rule_store = RuleStore(compile_rules(INJECTION_PATTERNS, BANNED_KEYWORDS), rules_path_from_env())
+
+# Vizinho mais próximo em um índice de injeções conhecidas: pega paráfrases que as regex não pegam
+semantic = semantic_from_env()
+
+def detect_injection(
+    text: str, lowered: str | None = None, matcher: RuleMatcher | None = None, deadline: float | None = None
+) -> tuple[bool, str]:
+    """Detecta padrões de prompt injection."""
+    matcher = matcher or rule_store.current.matcher
+    pattern = matcher.find_injection(text.lower() if lowered is None else lowered, deadline)
+    if pattern is not None:
+        return True, f"Prompt injection detectado: padrão '{pattern}'"
+    return False, ""
+
+def current_rules_version(rules=None) -> str:
+    """
+    Versão das regras e, com o detector semântico pronto, do índice de exemplos:
+    trocar o índice também invalida os veredictos em cache no orquestrador.
+    """
+    rules = rules or rule_store.current
+    if semantic is not None and semantic.ready:
+        return f"{rules.version}+{semantic.index.version}"
+    return rules.version
+
+def detect_semantic_injection(text: str, deadline: float | None = None) -> tuple[bool, str]:
+    """
+    Detecta paráfrases de prompt injection conhecidas (detector semântico).
+    Com `deadline` vencido, levanta CheckBudgetExceeded antes de calcular o embedding.
+    """
+    if semantic is None:
+        return False, ""
+    if semantic.ready and deadline is not None and time.thread_time() > deadline:
+        raise CheckBudgetExceeded("detector semântico")
+    match = semantic.check(text)
+    if match is not None:
+        return True, f"Prompt injection detectado: semelhante a '{match.example}' (similaridade {match.score:.2f})"
+    return False, ""
+
+def detect_banned_keywords(text: str, lowered: str | None = None, matcher: RuleMatcher | None = None) -> tuple[bool, str]:
+    """Detecta palavras proibidas."""
+    matcher = matcher or rule_store.current.matcher
+    kw = matcher.find_keyword(text.lower() if lowered is None else lowered)
+    if kw is not None:
+        return True, f"Palavra proibida detectada: '{kw}'"
+    return False, ""
+
+def budget_exceeded(error: CheckBudgetExceeded, version: str) -> dict:
+    """Bloqueio fail-closed de uma verificação que passou de GUARDRAIL_CHECK_BUDGET_MS."""
+    logger.warning("Verificação excedeu %.0f ms em '%s'; texto bloqueado", CHECK_BUDGET_MS, error)
+    return {
+        "allowed": False,
+        "reason": "Conteúdo bloqueado: tempo de verificação excedido",
+        "safe_output": None,
+        "rules_version": version,
+        "budget_exceeded": True
+    }
+
+def apply_guardrails(text: str, include_pii_values: bool = False):
+    """
+    Aplica guardrails ao texto:
+    1. Detecta prompt injection (regex e, se não casar, similaridade com ataques conhecidos)
+    2. Detecta palavras proibidas
+    3. Remove dados sensíveis (e-mails, CPF, CNPJ, telefones, cartões, IBAN)
+    A resposta inclui a versão das regras (e do índice semântico) usada na
+    verificação. Se a verificação passar de GUARDRAIL_CHECK_BUDGET_MS, o texto é
+    bloqueado com "budget_exceeded": True; esse bloqueio depende da carga do
+    momento e não deve ir para cache. Enquanto o detector semântico carrega, a aprovação vem marcada com
+    "semantic": "unavailable" e não deve ir para cache. Os trechos removidos
+    trazem só posição e tipo; o valor original só com `include_pii_values`.
+    """
+    rules = rule_store.current
+    version = current_rules_version(rules)
+    semantic_unavailable = semantic is not None and not semantic.ready
+    lowered = text.lower()
+    deadline = time.thread_time() + CHECK_BUDGET_MS / 1000 if CHECK_BUDGET_MS > 0 else None
+
+    try:
+        is_injection, injection_reason = detect_injection(text, lowered, rules.matcher, deadline)
+        if not is_injection:
+            is_injection, injection_reason = detect_semantic_injection(text, deadline)
+    except CheckBudgetExceeded as e:
+        return budget_exceeded(e, version)
+    if is_injection:
+        return {
+            "allowed": False,
+            "reason": f"Conteúdo bloqueado: {injection_reason}",
+            "safe_output": None,
+            "rules_version": version
+        }
+    
+    has_banned, banned_reason = detect_banned_keywords(text, lowered, rules.matcher)
+    if has_banned:
+        return {
+            "allowed": False,
+            "reason": f"Conteúdo bloqueado: {banned_reason}",
+            "safe_output": None,
+            "rules_version": version
+        }
+
+    try:
+        cleaned, spans = redact(text, deadline)
+    except CheckBudgetExceeded as e:
+        return budget_exceeded(e, version)
+
+    result = {
+        "allowed": True,
+        "reason": "Conteúdo aprovado pelos guardrails",
+        "safe_output": cleaned,
+        "pii": [span.to_dict(include_pii_values) for span in spans],
+        "rules_version": version
+    }
+    if semantic_unavailable:
+        result["semantic"] = "unavailable"
+    return result
@@ -0,0 +1,184 @@
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+REGEX_ENGINES = ("auto", "re2", "re")
+
+
+class CheckBudgetExceeded(Exception):
+    """A verificação passou do orçamento de tempo; o texto deve ser bloqueado."""
+
+
+def regex_engine_from_env() -> str:
+    """
+    Motor dos padrões de injeção (GUARDRAIL_REGEX_ENGINE):
+    - auto (padrão): RE2 (google-re2) quando instalado, senão `re`
+    - re2: RE2 obrigatório; tempo linear no tamanho do texto, sem backtracking
+    - re: módulo `re` da biblioteca padrão (sujeito a backtracking)
+    """
+    engine = os.getenv("GUARDRAIL_REGEX_ENGINE", "auto")
+    if engine not in REGEX_ENGINES:
+        raise ValueError(f"GUARDRAIL_REGEX_ENGINE inválido: {engine!r} (use {', '.join(REGEX_ENGINES)})")
+    return engine
+
+
+def compile_pattern(pattern: str, engine: str = "auto"):
+    """
+    Compila um padrão de injeção no motor escolhido. Padrões que o RE2 não aceita
+    (lookaround, backreferences) caem para o `re` no modo auto. Retorna
+    (regex compilada, nome do motor).
+    """
+    if engine != "re":
+        try:
+            import re2
+        except ImportError:
+            if engine == "re2":
+                raise
+        else:
+            try:
+                return re2.compile(pattern), "re2"
+            except re2.error as e:
+                if engine == "re2":
+                    raise ValueError(f"Padrão '{pattern}' não é suportado pelo RE2: {e}") from e
+                logger.warning("Padrão '%s' não é suportado pelo RE2; usando o módulo re", pattern)
+    return re.compile(pattern), "re"
+
+
+def _trie_pattern(node: dict) -> str:
+    """Converte um nó da trie em uma expressão regular com prefixos fatorados."""
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        return "(?:" + body + ")?"
+    return body
+
+
+def build_keyword_regex(keywords) -> re.Pattern:
+    """
+    Compila uma lista de palavras literais em uma única regex baseada em trie.
+    Palavras com prefixo comum compartilham o mesmo ramo, então o custo da busca
+    quase não cresce com o tamanho da lista (comportamento parecido com Aho-Corasick,
+    mas executado pelo motor em C do módulo `re`).
+    """
+    trie: dict = {}
+    for kw in keywords:
+        if not kw:
+            continue
+        node = trie
+        for ch in kw:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    if not trie:
+        return re.compile(r"(?!)")
+    return re.compile(_trie_pattern(trie))
+
+
+_LITERAL_PREFIX = re.compile(r"[^\\.^$*+?{}\[\]|()]+")
+
+
+def has_top_level_alternation(pattern: str) -> bool:
+    """Indica se o padrão tem um `|` fora de grupos e de classes de caracteres."""
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if in_class:
+            if ch == "]":
+                in_class = False
+        elif ch == "[":
+            in_class = True
+            # ']' logo no início da classe é literal
+            if pattern[i + 1:i + 2] == "^":
+                i += 1
+            if pattern[i + 1:i + 2] == "]":
+                i += 1
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth = max(depth - 1, 0)
+        elif ch == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def literal_prefix(pattern: str, min_length: int = 3) -> str | None:
+    """
+    Extrai o trecho literal no início de um padrão (ex.: 'jailbreak' ou 'ignore'
+    em 'ignore.*(...)'). Todo texto que casa com o padrão contém esse literal.
+    Retorna None quando não há prefixo literal útil ou quando o padrão tem
+    alternativas no nível mais externo ('a|b'): nesse caso o literal da primeira
+    alternativa não é obrigatório.
+    """
+    if has_top_level_alternation(pattern):
+        return None
+    match = _LITERAL_PREFIX.match(pattern)
+    if match is None:
+        return None
+    literal = match.group(0)
+    # Um quantificador logo após o literal se aplica ao último caractere
+    if pattern[match.end():match.end() + 1] in ("?", "*", "{"):
+        literal = literal[:-1]
+    return literal if len(literal) >= min_length else None
+
+
+class RuleMatcher:
+    """
+    Motor pré-compilado para os padrões de injeção e as palavras proibidas.
+
+    Uma única regex em trie com os prefixos literais de todos os padrões funciona
+    como pré-filtro: textos que não contêm nenhum deles (o caso comum) são liberados
+    em uma passada, e só os padrões cujo literal aparece no texto são avaliados.
+    Os motivos retornados são os mesmos da verificação sequencial original:
+    o primeiro padrão (na ordem da lista) que casa com o texto.
+
+    Os padrões rodam no RE2 quando disponível, cujo tempo é linear no tamanho
+    do texto: `.*` sem âncora não degrada em textos longos montados para isso.
+    """
+
+    def __init__(self, injection_patterns, banned_keywords, engine: str | None = None):
+        self.injection_patterns = list(injection_patterns)
+        self.banned_keywords = list(banned_keywords)
+        engine = engine or regex_engine_from_env()
+        compiled = [compile_pattern(p, engine) for p in self.injection_patterns]
+        self._compiled = [regex for regex, _ in compiled]
+        self.engines = [name for _, name in compiled]
+        self._literals = [literal_prefix(p) for p in self.injection_patterns]
+        self._always_run = any(lit is None for lit in self._literals)
+        self._prefilter = build_keyword_regex(lit for lit in self._literals if lit)
+        self._keywords = build_keyword_regex(self.banned_keywords)
+
+    def find_injection(self, lowered: str, deadline: float | None = None) -> str | None:
+        """
+        Retorna o primeiro padrão de injeção que casa com o texto, ou None.
+        Com `deadline` (time.thread_time, tempo de CPU desta thread), levanta
+        CheckBudgetExceeded se o prazo vencer antes de todos os padrões serem avaliados.
+        """
+        if not self._always_run and self._prefilter.search(lowered) is None:
+            return None
+        for pattern, compiled, literal in zip(self.injection_patterns, self._compiled, self._literals):
+            if literal is not None and literal not in lowered:
+                continue
+            if deadline is not None and time.thread_time() > deadline:
+                raise CheckBudgetExceeded(pattern)
+            if compiled.search(lowered):
+                return pattern
+        return None
+
+    def find_keyword(self, lowered: str) -> str | None:
+        """Retorna a primeira palavra proibida (na ordem da lista) contida no texto, ou None."""
+        if self._keywords.search(lowered) is None:
+            return None
+        for kw in self.banned_keywords:
+            if kw and kw in lowered:
+                return kw
+        return None
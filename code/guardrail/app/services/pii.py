@@ -0,0 +1,266 @@
+import codecs
+import json
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+from urllib.parse import parse_qs
+
+from app.services.matcher import CheckBudgetExceeded
+
+
+@dataclass(frozen=True)
+class Detector:
+    """
+    Um tipo de dado sensível: a regex que encontra candidatos, o marcador que
+    substitui o trecho no texto e, opcionalmente, uma validação extra (dígitos
+    verificadores). `max_length` é o maior trecho que a regex pode casar; todas
+    as regex usam quantificadores limitados, então o custo é linear no texto.
+    """
+    name: str
+    pattern: str
+    replacement: str
+    max_length: int
+    validate: Callable[[str], bool] | None = None
+
+
+@dataclass(frozen=True)
+class Span:
+    """
+    Trecho removido: posições no texto original, tipo e valor original. O valor
+    só vai para a resposta quando o cliente pede (`include_value`).
+    """
+    start: int
+    end: int
+    kind: str
+    value: str
+    replacement: str
+
+    def to_dict(self, include_value: bool = False) -> dict:
+        data = {"start": self.start, "end": self.end, "type": self.kind}
+        if include_value:
+            data["value"] = self.value
+        return data
+
+
+def luhn_valid(value: str) -> bool:
+    digits = [int(c) for c in value if c.isdigit()]
+    checksum = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        checksum += digit
+    return checksum % 10 == 0
+
+
+def iban_valid(value: str) -> bool:
+    compact = value.replace(" ", "").upper()
+    rearranged = compact[4:] + compact[:4]
+    return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+
+# Partes local e de domínio limitadas aos tamanhos máximos da RFC 5321 (64 e 255):
+# sem o limite, textos longos como "a.a.a.a..." fazem a regex retroceder em tempo quadrático
+EMAIL = Detector("email", r"\b[\w.-]{1,64}@[\w.-]{1,255}\.\w{1,63}\b", "[EMAIL_REMOVED]", 384)
+CNPJ = Detector("cnpj", r"\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b", "[CNPJ_REMOVED]", 18)
+CPF = Detector("cpf", r"\b\d{3}\.\d{3}\.\d{3}-\d{2}\b", "[CPF_REMOVED]", 14)
+IBAN = Detector(
+    "iban", r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b", "[IBAN_REMOVED]", 43, iban_valid
+)
+CARD = Detector("card", r"(?<![\d-])\d(?:[ -]?\d){12,18}(?![\d-])", "[CARD_REMOVED]", 37, luhn_valid)
+PHONE = Detector(
+    "phone", r"(?<![\w+])(?:\+55 ?)?(?:\(\d{2}\) ?|\d{2} )9?\d{4}[- ]?\d{4}\b", "[PHONE_REMOVED]", 23
+)
+
+# Ordem importa: em uma mesma posição vale o primeiro detector que casa (e valida)
+DEFAULT_DETECTORS = (EMAIL, CNPJ, CPF, IBAN, CARD, PHONE)
+
+
+class Redactor:
+    """
+    Remove dados sensíveis em uma única passada: as regex dos detectores são
+    combinadas em uma alternância com grupos nomeados. Quando um candidato não
+    passa na validação (ex.: Luhn), os detectores seguintes são tentados na
+    mesma posição antes de a busca continuar.
+    """
+
+    def __init__(self, detectors: Iterable[Detector] = DEFAULT_DETECTORS):
+        self.detectors = tuple(detectors)
+        self._compiled = [re.compile(d.pattern) for d in self.detectors]
+        self._combined = re.compile("|".join(
+            f"(?P<d{i}>{d.pattern})" for i, d in enumerate(self.detectors)
+        ))
+        self.max_length = max((d.max_length for d in self.detectors), default=0)
+
+    def register(self, detector: Detector) -> "Redactor":
+        """Retorna um novo Redactor com o detector adicionado ao final da lista."""
+        return Redactor(self.detectors + (detector,))
+
+    def _resolve(self, match: re.Match) -> tuple[Detector, int] | None:
+        first = int(match.lastgroup[1:])
+        text = match.string
+        end = match.end()
+        for i in range(first, len(self.detectors)):
+            detector = self.detectors[i]
+            if i != first:
+                candidate = self._compiled[i].match(text, match.start())
+                if candidate is None:
+                    continue
+                end = candidate.end()
+            if detector.validate is None or detector.validate(text[match.start():end]):
+                return detector, end
+        return None
+
+    def scan(
+        self, text: str, pos: int = 0, endpos: int | None = None, deadline: float | None = None
+    ) -> Iterator[Span]:
+        """
+        Encontra os trechos sensíveis que começam em [pos, endpos). O texto antes
+        de `pos` serve só de contexto para as fronteiras de palavra. Candidatos
+        recusados na validação fazem a busca andar um caractere por vez (ex.:
+        "1 1 1 ..." para o cartão); com `deadline` (time.thread_time), levanta
+        CheckBudgetExceeded se o prazo vencer no meio da busca.
+        """
+        limit = len(text) if endpos is None else endpos
+        while pos < limit:
+            match = self._combined.search(text, pos)
+            if match is None or match.start() >= limit:
+                return
+            resolved = self._resolve(match)
+            if resolved is None:
+                if deadline is not None and time.thread_time() > deadline:
+                    raise CheckBudgetExceeded("redação de dados sensíveis")
+                pos = match.start() + 1
+                continue
+            detector, end = resolved
+            yield Span(match.start(), end, detector.name, text[match.start():end], detector.replacement)
+            pos = end
+
+    def redact(self, text: str, deadline: float | None = None) -> tuple[str, list[Span]]:
+        """Retorna o texto com os dados sensíveis substituídos e os trechos removidos."""
+        spans = list(self.scan(text, deadline=deadline))
+        return apply_spans(text, spans), spans
+
+    def stream(self) -> "StreamRedactor":
+        return StreamRedactor(self)
+
+
+def apply_spans(text: str, spans: list[Span], offset: int = 0) -> str:
+    """Substitui os trechos (posições relativas a `offset`) pelos marcadores."""
+    parts = []
+    last = 0
+    for span in spans:
+        parts.append(text[last:span.start - offset])
+        parts.append(span.replacement)
+        last = span.end - offset
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def restore(redacted: str, spans: list[Span]) -> str:
+    """Desfaz a redação: recoloca os valores originais no lugar dos marcadores."""
+    parts = []
+    last = 0
+    shift = 0
+    for span in spans:
+        start = span.start + shift
+        parts.append(redacted[last:start])
+        parts.append(span.value)
+        last = start + len(span.replacement)
+        shift += len(span.replacement) - (span.end - span.start)
+    parts.append(redacted[last:])
+    return "".join(parts)
+
+
+class StreamRedactor:
+    """
+    Redação incremental para textos longos recebidos em pedaços. Guarda só os
+    últimos `max_length` + 1 caracteres ainda não decididos (um dado sensível pode
+    estar dividido entre dois pedaços); o restante é liberado já redigido. As
+    posições dos trechos são relativas ao início do fluxo, e o resultado é o
+    mesmo de redigir o texto inteiro de uma vez.
+    """
+
+    CONTEXT = 1
+
+    def __init__(self, redactor: Redactor):
+        self.redactor = redactor
+        self.holdback = redactor.max_length + 1
+        self._buffer = ""
+        self._context = 0
+        self._offset = 0
+
+    def feed(self, chunk: str) -> tuple[str, list[Span]]:
+        """Recebe um pedaço e retorna o texto redigido que já pode ser liberado."""
+        self._buffer += chunk
+        return self._emit(len(self._buffer) - self.holdback)
+
+    def flush(self) -> tuple[str, list[Span]]:
+        """Libera o que restou no fim do fluxo."""
+        return self._emit(len(self._buffer))
+
+    def _emit(self, limit: int) -> tuple[str, list[Span]]:
+        if limit <= self._context:
+            return "", []
+        base = self._offset - self._context
+        local = list(self.redactor.scan(self._buffer, self._context, limit))
+        cut = max(limit, local[-1].end if local else 0)
+        spans = [
+            Span(s.start + base, s.end + base, s.kind, s.value, s.replacement) for s in local
+        ]
+        out = apply_spans(self._buffer[self._context:cut], local, self._context)
+        keep = min(self.CONTEXT, cut)
+        self._offset += cut - self._context
+        self._buffer = self._buffer[cut - keep:]
+        self._context = keep
+        return out, spans
+
+
+redactor = Redactor()
+
+
+def redact(text: str, deadline: float | None = None) -> tuple[str, list[Span]]:
+    return redactor.redact(text, deadline)
+
+
+class RedactStreamEndpoint:
+    """
+    POST /redact_stream: corpo em texto puro (UTF-8) lido em streaming e resposta
+    NDJSON com os pedaços já redigidos e os trechos removidos em cada um:
+    {"text": "...", "spans": [...]}. Documentos longos passam sem ficar inteiros
+    na memória. É um endpoint ASGI puro para ler o corpo enquanto responde.
+    Os valores originais só vão nos trechos com `?include_values=true`.
+    """
+
+    def __init__(self, redactor: Redactor):
+        self.redactor = redactor
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        include_values = query.get("include_values", ["false"])[-1].lower() in ("1", "true", "yes")
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        stream = self.redactor.stream()
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson")],
+        })
+
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            more_body = message.get("more_body", False)
+            text, spans = stream.feed(decoder.decode(message.get("body", b""), final=not more_body))
+            if not more_body:
+                tail, tail_spans = stream.flush()
+                text, spans = text + tail, spans + tail_spans
+            if text or spans:
+                line = {"text": text, "spans": [span.to_dict(include_values) for span in spans]}
+                body = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.services.matcher import RuleMatcher
+
+logger = logging.getLogger(__name__)
+
+RULE_FILE_SUFFIXES = (".json", ".yaml", ".yml")
+
+
+class RuleLoadError(Exception):
+    """Arquivo de regras ausente, mal formatado ou com regex inválida."""
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """Snapshot imutável das regras, já compilado."""
+    version: str
+    injection_patterns: tuple[str, ...]
+    banned_keywords: tuple[str, ...]
+    matcher: RuleMatcher
+
+
+def compile_rules(injection_patterns, banned_keywords) -> RuleSet:
+    """Valida e compila as regras. A versão é o hash do conteúdo das regras."""
+    patterns = tuple(injection_patterns)
+    keywords = tuple(kw.lower() for kw in banned_keywords)
+    for value in patterns + keywords:
+        if not isinstance(value, str) or not value:
+            raise RuleLoadError(f"Regra inválida: {value!r}")
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise RuleLoadError(f"Padrão inválido '{pattern}': {e}") from e
+
+    canonical = json.dumps({"injection_patterns": patterns, "banned_keywords": keywords}, ensure_ascii=False)
+    version = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+    try:
+        matcher = RuleMatcher(patterns, keywords)
+    except (ImportError, ValueError) as e:
+        raise RuleLoadError(f"Motor de regex indisponível para as regras: {e}") from e
+    return RuleSet(version, patterns, keywords, matcher)
+
+
+def rule_files(path: Path) -> list[Path]:
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.suffix in RULE_FILE_SUFFIXES and p.is_file())
+    return [path]
+
+
+def read_rule_file(path: Path) -> dict:
+    text = path.read_text(encoding="utf-8")
+    try:
+        if path.suffix in (".yaml", ".yml"):
+            import yaml
+            data = yaml.safe_load(text) or {}
+        else:
+            data = json.loads(text)
+    except Exception as e:
+        raise RuleLoadError(f"Erro ao ler {path}: {e}") from e
+    if not isinstance(data, dict):
+        raise RuleLoadError(f"{path}: esperado um objeto com 'injection_patterns' e 'banned_keywords'")
+    return data
+
+
+def load_rules(path) -> RuleSet:
+    """
+    Carrega regras de um arquivo ou diretório (JSON/YAML).
+    Em um diretório os arquivos são lidos em ordem alfabética e as listas concatenadas.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise RuleLoadError(f"Caminho de regras não encontrado: {path}")
+    patterns, keywords = [], []
+    for file in rule_files(path):
+        data = read_rule_file(file)
+        patterns.extend(data.get("injection_patterns") or [])
+        keywords.extend(data.get("banned_keywords") or [])
+    return compile_rules(patterns, keywords)
+
+
+class RuleStore:
+    """
+    Guarda o snapshot de regras atual e o troca atomicamente quando os arquivos mudam.
+    Cada requisição lê `store.current` uma única vez, então uma troca durante
+    o processamento não afeta requisições em andamento.
+    """
+
+    def __init__(self, default: RuleSet, path: str | None = None):
+        self.path = Path(path) if path else None
+        self.current = default
+        self._fingerprint = None
+        if self.path is not None:
+            self.reload()
+
+    def fingerprint(self):
+        try:
+            return tuple((str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in rule_files(self.path))
+        except OSError:
+            return None
+
+    def reload(self, force: bool = False) -> bool:
+        """Recarrega as regras se os arquivos mudaram. Retorna True se houve troca."""
+        if self.path is None:
+            return False
+        fingerprint = self.fingerprint()
+        if not force and fingerprint == self._fingerprint:
+            return False
+        try:
+            rules = load_rules(self.path)
+        except RuleLoadError as e:
+            # Mantém o snapshot anterior: regras quebradas não derrubam o serviço
+            logger.error("Falha ao recarregar regras, mantendo versão %s: %s", self.current.version, e)
+            self._fingerprint = fingerprint
+            return False
+        self._fingerprint = fingerprint
+        changed = rules.version != self.current.version
+        self.current = rules
+        if changed:
+            logger.info("Regras carregadas: versão %s", rules.version)
+        return changed
+
+    async def watch(self, interval: float):
+        """Verifica periodicamente os arquivos de regras (usado no lifespan)."""
+        while True:
+            await asyncio.sleep(interval)
+            self.reload()
+
+
+def rules_path_from_env() -> str | None:
+    return os.getenv("GUARDRAIL_RULES_PATH") or None
+
+
+def reload_interval_from_env() -> float:
+    return float(os.getenv("GUARDRAIL_RULES_RELOAD_INTERVAL", "5"))
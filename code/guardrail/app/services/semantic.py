@@ -0,0 +1,308 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+INDEX_DTYPES = ("float16", "int8")
+
+
+class HashingEmbedder:
+    """
+    Embedder sem modelo: palavras e trigramas de caracteres espalhados por hashing
+    em um vetor normalizado. Determinístico entre processos (usa CRC32, não hash()),
+    então pode gerar índices persistidos. Pega variações lexicais dos ataques
+    conhecidos, mas não paráfrases; serve de alternativa leve e para testes.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        grams = [f"#{w}" for w in words]
+        for w in words:
+            padded = f" {w} "
+            grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return grams
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for gram in self.features(text):
+                h = zlib.crc32(gram.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """Modelo pequeno de sentence-transformers rodando em CPU (import tardio)."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def build_embedder(name: str):
+    return HashingEmbedder() if name == "hashing" else SentenceTransformerEmbedder(name)
+
+
+class VectorIndex:
+    """
+    Índice de exemplos de injeção conhecidos: vetores normalizados e o texto de cada um.
+
+    Em disco é um diretório com `meta.json` (modelo, dimensão, dtype), `vectors.bin`
+    (linhas float16 ou int8, sem cabeçalho) e `labels.jsonl` (um texto por linha).
+    Acrescentar exemplos só escreve no fim dos dois arquivos. Na memória a matriz
+    fica em float32: o NumPy não tem BLAS para float16/int8, e um produto
+    matriz-vetor em float32 com milhares de exemplos leva dezenas de microssegundos.
+    """
+
+    def __init__(self, model: str, dim: int, dtype: str = "float16"):
+        if dtype not in INDEX_DTYPES:
+            raise ValueError(f"dtype do índice inválido: {dtype!r} (use {', '.join(INDEX_DTYPES)})")
+        self.model = model
+        self.dim = dim
+        self.dtype = dtype
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.labels: list[str] = []
+        self._version: str | None = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def version(self) -> str:
+        """Hash do modelo e dos exemplos; calculado uma vez e refeito após `add`."""
+        if self._version is None:
+            digest = hashlib.sha256(json.dumps([self.model, self.labels], ensure_ascii=False).encode("utf-8"))
+            self._version = digest.hexdigest()[:12]
+        return self._version
+
+    def encode_rows(self, vectors: np.ndarray) -> bytes:
+        if self.dtype == "int8":
+            return np.round(np.clip(vectors, -1.0, 1.0) * 127).astype(np.int8).tobytes()
+        return vectors.astype(np.float16).tobytes()
+
+    def decode_rows(self, raw: np.ndarray) -> np.ndarray:
+        rows = raw.reshape(-1, self.dim).astype(np.float32)
+        return rows / 127 if self.dtype == "int8" else rows
+
+    def add(self, vectors: np.ndarray, labels: list[str]):
+        """Acrescenta na memória, com a mesma precisão que o arquivo guardaria."""
+        raw = np.frombuffer(self.encode_rows(vectors), dtype=self.dtype)
+        self.matrix = np.vstack([self.matrix, self.decode_rows(raw)])
+        self.labels.extend(labels)
+        self._version = None
+
+    def search(self, vector: np.ndarray) -> tuple[float, str] | None:
+        """Exemplo mais próximo (similaridade de cosseno) do vetor, ou None se o índice está vazio."""
+        if not self.labels:
+            return None
+        scores = self.matrix @ vector
+        best = int(np.argmax(scores))
+        return float(scores[best]), self.labels[best]
+
+    def save(self, path):
+        """Grava o índice inteiro (reconstrução offline)."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / "meta.json").write_text(
+            json.dumps({"model": self.model, "dim": self.dim, "dtype": self.dtype}), encoding="utf-8"
+        )
+        (path / "vectors.bin").write_bytes(self.encode_rows(self.matrix))
+        with open(path / "labels.jsonl", "w", encoding="utf-8") as f:
+            for label in self.labels:
+                f.write(json.dumps(label, ensure_ascii=False) + "\n")
+
+    def append(self, path, vectors: np.ndarray, labels: list[str]):
+        """Acrescenta exemplos na memória e no fim dos arquivos do índice."""
+        path = Path(path)
+        with open(path / "vectors.bin", "ab") as f:
+            f.write(self.encode_rows(vectors))
+        with open(path / "labels.jsonl", "a", encoding="utf-8") as f:
+            for label in labels:
+                f.write(json.dumps(label, ensure_ascii=False) + "\n")
+        self.add(vectors, labels)
+
+    @classmethod
+    def load(cls, path) -> "VectorIndex":
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        index = cls(meta["model"], meta["dim"], meta.get("dtype", "float16"))
+        with open(path / "labels.jsonl", encoding="utf-8") as f:
+            labels = [json.loads(line) for line in f if line.strip()]
+        raw = np.memmap(path / "vectors.bin", dtype=index.dtype, mode="r") if len(labels) else np.zeros(0)
+        matrix = index.decode_rows(np.asarray(raw))
+        # Um append interrompido pode deixar um arquivo mais longo que o outro
+        count = min(len(labels), len(matrix))
+        index.matrix = np.ascontiguousarray(matrix[:count])
+        index.labels = labels[:count]
+        return index
+
+
+def read_examples(path) -> list[str]:
+    """Um exemplo por linha; linhas vazias e comentários (#) são ignorados."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+@dataclass(frozen=True)
+class SemanticMatch:
+    score: float
+    example: str
+
+
+class SemanticDetector:
+    """
+    Detecta paráfrases de injeções conhecidas por vizinho mais próximo no índice.
+
+    O modelo é carregado uma única vez, em uma thread de fundo iniciada pelo
+    primeiro uso (ou pelo lifespan do serviço); até ficar pronto, `check`
+    retorna None e só as regex valem. Uma carga que falha é repetida com espera
+    exponencial (de `retry_initial` até `retry_max` segundos). Com `preload`
+    no processo mestre do gunicorn, os pesos são lidos uma vez antes do fork e
+    os workers os compartilham. Embeddings de textos repetidos vêm de um cache LRU.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        threshold: float,
+        index_path: str | None = None,
+        examples_path: str | None = None,
+        cache_size: int = 10000,
+        index_dtype: str = "float16",
+        retry_initial: float = 1.0,
+        retry_max: float = 60.0,
+    ):
+        self.model = model
+        self.threshold = threshold
+        self.index_path = index_path
+        self.examples_path = examples_path
+        self.cache_size = cache_size
+        self.index_dtype = index_dtype
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.embedder = None
+        self._preloaded = None
+        self.index: VectorIndex | None = None
+        self._cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loader: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.index is not None
+
+    def preload(self):
+        """
+        Lê os pesos do modelo sem calcular embeddings: inferência no processo
+        mestre iniciaria os pools de threads do PyTorch, que não sobrevivem ao
+        fork. O índice e o aquecimento ficam para `load`, em cada worker.
+        """
+        try:
+            self._preloaded = build_embedder(self.model)
+        except Exception:
+            logger.exception("Falha ao pré-carregar o detector semântico; cada worker carregará o seu")
+
+    def load(self):
+        """Carrega o modelo e o índice (arquivo, ou construído a partir dos exemplos)."""
+        embedder = self._preloaded or build_embedder(self.model)
+        if self.index_path and Path(self.index_path, "meta.json").exists():
+            index = VectorIndex.load(self.index_path)
+            if index.model != embedder.name or index.dim != embedder.dim:
+                raise ValueError(
+                    f"Índice {self.index_path} foi gerado com {index.model} ({index.dim}d), "
+                    f"não com {embedder.name} ({embedder.dim}d)"
+                )
+        else:
+            index = VectorIndex(embedder.name, embedder.dim, self.index_dtype)
+            if self.examples_path:
+                examples = read_examples(self.examples_path)
+                index.add(embedder.encode(examples), examples)
+        self.embedder = embedder
+        self.index = index
+        logger.info("Detector semântico pronto: %s, %d exemplos", embedder.name, len(index))
+
+    def _load_in_background(self):
+        delay = self.retry_initial
+        while True:
+            try:
+                self.load()
+                return
+            except Exception:
+                logger.exception(
+                    "Falha ao carregar o detector semântico; seguindo só com as regex e tentando de novo em %.0f s",
+                    delay,
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, self.retry_max)
+
+    def ensure_loading(self):
+        with self._lock:
+            if self._loader is None:
+                self._loader = threading.Thread(target=self._load_in_background, daemon=True)
+                self._loader.start()
+
+    def embed(self, text: str) -> np.ndarray:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                return vector
+        vector = self.embedder.encode([text])[0]
+        with self._lock:
+            self._cache[text] = vector
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def check(self, text: str) -> SemanticMatch | None:
+        """Retorna o exemplo conhecido mais parecido se passar do limiar, senão None."""
+        if not self.ready:
+            self.ensure_loading()
+            return None
+        found = self.index.search(self.embed(text))
+        if found is None or found[0] < self.threshold:
+            return None
+        return SemanticMatch(*found)
+
+
+def semantic_from_env() -> SemanticDetector | None:
+    """
+    SEMANTIC_DETECTOR=false desliga a etapa. SEMANTIC_MODEL escolhe o modelo de
+    sentence-transformers (ou "hashing", sem modelo); SEMANTIC_INDEX_PATH aponta
+    para um índice gerado com `python -m app.semantic_index`; sem índice, os
+    exemplos de SEMANTIC_EXAMPLES_PATH são embutidos na carga.
+    """
+    if os.getenv("SEMANTIC_DETECTOR", "true").lower() in ("0", "false", "no", "off"):
+        return None
+    return SemanticDetector(
+        model=os.getenv("SEMANTIC_MODEL", DEFAULT_MODEL),
+        threshold=float(os.getenv("SEMANTIC_THRESHOLD", "0.82")),
+        index_path=os.getenv("SEMANTIC_INDEX_PATH") or None,
+        examples_path=os.getenv("SEMANTIC_EXAMPLES_PATH") or None,
+        cache_size=int(os.getenv("SEMANTIC_CACHE_SIZE", "10000")),
+        index_dtype=os.getenv("SEMANTIC_INDEX_DTYPE", "float16"),
+    )
@@ -0,0 +1,142 @@
+"""
+Calibra os pesos do escore barato da cascata contra os veredictos do BiasCheck.
+
+    python -m app.cascade_calibration prompts.jsonl --out cascade_weights.json
+    python -m app.cascade_calibration prompts.jsonl --bias-url http://localhost:5000/validate
+
+A entrada tem um JSON por linha com "prompt" e, opcionalmente, "biased"; os
+registros sem rótulo são enviados ao Bias GuardRail (200 = aprovado, 422 =
+enviesado), e `--labels-out` guarda os rótulos para as próximas rodadas. Ajusta
+uma regressão logística sobre `bias_features`, com peso maior para os textos
+enviesados, e mostra para os pesos padrão e para os ajustados a taxa de falso
+pulo (textos que o BiasCheck reprova e a cascata aprovaria sem o modelo) e a
+fração de textos que deixaria de ir ao modelo em CASCADE_SKIP_BELOW. Termina com
+código 1 se a taxa de falso pulo passar de `--max-false-skip`.
+
+Os pesos gravados em `--out` são lidos pelo orquestrador com CASCADE_WEIGHTS_PATH;
+por isso só são gravados se passarem de `--max-false-skip` (ou com `--force`).
+"""
+import argparse
+import json
+import os
+import sys
+
+import httpx
+import numpy as np
+
+from app.services.cascade import BIAS_WEIGHTS, bias_features, bias_score
+
+FEATURES = [name for name in BIAS_WEIGHTS if name != "intercept"]
+
+
+def read_records(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def label_with_bias_check(prompts: list[str], url: str, client: httpx.Client | None = None) -> list[bool]:
+    """Rótulos do BiasCheck: True se o Bias GuardRail reprovar o texto."""
+    labels = []
+    with client or httpx.Client(timeout=30.0) as http:
+        for prompt in prompts:
+            resp = http.post(url, json={"prompt": prompt})
+            if resp.status_code not in (200, 422):
+                raise RuntimeError(f"Bias GuardRail respondeu {resp.status_code}: {resp.text}")
+            labels.append(resp.status_code == 422)
+    return labels
+
+
+def feature_matrix(prompts: list[str]) -> np.ndarray:
+    rows = [[1.0] + [bias_features(prompt)[name] for name in FEATURES] for prompt in prompts]
+    return np.asarray(rows, dtype=np.float64)
+
+
+def fit_weights(
+    prompts: list[str],
+    labels: list[bool],
+    positive_weight: float = 5.0,
+    l2: float = 0.001,
+    steps: int = 5000,
+    learning_rate: float = 0.5,
+) -> dict[str, float]:
+    """
+    Regressão logística por gradiente, partindo dos pesos padrão. `positive_weight`
+    pesa os textos enviesados: um falso pulo custa mais que uma chamada a mais ao modelo.
+    """
+    x = feature_matrix(prompts)
+    y = np.asarray(labels, dtype=np.float64)
+    sample_weight = np.where(y > 0, positive_weight, 1.0)
+    sample_weight /= sample_weight.sum()
+    theta = np.asarray([BIAS_WEIGHTS["intercept"]] + [BIAS_WEIGHTS[name] for name in FEATURES])
+    for _ in range(steps):
+        p = 1.0 / (1.0 + np.exp(-(x @ theta)))
+        grad = x.T @ (sample_weight * (p - y))
+        grad[1:] += l2 * theta[1:]
+        theta -= learning_rate * grad
+    return {"intercept": float(theta[0]), **{name: float(value) for name, value in zip(FEATURES, theta[1:])}}
+
+
+def evaluate(prompts: list[str], labels: list[bool], weights: dict[str, float], skip_below: float) -> dict:
+    """Taxa de falso pulo (entre os enviesados) e fração de textos que não iria ao modelo."""
+    skipped = [bias_score(prompt, weights) < skip_below for prompt in prompts]
+    biased = sum(labels)
+    false_skips = sum(1 for skip, label in zip(skipped, labels) if skip and label)
+    return {
+        "false_skip_rate": false_skips / biased if biased else None,
+        "false_skips": false_skips,
+        "skip_rate": sum(skipped) / len(prompts) if prompts else None,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Calibra a cascata do Bias GuardRail contra o BiasCheck")
+    parser.add_argument("input", help="JSONL com \"prompt\" e, opcionalmente, \"biased\"")
+    parser.add_argument("--bias-url", default=os.getenv("BIAS_GUARDRAIL_URL", "http://localhost:5000/validate"))
+    parser.add_argument("--labels-out", help="grava os registros já rotulados (JSONL)")
+    parser.add_argument("--out", help="grava os pesos ajustados e as métricas (JSON)")
+    parser.add_argument("--skip-below", type=float, default=float(os.getenv("CASCADE_SKIP_BELOW", "0.1")))
+    parser.add_argument("--positive-weight", type=float, default=5.0)
+    parser.add_argument("--max-false-skip", type=float, default=0.01)
+    parser.add_argument("--force", action="store_true", help="grava os pesos mesmo acima de --max-false-skip")
+    args = parser.parse_args(argv)
+
+    records = read_records(args.input)
+    unlabeled = [record for record in records if "biased" not in record]
+    if unlabeled:
+        labels = label_with_bias_check([record["prompt"] for record in unlabeled], args.bias_url)
+        for record, label in zip(unlabeled, labels):
+            record["biased"] = label
+    if args.labels_out:
+        with open(args.labels_out, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    prompts = [record["prompt"] for record in records]
+    labels = [bool(record["biased"]) for record in records]
+    weights = fit_weights(prompts, labels, positive_weight=args.positive_weight)
+    report = {
+        "examples": len(records),
+        "biased": sum(labels),
+        "skip_below": args.skip_below,
+        "default": evaluate(prompts, labels, BIAS_WEIGHTS, args.skip_below),
+        "fitted": evaluate(prompts, labels, weights, args.skip_below),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    false_skip_rate = report["fitted"]["false_skip_rate"]
+    passed = false_skip_rate is None or false_skip_rate <= args.max_false_skip
+    if args.out:
+        if passed or args.force:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump({"weights": weights, **report}, f, ensure_ascii=False, indent=2)
+        else:
+            print(
+                f"Taxa de falso pulo {false_skip_rate:.3f} acima de {args.max_false_skip}; "
+                f"{args.out} não foi gravado (use --force para gravar assim mesmo)",
+                file=sys.stderr,
+            )
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
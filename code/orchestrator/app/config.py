@@ -0,0 +1,62 @@
+import os
+from dataclasses import dataclass
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class HTTPClientSettings:
+    """Configuração do pool HTTP de um serviço downstream."""
+    timeout: float
+    connect_timeout: float
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    http2: bool
+
+
+# Timeouts padrão por serviço (segundos). Os serviços com modelo são mais lentos.
+DEFAULT_TIMEOUTS = {
+    "sanitizer": 2.0,
+    "guardrail": 2.0,
+    "bias_guardrail": 10.0,
+    "output_guardrail": 10.0,
+}
+
+
+def http_client_settings(service: str) -> HTTPClientSettings:
+    """
+    Lê a configuração do cliente de um serviço a partir de variáveis de ambiente.
+    Ex.: BIAS_GUARDRAIL_TIMEOUT=5 sobrescreve apenas o timeout do bias guardrail,
+    enquanto HTTP_MAX_CONNECTIONS vale para todos os serviços.
+    """
+    prefix = service.upper()
+    return HTTPClientSettings(
+        timeout=env_float(f"{prefix}_TIMEOUT", DEFAULT_TIMEOUTS.get(service, 10.0)),
+        connect_timeout=env_float(f"{prefix}_CONNECT_TIMEOUT", env_float("HTTP_CONNECT_TIMEOUT", 2.0)),
+        max_connections=env_int(f"{prefix}_MAX_CONNECTIONS", env_int("HTTP_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=env_int(f"{prefix}_MAX_KEEPALIVE", env_int("HTTP_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=env_float("HTTP_KEEPALIVE_EXPIRY", 30.0),
+        http2=env_bool("HTTP2_ENABLED", False),
+    )
+
+
+def env_list(name: str, default: str = "") -> list[str]:
+    """Lista separada por os.pathsep (ex.: /services/sanitizer:/services/guardrail)."""
+    value = os.getenv(name, default)
+    return [item for item in value.split(os.pathsep) if item]
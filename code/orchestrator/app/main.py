@@ -1,17 +1,108 @@
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import os
+import time
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import httpx
 
-app = FastAPI(title="Orchestrator API")
+from app.config import env_int, env_list
+from app.services.admission import PriorityMiddleware, Shed, admission_from_env, request_priority
+from app.services.breaker import CircuitOpen, breaker_from_env
+from app.services.bulk import BulkScreenEndpoint
+from app.services.cache import cache_from_env
+from app.services.cascade import cascade_from_env
+from app.services.fused import load_fused_stages
+from app.services.hedging import hedger_from_env
+from app.services.http_clients import DOWNSTREAM_SERVICES, DownstreamClients
+from app.services.metrics import CACHE_LOOKUPS, DOWNSTREAM_LATENCY, PIPELINE_LATENCY, instrument
+from app.services.scheduler import Stage, run_stages
+from app.services.streaming import llm_sentences, llm_tokens, sse_event
+from app.services.tracing import setup_tracing
+
+SANITIZER_URL = os.getenv("SANITIZER_URL", "http://sanitizer:8000/sanitize")
+GUARDRAIL_URL = os.getenv("GUARDRAIL_URL", "http://guardrail:6000/check")
+BIAS_GUARDRAIL_URL = os.getenv("BIAS_GUARDRAIL_URL", "http://bias_guardrail:5000/validate")
+OUTPUT_GUARDRAIL_URL = os.getenv("OUTPUT_GUARDRAIL_URL", "http://output_guardrail:4000/validate")
+GUARDRAIL_VERSION_URL = os.getenv("GUARDRAIL_VERSION_URL", "http://guardrail:6000/rules/version")
+
+# Resposta padrão fake de LLM
+DEFAULT_LLM_RESPONSE = "Azure is a cloud computing service created by Microsoft. It's a significant competitor to AWS."
+
+# "distributed": todas as etapas via HTTP. "fused": Sanitizer e GuardRail (funções
+# puras e baratas) rodam no próprio processo; os serviços com modelo continuam remotos.
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "distributed")
+fused = load_fused_stages(env_list("FUSED_SERVICE_PATHS")) if PIPELINE_MODE == "fused" else None
+
+# Clientes HTTP compartilhados (um pool keep-alive por serviço downstream)
+clients = DownstreamClients()
+
+# Cache de veredictos por etapa. A versão entra na chave: a das regras do GuardRail
+# é consultada periodicamente em /rules/version (e atualizada pelas respostas de
+# /check); a dos modelos vem da configuração.
+cache = cache_from_env()
+stage_versions = {
+    "sanitizer": os.getenv("SANITIZER_VERSION", "1"),
+    "guardrail": None,
+    "bias_guardrail": os.getenv("BIAS_MODEL_VERSION", "bias_check-0.9"),
+    "output_guardrail": os.getenv("OUTPUT_MODEL_VERSION", "gibberish_text-0.5"),
+}
 
-SANITIZER_URL = "http://sanitizer:8000/sanitize"
-GUARDRAIL_URL = "http://guardrail:6000/check"
-BIAS_GUARDRAIL_URL = "http://bias_guardrail:5000/validate"
-OUTPUT_GUARDRAIL_URL = "http://output_guardrail:4000/validate"
+# Controle de admissão: limite do pipeline (429) e limites adaptativos por serviço
+# remoto (503). No modo fused, Sanitizer e GuardRail não passam por rede.
+REMOTE_STAGES = ("bias_guardrail", "output_guardrail") if fused is not None else DOWNSTREAM_SERVICES
+admission = admission_from_env(REMOTE_STAGES)
+RETRY_AFTER_SECONDS = os.getenv("ADMISSION_RETRY_AFTER", "1")
+
+# Circuit breaker por serviço remoto e réplicas (com hedging opcional) por serviço
+breakers = {stage: breaker_from_env(stage) for stage in REMOTE_STAGES}
+hedgers = {
+    "sanitizer": hedger_from_env("sanitizer", SANITIZER_URL),
+    "guardrail": hedger_from_env("guardrail", GUARDRAIL_URL),
+    "bias_guardrail": hedger_from_env("bias_guardrail", BIAS_GUARDRAIL_URL),
+    "output_guardrail": hedger_from_env("output_guardrail", OUTPUT_GUARDRAIL_URL),
+}
+
+# Veredicto usado quando o serviço está indisponível e a etapa é fail-open
+# (<SERVIÇO>_FAIL_MODE=open): o texto segue adiante como está
+DEGRADED_VERDICTS = {
+    "sanitizer": lambda text: {"status": "degraded", "clean_prompt": text},
+    "guardrail": lambda text: {"allowed": True, "reason": "GuardRail indisponível", "safe_output": text},
+    "bias_guardrail": lambda text: {"valid": True, "prompt": text},
+    "output_guardrail": lambda text: {"valid": True, "prompt": text},
+}
+
+# Escore barato antes do Bias GuardRail: textos claramente benignos não vão ao modelo
+cascade = cascade_from_env()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    clients.start()
+    watcher = None
+    interval = float(os.getenv("GUARDRAIL_RULES_RELOAD_INTERVAL", "5"))
+    # No modo fused a recarga das regras do GuardRail acontece aqui; no distribuído
+    # a versão das regras é consultada no mesmo intervalo, para o cache não servir
+    # veredictos de regras antigas depois de uma recarga
+    if fused is not None and fused.rule_store is not None and fused.rule_store.path is not None:
+        watcher = asyncio.create_task(fused.rule_store.watch(interval))
+    elif fused is None and cache is not None and interval > 0:
+        watcher = asyncio.create_task(watch_guardrail_version(interval))
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    await clients.aclose()
+
+app = FastAPI(title="Orchestrator API", lifespan=lifespan)
+instrument(app)
+app.add_middleware(PriorityMiddleware)
+tracer = setup_tracing(app, "orchestrator")
 
 class PromptRequest(BaseModel):
     prompt: str
-    llm_response: str
+    llm_response: str | None = None
 
 class ProcessResponse(BaseModel):
     original_prompt: str
@@ -22,24 +113,17 @@ class ProcessResponse(BaseModel):
 def root():
     return {"message": "Orchestrator running", "status": "healthy"}
 
-@app.post("/process", response_model=ProcessResponse)
-async def process_prompt(req: PromptRequest):
-    """
-    Processa o prompt do usuário através do pipeline completo:
-    1. Sanitizer: Limpa e normaliza o prompt
-    2. GuardRail: Verifica prompt injection e palavras proibidas
-    3. LLM: Processa o prompt aprovado
-    4. Retorna: Resposta do LLM
-    """
-# Etapa 1: Limpeza e normalização do prompt
+async def call_sanitizer(prompt: str) -> dict:
+    """Etapa do Sanitizer: em processo no modo fused, via HTTP no modo distribuído."""
+    if fused is not None:
+        cleaned, status = fused.sanitize(prompt)
+        return {"status": status, "clean_prompt": cleaned}
+
     try:
-        async with httpx.AsyncClient() as client:
-            sanitize_resp = await client.post(
-                SANITIZER_URL, 
-                json={"prompt": req.prompt},
-                timeout=10.0
-            )
-            sanitize_data = sanitize_resp.json()
+        sanitize_resp = await hedgers["sanitizer"].run(
+            lambda url: clients.get("sanitizer").post(url, json={"prompt": prompt})
+        )
+        sanitize_data = sanitize_resp.json()
     except httpx.TimeoutException:
         raise HTTPException(
             status_code=504, 
@@ -50,17 +134,18 @@ async def process_prompt(req: PromptRequest):
             status_code=503, 
             detail=f"Erro ao comunicar com o Sanitizer: {str(e)}"
         )
-    
-    clean_prompt = sanitize_data.get("clean_prompt", req.prompt)
-    
+    return sanitize_data
+
+async def call_guardrail(text: str) -> dict:
+    """Etapa do GuardRail: em processo no modo fused, via HTTP no modo distribuído."""
+    if fused is not None:
+        return fused.apply_guardrails(text)
+
     try:
-        async with httpx.AsyncClient() as client:
-            guardrail_resp = await client.post(
-                GUARDRAIL_URL,
-                json={"text": clean_prompt},
-                timeout=10.0
-            )
-            guardrail_data = guardrail_resp.json()
+        guardrail_resp = await hedgers["guardrail"].run(
+            lambda url: clients.get("guardrail").post(url, json={"text": text})
+        )
+        guardrail_data = guardrail_resp.json()
     except httpx.TimeoutException:
         raise HTTPException(
             status_code=504, 
@@ -71,69 +156,367 @@ async def process_prompt(req: PromptRequest):
             status_code=503, 
             detail=f"Erro ao comunicar com o GuardRail: {str(e)}"
         )
-    
-    if not guardrail_data.get("allowed", False):
+    return guardrail_data
+
+def model_response_data(resp: httpx.Response, service: str) -> dict:
+    """
+    Lê a resposta de um serviço com modelo. 5xx (modelo carregando ou sobrecarregado)
+    vira 503 em vez de ser tratado como conteúdo bloqueado; a reprovação (422) vem
+    aninhada em "detail" pelo FastAPI.
+    """
+    if resp.status_code >= 500:
         raise HTTPException(
-            status_code=400, 
-            detail=guardrail_data.get("reason", "Conteúdo bloqueado pelos guardrails")
+            status_code=503,
+            detail=f"{service} indisponível: {resp.text}",
+            headers={"Retry-After": resp.headers["Retry-After"]} if "Retry-After" in resp.headers else None
         )
-    
-    unregex_prompt = guardrail_data.get("safe_output", clean_prompt)
+    data = resp.json()
+    if isinstance(data.get("detail"), dict):
+        data = data["detail"]
+    return data
 
+async def call_bias_guardrail(prompt: str) -> dict:
+    """Etapa do Bias GuardRail (sempre remota)."""
     try:
-        async with httpx.AsyncClient() as client:
-            bias_guardrail_resp = await client.post(
-                BIAS_GUARDRAIL_URL,
-                json={"prompt": unregex_prompt},
-                timeout=10.0
-            )
-            bias_guardrail_data = bias_guardrail_resp.json()
+        bias_guardrail_resp = await hedgers["bias_guardrail"].run(
+            lambda url: clients.get("bias_guardrail").post(url, json={"prompt": prompt})
+        )
     except httpx.TimeoutException:
         raise HTTPException(
             status_code=504, 
             detail="Timeout ao comunicar com o Bias GuardRail"
         )
+    return model_response_data(bias_guardrail_resp, "Bias GuardRail")
 
-    if not bias_guardrail_data.get("valid", False):
+async def call_output_guardrail(llm_response: str) -> dict:
+    """Etapa do Output GuardRail (sempre remota)."""
+    try:
+        out_guardrail_resp = await hedgers["output_guardrail"].run(
+            lambda url: clients.get("output_guardrail").post(url, json={"prompt": llm_response})
+        )
+    except httpx.TimeoutException:
         raise HTTPException(
-            status_code=400, 
-            detail=bias_guardrail_data.get("error", "Conteúdo bloqueado pelo bias guardrail")
+            status_code=504, 
+            detail="Timeout ao comunicar com o Output GuardRail"
         )
-    
-    safe_input_prompt = bias_guardrail_data.get("prompt", clean_prompt)
+    return model_response_data(out_guardrail_resp, "Output GuardRail")
+
+async def refresh_guardrail_version():
+    """Atualiza a versão das regras do GuardRail usada nas chaves do cache."""
+    try:
+        resp = await clients.get("guardrail").get(GUARDRAIL_VERSION_URL)
+        resp.raise_for_status()
+        version = resp.json().get("rules_version")
+    except Exception:
+        # GuardRail fora do ar: mantém a última versão conhecida
+        return
+    if version:
+        stage_versions["guardrail"] = version
+
+async def watch_guardrail_version(interval: float):
+    while True:
+        await refresh_guardrail_version()
+        await asyncio.sleep(interval)
+
+def stage_version(stage: str) -> str | None:
+    if stage == "guardrail" and fused is not None and fused.rules_version is not None:
+        return fused.rules_version()
+    return stage_versions.get(stage)
 
-    # Resposta padrão fake de LLM
-    llm_response = "Azure is a cloud computing service created by Microsoft. It's a significant competitor to AWS."
+async def cached_stage(stage: str, text: str, call) -> dict:
+    """Consulta o cache de veredictos antes de executar a etapa e guarda o resultado."""
+    with tracer.start_as_current_span(f"stage {stage}") as span:
+        data = await _cached_stage(stage, text, call, span)
+    return data
 
-    # Caso um valor customizado seja passado como parâmetro altera (para testes do output guardrail)
-    if req.llm_response:
-        llm_response = req.llm_response
+async def _cached_stage(stage: str, text: str, call, span) -> dict:
+    version = stage_version(stage)
+    if cache is not None and version is not None:
+        cached = await cache.get(stage, text, version)
+        CACHE_LOOKUPS.labels(stage, "miss" if cached is None else "hit").inc()
+        span.set_attribute("cache.hit", cached is not None)
+        if cached is not None:
+            return cached
 
+    breaker = breakers.get(stage)
+    started = time.perf_counter()
     try:
-        async with httpx.AsyncClient() as client:
-            #faz chamada para serviço de output guardrail
-            out_guardrail_resp = await client.post(
-                OUTPUT_GUARDRAIL_URL,
-                json={"prompt": llm_response},
-                timeout=10.0
-            )
-            out_guardrail_data = out_guardrail_resp.json()
-    except httpx.TimeoutException:
+        if breaker is not None:
+            breaker.check()
+        async with admission.downstream(stage):
+            data = await call(text)
+    except CircuitOpen as e:
+        DOWNSTREAM_LATENCY.labels(stage, "circuit_open").observe(time.perf_counter() - started)
+        span.set_attribute("breaker.state", breaker.state)
+        if breaker.policy.fail_open:
+            return degraded_verdict(stage, text, span)
         raise HTTPException(
-            status_code=504, 
-            detail="Timeout ao comunicar com o Output GuardRail"
+            status_code=503,
+            detail=f"Serviço {stage} indisponível (circuito aberto), tente novamente",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
         )
-
-    #caso o output guardrail lançe erro, barra a resposta
-    if not out_guardrail_data.get("valid", False):
+    except asyncio.CancelledError:
+        if breaker is not None:
+            breaker.record_abandoned()
+        raise
+    except Shed:
+        if breaker is not None:
+            breaker.record_abandoned()
+        DOWNSTREAM_LATENCY.labels(stage, "shed").observe(time.perf_counter() - started)
         raise HTTPException(
-            status_code=400, 
-            detail=out_guardrail_data.get("error", "Conteúdo bloqueado pelo output guardrail")
+            status_code=503,
+            detail=f"Serviço {stage} sobrecarregado, tente novamente",
+            headers={"Retry-After": RETRY_AFTER_SECONDS}
         )
+    except (HTTPException, httpx.HTTPError) as e:
+        status_code = e.status_code if isinstance(e, HTTPException) else 503
+        DOWNSTREAM_LATENCY.labels(stage, "timeout" if status_code == 504 else "error").observe(time.perf_counter() - started)
+        if breaker is not None and status_code >= 500:
+            breaker.record_failure()
+            if breaker.policy.fail_open:
+                return degraded_verdict(stage, text, span)
+        if isinstance(e, httpx.HTTPError):
+            raise HTTPException(status_code=503, detail=f"Erro ao comunicar com {stage}: {str(e)}")
+        raise
+    except Exception:
+        # Resposta inesperada (ex.: corpo que não é JSON): falha para o breaker,
+        # senão uma chamada de teste nunca devolve a vaga do estado meio-aberto
+        DOWNSTREAM_LATENCY.labels(stage, "error").observe(time.perf_counter() - started)
+        if breaker is not None:
+            breaker.record_failure()
+        raise
+    if breaker is not None:
+        breaker.record_success()
+    elapsed = time.perf_counter() - started
+    DOWNSTREAM_LATENCY.labels(stage, "success").observe(elapsed)
+    if cascade is not None and stage == cascade.stage:
+        cascade.observe_model_latency(elapsed)
+
+    if stage == "guardrail" and data.get("rules_version"):
+        version = stage_versions["guardrail"] = data["rules_version"]
+    # Aprovação dada sem o detector semântico (ainda carregando) e bloqueio por
+    # tempo de verificação excedido dependem do momento: não vão para o cache
+    transient = data.get("semantic") == "unavailable" or data.get("budget_exceeded")
+    if cache is not None and version is not None and not transient:
+        await cache.set(stage, text, data, version)
+    return data
+
+def degraded_verdict(stage: str, text: str, span) -> dict:
+    """Aprovação sem o serviço (fail-open). Não vai para o cache."""
+    span.set_attribute("stage.degraded", True)
+    return {**DEGRADED_VERDICTS[stage](text), "degraded": True}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Contadores de acerto, erro e evicção do cache de veredictos."""
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/cascade/stats")
+def cascade_stats():
+    """Decisões da cascata, concordância das amostras com o modelo e latência estimada do modelo."""
+    if cascade is None:
+        return {"enabled": False}
+    return {"enabled": True, **cascade.stats()}
+
+@app.get("/breakers/stats")
+def breakers_stats():
+    """Estado do circuit breaker de cada serviço remoto e das suas réplicas."""
+    return {
+        stage: {"breaker": breakers[stage].stats() if stage in breakers else None, **hedger.stats()}
+        for stage, hedger in hedgers.items()
+    }
+
+@app.get("/admission/stats")
+def admission_stats():
+    """Limites atuais, requisições em andamento e na fila, do pipeline e de cada serviço."""
+    return admission.stats()
+
+def too_many_requests() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Muitas requisições em andamento, tente novamente",
+        headers={"Retry-After": RETRY_AFTER_SECONDS}
+    )
+
+@app.post("/process", response_model=ProcessResponse)
+async def process_prompt(req: PromptRequest):
+    """
+    Processa o prompt do usuário através do pipeline completo:
+    1. Sanitizer: Limpa e normaliza o prompt
+    2. GuardRail: Verifica prompt injection e palavras proibidas
+    3. Bias GuardRail: Verifica viés no prompt
+    4. LLM: Processa o prompt aprovado
+    5. Output GuardRail: Valida a resposta do LLM
+
+    As etapas rodam como um DAG: quando `llm_response` já vem na requisição,
+    o Output GuardRail não depende da validação de entrada e roda em paralelo.
+    O primeiro bloqueio cancela as etapas restantes.
+
+    Acima do limite de concorrência a requisição espera numa fila curta (as
+    interativas antes das de lote, ver header X-Priority) e, se não houver vaga,
+    recebe 429 na hora em vez de sobrecarregar os serviços.
+    """
+    started = time.perf_counter()
+    try:
+        async with admission.request():
+            results = await run_stages(pipeline_stages(req))
+    except Shed:
+        PIPELINE_LATENCY.labels("shed").observe(time.perf_counter() - started)
+        raise too_many_requests()
+    except HTTPException as e:
+        PIPELINE_LATENCY.labels("rejected" if e.status_code < 500 else "error").observe(time.perf_counter() - started)
+        raise
+    PIPELINE_LATENCY.labels("success").observe(time.perf_counter() - started)
     
     # Retorna a resposta processada
     return ProcessResponse(
         original_prompt=req.prompt,
-        sanitized_prompt=safe_input_prompt,
-        llm_response=llm_response
+        sanitized_prompt=results["bias_guardrail"],
+        llm_response=results["output_guardrail"]
     )
+
+@app.post("/process_stream")
+async def process_prompt_stream(req: PromptRequest):
+    """
+    Versão em streaming de /process. A validação de entrada roda completa (erros
+    voltam como HTTP 4xx/5xx, igual a /process); depois a resposta do LLM é quebrada
+    em sentenças conforme os tokens chegam, cada sentença é validada no Output
+    GuardRail assim que termina e, se aprovada, repassada ao cliente como evento
+    SSE `sentence`. Uma sentença reprovada encerra o stream com `blocked`; ao final
+    de uma resposta aprovada vem `done`.
+
+    Cada sentença é uma requisição própria (com cache, circuit breaker e controle
+    de admissão da etapa): num único POST com corpo em streaming o httpx só lê a
+    resposta depois de enviar o corpo inteiro, e nenhum evento chegaria ao
+    cliente antes do fim da resposta do LLM.
+    """
+    stages = [stage for stage in pipeline_stages(req) if stage.name != "output_guardrail"]
+    try:
+        async with admission.request():
+            results = await run_stages(stages)
+    except Shed:
+        raise too_many_requests()
+    llm_response = req.llm_response or DEFAULT_LLM_RESPONSE
+
+    async def events():
+        yield sse_event("prompt", {
+            "original_prompt": req.prompt,
+            "sanitized_prompt": results["bias_guardrail"],
+        })
+        async for sentence in llm_sentences(llm_tokens(llm_response)):
+            try:
+                data = await cached_stage("output_guardrail", sentence, call_output_guardrail)
+            except HTTPException as e:
+                yield sse_event("error", {"valid": False, "error": e.detail})
+                return
+            if not data.get("valid", False):
+                yield sse_event("blocked", {
+                    "valid": False,
+                    "error": data.get("error", "Conteúdo bloqueado pelo output guardrail")
+                })
+                return
+            yield sse_event("sentence", {"valid": True, "sentence": data.get("prompt", sentence)})
+        yield sse_event("done", {"valid": True})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+async def screen_record(record: dict) -> dict:
+    """
+    Executa o pipeline para um registro do modo em lote e devolve o veredicto.
+    Bloqueios e falhas viram campos do veredicto em vez de exceções.
+    """
+    verdict = {"line": record.get("line"), "id": record.get("id")}
+    # Cada registro roda na sua própria task: a prioridade vale só para ele
+    request_priority.set("bulk")
+    if "error" in record:
+        return {**verdict, "allowed": False, "status_code": 400, "detail": record["error"]}
+    req = PromptRequest(prompt=record["prompt"], llm_response=record.get("llm_response"))
+    try:
+        response = await process_prompt(req)
+    except HTTPException as e:
+        return {**verdict, "allowed": False, "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        # Uma falha inesperada (ex.: erro de conexão) vira o veredicto do registro
+        # em vez de interromper o lote inteiro
+        return {**verdict, "allowed": False, "status_code": 503, "detail": f"Erro ao processar o registro: {str(e)}"}
+    return {**verdict, "allowed": True, "status_code": 200, **response.model_dump()}
+
+# Triagem em lote: NDJSON de entrada e de saída, com concorrência limitada
+app.router.add_route(
+    "/process_bulk",
+    BulkScreenEndpoint(screen_record, env_int("BULK_CONCURRENCY", 16)),
+    methods=["POST"],
+)
+
+async def bias_sample_check(text: str) -> bool:
+    """Confere no Bias GuardRail um texto que a cascata aprovou sozinha."""
+    data = await cached_stage("bias_guardrail", text, call_bias_guardrail)
+    return bool(data.get("valid", False))
+
+def pipeline_stages(req: PromptRequest) -> list[Stage]:
+    """Monta o DAG de etapas de uma requisição."""
+
+    # Etapa 1: Limpeza e normalização do prompt
+    async def sanitizer_stage(results):
+        sanitize_data = await cached_stage("sanitizer", req.prompt, call_sanitizer)
+        return sanitize_data.get("clean_prompt", req.prompt)
+
+    # Etapa 2: Regras de prompt injection, palavras proibidas e PII
+    async def guardrail_stage(results):
+        clean_prompt = results["sanitizer"]
+        guardrail_data = await cached_stage("guardrail", clean_prompt, call_guardrail)
+
+        if not guardrail_data.get("allowed", False):
+            raise HTTPException(
+                status_code=400, 
+                detail=guardrail_data.get("reason", "Conteúdo bloqueado pelos guardrails")
+            )
+        return guardrail_data.get("safe_output", clean_prompt)
+
+    # Etapa 3: Viés
+    async def bias_stage(results):
+        unregex_prompt = results["guardrail"]
+        if cascade is not None:
+            with tracer.start_as_current_span("stage bias_guardrail cascade") as span:
+                decision = cascade.decide(unregex_prompt)
+                span.set_attributes({"cascade.score": decision.score, "cascade.decision": decision.action})
+            if decision.action != "model":
+                if decision.action == "sample":
+                    cascade.sample(lambda: bias_sample_check(unregex_prompt))
+                return unregex_prompt
+        bias_guardrail_data = await cached_stage("bias_guardrail", unregex_prompt, call_bias_guardrail)
+
+        if not bias_guardrail_data.get("valid", False):
+            raise HTTPException(
+                status_code=400, 
+                detail=bias_guardrail_data.get("error", "Conteúdo bloqueado pelo bias guardrail")
+            )
+        return bias_guardrail_data.get("prompt", results["sanitizer"])
+
+    # Etapas 4 e 5: LLM e validação da resposta
+    async def output_stage(results):
+        # Resposta padrão fake de LLM; um valor customizado na requisição a substitui
+        # (para testes do output guardrail)
+        llm_response = req.llm_response or DEFAULT_LLM_RESPONSE
+
+        #faz chamada para serviço de output guardrail
+        out_guardrail_data = await cached_stage("output_guardrail", llm_response, call_output_guardrail)
+
+        #caso o output guardrail lançe erro, barra a resposta
+        if not out_guardrail_data.get("valid", False):
+            raise HTTPException(
+                status_code=400, 
+                detail=out_guardrail_data.get("error", "Conteúdo bloqueado pelo output guardrail")
+            )
+        return llm_response
+
+    # Sem resposta pré-fornecida, o LLM só é chamado depois da validação de entrada
+    output_deps = () if req.llm_response else ("bias_guardrail",)
+    return [
+        Stage("sanitizer", sanitizer_stage),
+        Stage("guardrail", guardrail_stage, ("sanitizer",)),
+        Stage("bias_guardrail", bias_stage, ("guardrail",)),
+        Stage("output_guardrail", output_stage, output_deps),
+    ]
@@ -0,0 +1,105 @@
+"""
+Triagem em lote de prompts pela linha de comando.
+
+    python -m app.screen entrada.jsonl saida.jsonl --concurrency 32
+    python -m app.screen entrada.jsonl saida.jsonl --resume
+
+Lê a entrada linha a linha, executa o pipeline do orquestrador com concorrência
+limitada e grava um veredicto JSON por linha, na ordem da entrada. A cada
+--checkpoint-every registros salva <saida>.ckpt com as posições nos dois arquivos;
+--resume continua a partir do último checkpoint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from app.services.bulk import parse_record, screen_ordered
+
+
+def read_checkpoint(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_checkpoint(path: str, state: dict):
+    # Escrita atômica: um checkpoint interrompido nunca fica pela metade
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+async def screen_file(
+    input_path: str,
+    output_path: str,
+    screen,
+    concurrency: int = 16,
+    prompt_field: str = "prompt",
+    checkpoint_every: int = 1000,
+    resume: bool = False,
+) -> int:
+    """Processa `input_path` e grava os veredictos em `output_path`. Retorna o total gravado."""
+    checkpoint_path = output_path + ".ckpt"
+    state = {"input_offset": 0, "output_offset": 0, "line": 0, "records": 0}
+    if resume and os.path.exists(checkpoint_path) and os.path.exists(output_path):
+        state = read_checkpoint(checkpoint_path)
+
+    with open(input_path, "rb") as fin, open(output_path, "r+b" if state["output_offset"] else "wb") as fout:
+        fin.seek(state["input_offset"])
+        # Descarta o que foi gravado depois do último checkpoint
+        fout.seek(state["output_offset"])
+        fout.truncate()
+
+        async def items():
+            line_number = state["line"]
+            while True:
+                line = fin.readline()
+                if not line:
+                    return
+                line_number += 1
+                if line.strip():
+                    yield (line_number, fin.tell()), parse_record(line, line_number, prompt_field)
+
+        async for (line_number, input_offset), verdict in screen_ordered(items(), screen, concurrency):
+            fout.write((json.dumps(verdict, ensure_ascii=False) + "\n").encode("utf-8"))
+            state.update(line=line_number, input_offset=input_offset, records=state["records"] + 1)
+            if state["records"] % checkpoint_every == 0:
+                fout.flush()
+                write_checkpoint(checkpoint_path, {**state, "output_offset": fout.tell()})
+        fout.flush()
+        write_checkpoint(checkpoint_path, {**state, "output_offset": fout.tell()})
+    return state["records"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Triagem em lote de prompts (JSONL -> JSONL)")
+    parser.add_argument("input", help="arquivo JSONL de entrada")
+    parser.add_argument("output", help="arquivo JSONL de saída com os veredictos")
+    parser.add_argument("--concurrency", type=int, default=16, help="registros processados em paralelo")
+    parser.add_argument("--prompt-field", default="prompt", help="campo com o texto do prompt")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="registros entre checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continua do último checkpoint")
+    args = parser.parse_args(argv)
+
+    from app.main import clients, screen_record
+
+    async def run():
+        try:
+            return await screen_file(
+                args.input, args.output, screen_record,
+                concurrency=args.concurrency,
+                prompt_field=args.prompt_field,
+                checkpoint_every=max(1, args.checkpoint_every),
+                resume=args.resume,
+            )
+        finally:
+            await clients.aclose()
+
+    total = asyncio.run(run())
+    print(f"{total} registros processados", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
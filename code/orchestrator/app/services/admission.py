@@ -0,0 +1,279 @@
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from app.config import env_float, env_int
+from app.services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_LIMIT, ADMISSION_QUEUED, ADMISSION_SHED
+
+# Classes de prioridade, da mais alta para a mais baixa
+PRIORITIES = ("interactive", "bulk")
+
+# Prioridade da requisição atual: o header X-Priority no HTTP, "bulk" no /process_bulk
+request_priority: contextvars.ContextVar[str] = contextvars.ContextVar("request_priority", default="interactive")
+
+
+class Shed(Exception):
+    """Requisição descartada pelo controle de admissão (fila cheia ou espera longa demais)."""
+
+    def __init__(self, scope: str, reason: str):
+        super().__init__(f"{scope}: {reason}")
+        self.scope = scope
+        self.reason = reason
+
+
+class AIMDLimit:
+    """
+    Limite de concorrência adaptativo (additive increase, multiplicative decrease).
+
+    Cada resposta dentro de `latency_target` soma 1/limite (≈ +1 a cada janela de
+    `limite` respostas); uma resposta lenta ou com falha multiplica o limite por
+    `backoff`. A redução acontece no máximo uma vez por `latency_target`, para que
+    uma rajada de respostas lentas da mesma janela não derrube o limite a zero.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 1000,
+        latency_target: float = 1.0,
+        backoff: float = 0.7,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.value = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.clock = clock
+        self._last_decrease = float("-inf")
+
+    @property
+    def limit(self) -> int:
+        return int(self.value)
+
+    def update(self, latency: float, dropped: bool):
+        if dropped or latency > self.latency_target:
+            now = self.clock()
+            if now - self._last_decrease >= self.latency_target:
+                self._last_decrease = now
+                self.value = max(self.min_limit, self.value * self.backoff)
+        else:
+            self.value = min(self.max_limit, self.value + 1.0 / self.value)
+
+
+class PriorityLimiter:
+    """
+    Limite de requisições simultâneas com fila de espera limitada e por prioridade.
+
+    Acima do limite a requisição espera na fila da sua classe; as interativas são
+    atendidas antes das de lote. Com a fila cheia a requisição é descartada na
+    hora, a não ser que seja interativa e haja uma de lote esperando: a de lote
+    mais recente cede o lugar. Quem espera mais que o tempo da sua classe também
+    é descartado, em vez de ficar preso até o timeout do cliente.
+    """
+
+    def __init__(self, scope: str, limit: AIMDLimit | int, max_queue: int, queue_timeouts: dict[str, float]):
+        self.scope = scope
+        self._limit = limit
+        self.max_queue = max(0, max_queue)
+        self.queue_timeouts = queue_timeouts
+        self.in_flight = 0
+        self._waiters: dict[str, deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+        self._publish()
+
+    @property
+    def limit(self) -> int:
+        return self._limit.limit if isinstance(self._limit, AIMDLimit) else self._limit
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._waiters.values())
+
+    def _publish(self):
+        ADMISSION_LIMIT.labels(self.scope).set(self.limit)
+        ADMISSION_IN_FLIGHT.labels(self.scope).set(self.in_flight)
+        ADMISSION_QUEUED.labels(self.scope).set(self.queued)
+
+    def _shed(self, priority: str, reason: str) -> Shed:
+        ADMISSION_SHED.labels(self.scope, priority, reason).inc()
+        return Shed(self.scope, reason)
+
+    async def acquire(self, priority: str = "interactive"):
+        if priority not in self._waiters:
+            priority = "interactive"
+        if self.in_flight < self.limit and not self.queued:
+            self.in_flight += 1
+            self._publish()
+            return
+        if self.queued >= self.max_queue:
+            bulk = self._waiters["bulk"]
+            if priority != "interactive" or not bulk:
+                raise self._shed(priority, "queue_full")
+            bulk.pop().set_exception(self._shed("bulk", "preempted"))
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        self._publish()
+        try:
+            done, _ = await asyncio.wait({future}, timeout=self.queue_timeouts.get(priority))
+        except asyncio.CancelledError:
+            self._abandon(priority, future)
+            raise
+        if not done:
+            self._abandon(priority, future)
+            raise self._shed(priority, "queue_timeout")
+        future.result()
+
+    def _abandon(self, priority: str, future: asyncio.Future):
+        """Sai da fila; se a vaga já tinha sido concedida, devolve-a."""
+        if future.done() and not future.cancelled() and future.exception() is None:
+            self.release()
+            return
+        try:
+            self._waiters[priority].remove(future)
+        except ValueError:
+            pass
+        future.cancel()
+        self._publish()
+
+    def release(self):
+        self.in_flight -= 1
+        self.wake()
+
+    def observe(self, latency: float, dropped: bool):
+        """Ajusta o limite adaptativo com o desfecho de uma chamada."""
+        if isinstance(self._limit, AIMDLimit):
+            self._limit.update(latency, dropped)
+
+    def wake(self):
+        """Concede as vagas livres aos primeiros da fila, por ordem de prioridade."""
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while waiters and self.in_flight < self.limit:
+                future = waiters.popleft()
+                if not future.done():
+                    self.in_flight += 1
+                    future.set_result(True)
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": {p: len(q) for p, q in self._waiters.items()},
+        }
+
+
+class AdmissionControl:
+    """
+    Controle de admissão do orquestrador: um limite fixo para o pipeline inteiro
+    (o excesso recebe 429) e um limite adaptativo (AIMD) por serviço downstream,
+    ajustado pela latência observada (o excesso recebe 503).
+    """
+
+    def __init__(self, pipeline: PriorityLimiter, downstreams: dict[str, PriorityLimiter], clock=time.perf_counter):
+        self.pipeline = pipeline
+        self.downstreams = downstreams
+        self.clock = clock
+
+    def request(self):
+        return self.pipeline.slot(request_priority.get())
+
+    @asynccontextmanager
+    async def downstream(self, stage: str):
+        """Vaga no serviço da etapa; a latência e o desfecho da chamada ajustam o limite."""
+        limiter = self.downstreams.get(stage)
+        if limiter is None:
+            yield
+            return
+        await limiter.acquire(request_priority.get())
+        started = self.clock()
+        dropped = None
+        try:
+            yield
+            dropped = False
+        except asyncio.CancelledError:
+            # Etapa cancelada porque outra bloqueou: não diz nada sobre o serviço
+            raise
+        except Exception:
+            dropped = True
+            raise
+        finally:
+            if dropped is not None:
+                limiter.observe(self.clock() - started, dropped)
+            limiter.release()
+
+    def stats(self) -> dict:
+        return {
+            "pipeline": self.pipeline.stats(),
+            "downstreams": {stage: limiter.stats() for stage, limiter in self.downstreams.items()},
+        }
+
+
+# Latência aceitável por serviço (segundos): acima disso o limite AIMD diminui
+DEFAULT_LATENCY_TARGETS = {
+    "sanitizer": 0.2,
+    "guardrail": 0.2,
+    "bias_guardrail": 2.0,
+    "output_guardrail": 2.0,
+}
+
+
+def queue_timeouts_from_env() -> dict[str, float]:
+    return {
+        "interactive": env_float("ADMISSION_QUEUE_TIMEOUT_MS", 1000) / 1000,
+        "bulk": env_float("ADMISSION_BULK_QUEUE_TIMEOUT_MS", 30000) / 1000,
+    }
+
+
+def admission_from_env(stages) -> AdmissionControl:
+    """
+    ADMISSION_MAX_CONCURRENCY e ADMISSION_MAX_QUEUE limitam o pipeline inteiro.
+    Para cada serviço remoto em `stages`, <SERVIÇO>_CONCURRENCY_LIMIT é o limite
+    inicial (entre <SERVIÇO>_CONCURRENCY_MIN e <SERVIÇO>_CONCURRENCY_MAX) e
+    <SERVIÇO>_LATENCY_TARGET_MS a latência acima da qual ele diminui.
+    """
+    timeouts = queue_timeouts_from_env()
+    pipeline = PriorityLimiter(
+        "pipeline", env_int("ADMISSION_MAX_CONCURRENCY", 256), env_int("ADMISSION_MAX_QUEUE", 512), timeouts
+    )
+    downstreams = {}
+    for stage in stages:
+        prefix = stage.upper()
+        limit = AIMDLimit(
+            initial=env_int(f"{prefix}_CONCURRENCY_LIMIT", 32),
+            min_limit=env_int(f"{prefix}_CONCURRENCY_MIN", 1),
+            max_limit=env_int(f"{prefix}_CONCURRENCY_MAX", 256),
+            latency_target=env_float(f"{prefix}_LATENCY_TARGET_MS", DEFAULT_LATENCY_TARGETS.get(stage, 1.0) * 1000) / 1000,
+        )
+        downstreams[stage] = PriorityLimiter(stage, limit, env_int("ADMISSION_DOWNSTREAM_QUEUE", 128), timeouts)
+    return AdmissionControl(pipeline, downstreams)
+
+
+class PriorityMiddleware:
+    """Lê a classe de prioridade do header X-Priority (interactive ou bulk)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"x-priority":
+                    priority = value.decode("latin-1").strip().lower()
+                    if priority in PRIORITIES:
+                        request_priority.set(priority)
+                    break
+        await self.app(scope, receive, send)
@@ -0,0 +1,135 @@
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from app.config import env_float, env_int
+from app.services.metrics import BREAKER_REJECTED, BREAKER_STATE, BREAKER_TRANSITIONS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Valor do gauge por estado
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+@dataclass(frozen=True)
+class BreakerPolicy:
+    """
+    `failure_threshold` falhas seguidas abrem o circuito por `open_seconds`; depois
+    dele, até `half_open_calls` chamadas de teste passam ao mesmo tempo: um sucesso
+    fecha o circuito, uma falha o abre de novo. Chamadas de teste sem resultado
+    depois de `probe_timeout` contam como falha, para que uma chamada travada não
+    prenda o circuito meio-aberto. Com `fail_open`, enquanto o circuito está
+    aberto (ou quando a chamada falha) a etapa aprova o texto em vez de devolver 503.
+    """
+    failure_threshold: int = 5
+    open_seconds: float = 10.0
+    half_open_calls: int = 1
+    fail_open: bool = False
+    probe_timeout: float = 30.0
+
+
+class CircuitOpen(Exception):
+    """Circuito aberto: a chamada nem é feita."""
+
+    def __init__(self, stage: str, retry_after: float):
+        super().__init__(f"Circuito aberto para {stage}")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuit breaker de um serviço downstream (fechado → aberto → meio-aberto → fechado)."""
+
+    def __init__(self, stage: str, policy: BreakerPolicy, clock: Callable[[], float] = time.monotonic):
+        self.stage = stage
+        self.policy = policy
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_opened_at = 0.0
+        self._probes = 0
+        BREAKER_STATE.labels(stage).set(STATE_VALUES[CLOSED])
+
+    def _transition(self, state: str):
+        self.state = state
+        self._probes = 0
+        if state == OPEN:
+            self.opened_at = self.clock()
+        if state == HALF_OPEN:
+            self.half_opened_at = self.clock()
+        if state == CLOSED:
+            self.failures = 0
+        BREAKER_STATE.labels(self.stage).set(STATE_VALUES[state])
+        BREAKER_TRANSITIONS.labels(self.stage, state).inc()
+
+    @property
+    def retry_after(self) -> float:
+        """Segundos até o circuito aceitar chamadas de teste."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.policy.open_seconds - self.clock())
+
+    def check(self):
+        """Levanta CircuitOpen se a chamada não deve ser feita agora."""
+        if self.state == OPEN and self.retry_after <= 0:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN and self._probes < self.policy.half_open_calls:
+            self._probes += 1
+            return
+        if self.state == HALF_OPEN and self.clock() - self.half_opened_at >= self.policy.probe_timeout:
+            # As chamadas de teste não voltaram a tempo: contam como falha
+            self._transition(OPEN)
+        if self.state != CLOSED:
+            BREAKER_REJECTED.labels(self.stage, "fail_open" if self.policy.fail_open else "fail_closed").inc()
+            raise CircuitOpen(self.stage, self.retry_after or self.policy.open_seconds)
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            self._transition(CLOSED)
+        self.failures = 0
+
+    def record_failure(self):
+        if self.state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= self.policy.failure_threshold:
+            self._transition(OPEN)
+
+    def record_abandoned(self):
+        """Chamada de teste que não chegou a um resultado (cancelada ou descartada)."""
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_after": math.ceil(self.retry_after),
+            "fail_mode": "open" if self.policy.fail_open else "closed",
+        }
+
+
+def breaker_from_env(stage: str) -> CircuitBreaker:
+    """
+    <SERVIÇO>_BREAKER_FAILURES, <SERVIÇO>_BREAKER_OPEN_SECONDS,
+    <SERVIÇO>_BREAKER_HALF_OPEN_CALLS e <SERVIÇO>_BREAKER_PROBE_TIMEOUT_SECONDS
+    definem a política; <SERVIÇO>_FAIL_MODE
+    (closed ou open, padrão closed) decide o que a etapa faz sem o serviço.
+    """
+    prefix = stage.upper()
+    fail_mode = os.getenv(f"{prefix}_FAIL_MODE", "closed").strip().lower()
+    if fail_mode not in ("open", "closed"):
+        raise ValueError(f"{prefix}_FAIL_MODE inválido: {fail_mode!r} (use open ou closed)")
+    return CircuitBreaker(stage, BreakerPolicy(
+        failure_threshold=env_int(f"{prefix}_BREAKER_FAILURES", 5),
+        open_seconds=env_float(f"{prefix}_BREAKER_OPEN_SECONDS", 10.0),
+        half_open_calls=env_int(f"{prefix}_BREAKER_HALF_OPEN_CALLS", 1),
+        probe_timeout=env_float(f"{prefix}_BREAKER_PROBE_TIMEOUT_SECONDS", 30.0),
+        fail_open=fail_mode == "open",
+    ))
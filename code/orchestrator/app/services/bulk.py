@@ -0,0 +1,116 @@
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+
+def parse_record(line: bytes, line_number: int, prompt_field: str = "prompt") -> dict:
+    """
+    Converte uma linha JSONL em registro do pipeline. O texto do prompt vem de
+    `prompt_field`; `id` e `llm_response` são opcionais.
+    """
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        return {"line": line_number, "error": f"JSON inválido: {e}"}
+    if not isinstance(data, dict) or not isinstance(data.get(prompt_field), str):
+        return {"line": line_number, "error": f"Campo '{prompt_field}' ausente"}
+    return {
+        "line": line_number,
+        "id": data.get("id", data.get("request_id")),
+        "prompt": data[prompt_field],
+        "llm_response": data.get("llm_response"),
+    }
+
+
+class LineSplitter:
+    """
+    Quebra um stream de bytes em linhas completas, guardando só a linha em aberto.
+    As linhas são numeradas como no arquivo (linhas em branco contam, mas não são
+    devolvidas), igual ao `app.screen`.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self.line_number = 0
+
+    def feed(self, chunk: bytes) -> list[tuple[int, bytes]]:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return self._numbered(lines)
+
+    def flush(self) -> list[tuple[int, bytes]]:
+        rest, self._buffer = self._buffer, b""
+        return self._numbered([rest]) if rest else []
+
+    def _numbered(self, lines: list[bytes]) -> list[tuple[int, bytes]]:
+        numbered = []
+        for line in lines:
+            self.line_number += 1
+            if line.strip():
+                numbered.append((self.line_number, line))
+        return numbered
+
+
+async def screen_ordered(
+    items: AsyncIterator[tuple[Any, dict]],
+    screen: Callable[[dict], Awaitable[dict]],
+    concurrency: int,
+) -> AsyncIterator[tuple[Any, dict]]:
+    """
+    Executa `screen` para cada registro com no máximo `concurrency` em paralelo e
+    devolve os veredictos na ordem de entrada. A memória usada é limitada à janela
+    de `concurrency` registros, independente do tamanho da entrada.
+    `items` são pares (metadado, registro); o metadado volta junto com o veredicto.
+    """
+    window: deque[tuple[Any, asyncio.Task]] = deque()
+    try:
+        async for meta, record in items:
+            window.append((meta, asyncio.create_task(screen(record))))
+            if len(window) >= max(1, concurrency):
+                meta, task = window.popleft()
+                yield meta, await task
+        while window:
+            meta, task = window.popleft()
+            yield meta, await task
+    finally:
+        for _, task in window:
+            task.cancel()
+
+
+class BulkScreenEndpoint:
+    """
+    POST /process_bulk: corpo NDJSON (um registro por linha) lido em streaming e
+    resposta NDJSON com um veredicto por linha, na mesma ordem. É um endpoint ASGI
+    puro para ler o corpo enquanto a resposta já está sendo enviada.
+    """
+
+    def __init__(self, screen: Callable[[dict], Awaitable[dict]], concurrency: int, prompt_field: str = "prompt"):
+        self.screen = screen
+        self.concurrency = concurrency
+        self.prompt_field = prompt_field
+
+    async def __call__(self, scope, receive, send):
+        async def records():
+            splitter = LineSplitter()
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                more_body = message.get("more_body", False)
+                lines = splitter.feed(message.get("body", b""))
+                if not more_body:
+                    lines += splitter.flush()
+                for line_number, line in lines:
+                    yield line_number, parse_record(line, line_number, self.prompt_field)
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson")],
+        })
+        async for _, verdict in screen_ordered(records(), self.screen, self.concurrency):
+            body = (json.dumps(verdict, ensure_ascii=False) + "\n").encode("utf-8")
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
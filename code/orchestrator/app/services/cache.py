@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable
+
+from app.config import env_bool, env_float, env_int
+
+
+class InMemoryCache:
+    """Cache LRU com TTL, local ao processo."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self._data: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size(self) -> int:
+        return len(self._data)
+
+    async def get(self, key: str) -> dict | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict):
+        self._data[key] = (self.clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+class RedisCache:
+    """
+    Backend compartilhado entre réplicas do orquestrador (Redis).
+    A expiração e a evicção ficam a cargo do Redis (TTL + maxmemory-policy), então
+    evicções e tamanho não são conhecidos aqui e aparecem como None nas estatísticas.
+    """
+
+    def __init__(self, url: str, ttl: float = 300.0, prefix: str = "verdict:"):
+        import redis.asyncio as redis
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = None
+        self.size = None
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> dict | None:
+        raw = await self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: dict):
+        await self._redis.set(self.prefix + key, json.dumps(value), ex=max(1, int(self.ttl)))
+
+
+def without_pii_values(value: dict) -> dict:
+    """Cópia do veredicto sem os valores originais dos dados sensíveis (só posição e tipo)."""
+    if not value.get("pii"):
+        return value
+    return {**value, "pii": [{k: v for k, v in span.items() if k != "value"} for span in value["pii"]]}
+
+
+class VerdictCache:
+    """
+    Cache de veredictos por etapa do pipeline.
+
+    A chave é o hash do texto normalizado (NFKC) de entrada da etapa, junto com a
+    versão das regras ou do modelo que produziu o veredicto, então trocar as regras
+    ou o modelo invalida naturalmente as entradas antigas. Valores de dados
+    sensíveis nunca são guardados (nem no Redis).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(stage: str, text: str, version: str = "") -> str:
+        normalized = unicodedata.normalize("NFKC", text)
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{stage}:{version}:{digest}"
+
+    async def get(self, stage: str, text: str, version: str = "") -> dict | None:
+        value = await self.backend.get(self.key(stage, text, version))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, stage: str, text: str, value: dict, version: str = ""):
+        await self.backend.set(self.key(stage, text, version), without_pii_values(value))
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "size": self.backend.size,
+        }
+
+
+def cache_from_env() -> VerdictCache | None:
+    """
+    VERDICT_CACHE_ENABLED liga/desliga o cache. Com VERDICT_CACHE_REDIS_URL o backend
+    é compartilhado (requer o pacote `redis`); sem ele, LRU em memória.
+    """
+    if not env_bool("VERDICT_CACHE_ENABLED", True):
+        return None
+    ttl = env_float("VERDICT_CACHE_TTL", 300.0)
+    redis_url = os.getenv("VERDICT_CACHE_REDIS_URL")
+    if redis_url:
+        return VerdictCache(RedisCache(redis_url, ttl))
+    return VerdictCache(InMemoryCache(env_int("VERDICT_CACHE_MAX_ENTRIES", 10000), ttl))
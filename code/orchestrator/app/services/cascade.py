@@ -0,0 +1,214 @@
+import asyncio
+import json
+import math
+import os
+import random
+import re
+from dataclasses import dataclass
+from functools import partial
+from typing import Awaitable, Callable
+
+from app.config import env_bool, env_float
+from app.services.metrics import CASCADE_DECISIONS, CASCADE_MODEL_SECONDS_SAVED, CASCADE_SAMPLES
+
+# Grupos sociais e termos sensíveis (EN/PT) que costumam aparecer em texto enviesado
+GROUP_TERMS = frozenset("""
+women woman men man girls boys female male females males gay gays lesbian lesbians trans
+black blacks white whites asian asians latino latinos latinas hispanic hispanics arab arabs
+jew jews jewish muslim muslims christian christians atheist atheists immigrant immigrants
+foreigner foreigners refugee refugees elderly old young poor rich disabled race races gender
+religion ethnicity nationality fat obese skinny nerd nerds geek geeks northerners southerners
+mulher mulheres homem homens meninas meninos feminino masculino gays lésbica lésbicas
+negro negros negra negras branco brancos branca brancas asiático asiáticos índio índios
+indígena indígenas judeu judeus judia muçulmano muçulmanos cristão cristãos ateu ateus
+imigrante imigrantes estrangeiro estrangeiros refugiado refugiados nordestino nordestinos
+idoso idosos idosa idosas velho velhos pobre pobres rico ricos deficiente deficientes
+raça raças gênero religião etnia nacionalidade gordo gordos gorda gordas obeso obesos magrelos
+nerd nerds nortistas sulistas
+""".split())
+
+# Generalizações e comparações ("todos são", "sempre", "inferiores")
+GENERALIZATION_TERMS = frozenset("""
+all always never every everyone none should shouldn't must naturally inherently typical typically
+better worse superior inferior smarter dumber
+todos todas sempre nunca nenhum nenhuma deveriam deveria naturalmente típico típica tipicamente
+melhor melhores pior piores superior superiores inferior inferiores
+""".split())
+
+# Adjetivos e rótulos pejorativos ("preguiçosos", "nojentos", "losers")
+PEJORATIVE_TERMS = frozenset("""
+lazy lazier stupid dumb idiots violent criminals disgusting ugly gross filthy dirty losers loser
+awkward worthless useless pathetic weak greedy ignorant primitive savages
+preguiçoso preguiçosos preguiçosa preguiçosas burro burros burra burras violento violentos
+criminosos nojento nojentos nojenta nojentas feio feios feia feias sujo sujos imundos
+perdedores fracassados inúteis ignorantes primitivos selvagens
+""".split())
+
+# Verbos de ligação de afirmações sobre um coletivo ("X are Y", "X são Y")
+COPULA_TERMS = frozenset("are são sao".split())
+
+WORD = re.compile(r"\w+")
+
+# Pesos padrão da regressão logística do escore barato: um texto curto sem grupo,
+# generalização nem termo pejorativo fica em ~2%; um grupo junto de uma
+# generalização ou de um adjetivo pejorativo passa de 50%. Pesos ajustados aos
+# veredictos do BiasCheck saem de `python -m app.cascade_calibration` e são
+# carregados com CASCADE_WEIGHTS_PATH; a taxa de discordância das amostras
+# (orchestrator_cascade_samples_total) indica quando recalibrar.
+BIAS_WEIGHTS = {
+    "intercept": -5.0,
+    "groups": 2.2,
+    "generalizations": 0.9,
+    "pejoratives": 1.8,
+    "copula": 0.8,
+    "group_and_claim": 1.6,
+    "log_words": 0.6,
+    "upper_ratio": 1.5,
+}
+
+
+@dataclass(frozen=True)
+class CascadeDecision:
+    """
+    Resultado da etapa barata. `score` é a probabilidade estimada de o modelo
+    reprovar o texto; `confidence` é a confiança na aprovação sem o modelo.
+    """
+    score: float
+    action: str  # "skip", "sample" ou "model"
+
+    @property
+    def confidence(self) -> float:
+        return 1.0 - self.score
+
+
+def bias_features(text: str) -> dict[str, float]:
+    """Atributos do escore barato (palavras-chave, tamanho e classes de caracteres)."""
+    words = WORD.findall(text.lower())
+    groups = min(3, sum(1 for w in words if w in GROUP_TERMS))
+    generalizations = min(3, sum(1 for w in words if w in GENERALIZATION_TERMS))
+    pejoratives = min(3, sum(1 for w in words if w in PEJORATIVE_TERMS))
+    letters = sum(1 for c in text if c.isalpha())
+    return {
+        "groups": groups,
+        "generalizations": generalizations,
+        "pejoratives": pejoratives,
+        "copula": 1.0 if any(w in COPULA_TERMS for w in words) else 0.0,
+        "group_and_claim": min(groups, generalizations + pejoratives),
+        "log_words": math.log1p(len(words)),
+        "upper_ratio": sum(1 for c in text if c.isupper()) / letters if letters else 0.0,
+    }
+
+
+def bias_score(text: str, weights: dict[str, float] | None = None) -> float:
+    """Escore barato em [0, 1]: regressão logística sobre `bias_features`."""
+    w = weights or BIAS_WEIGHTS
+    logit = w["intercept"] + sum(w[name] * value for name, value in bias_features(text).items())
+    return 1.0 / (1.0 + math.exp(-logit))
+
+
+def load_bias_weights(path: str) -> dict[str, float]:
+    """Lê os pesos gravados por `python -m app.cascade_calibration`."""
+    with open(path, encoding="utf-8") as f:
+        weights = json.load(f)["weights"]
+    missing = set(BIAS_WEIGHTS) - set(weights)
+    if missing:
+        raise ValueError(f"Pesos da cascata em {path} sem: {', '.join(sorted(missing))}")
+    return {name: float(weights[name]) for name in BIAS_WEIGHTS}
+
+
+class Cascade:
+    """
+    Decide, antes da etapa com modelo, se o escore barato basta.
+
+    Textos com escore abaixo de `skip_below` são aprovados sem chamar o modelo;
+    uma fração `sample_rate` deles ainda é enviada ao modelo em segundo plano,
+    sem afetar a resposta, para medir quantas vezes a cascata discorda dele.
+    O tempo de modelo economizado é estimado pela média móvel da latência das
+    chamadas reais.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        scorer: Callable[[str], float],
+        skip_below: float = 0.1,
+        sample_rate: float = 0.05,
+        rng: random.Random | None = None,
+    ):
+        self.stage = stage
+        self.scorer = scorer
+        self.skip_below = skip_below
+        self.sample_rate = sample_rate
+        self.rng = rng or random.Random()
+        self.model_latency: float | None = None
+        self.counts = {"skip": 0, "sample": 0, "model": 0, "agree": 0, "disagree": 0}
+        self._background: set[asyncio.Task] = set()
+
+    def decide(self, text: str) -> CascadeDecision:
+        score = self.scorer(text)
+        if score >= self.skip_below:
+            action = "model"
+        elif self.rng.random() < self.sample_rate:
+            action = "sample"
+        else:
+            action = "skip"
+        self.counts[action] += 1
+        CASCADE_DECISIONS.labels(self.stage, action).inc()
+        if action != "model" and self.model_latency is not None:
+            CASCADE_MODEL_SECONDS_SAVED.labels(self.stage).inc(self.model_latency)
+        return CascadeDecision(score, action)
+
+    def observe_model_latency(self, seconds: float):
+        """Atualiza a média móvel (EWMA) da latência do modelo."""
+        if self.model_latency is None:
+            self.model_latency = seconds
+        else:
+            self.model_latency += 0.1 * (seconds - self.model_latency)
+
+    def sample(self, check: Callable[[], Awaitable[bool]]):
+        """
+        Roda o modelo em segundo plano para um texto já aprovado pela cascata.
+        `check` devolve True se o modelo também aprovou.
+        """
+        task = asyncio.create_task(self._run_sample(check))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _run_sample(self, check):
+        try:
+            agreed = await check()
+        except Exception:
+            CASCADE_SAMPLES.labels(self.stage, "error").inc()
+            return
+        result = "agree" if agreed else "disagree"
+        self.counts[result] += 1
+        CASCADE_SAMPLES.labels(self.stage, result).inc()
+
+    def stats(self) -> dict:
+        sampled = self.counts["agree"] + self.counts["disagree"]
+        return {
+            "stage": self.stage,
+            "skip_below": self.skip_below,
+            "sample_rate": self.sample_rate,
+            **self.counts,
+            "disagreement_rate": self.counts["disagree"] / sampled if sampled else None,
+            "model_latency_seconds": self.model_latency,
+        }
+
+
+def cascade_from_env() -> Cascade | None:
+    """
+    CASCADE_ENABLED liga a cascata antes do Bias GuardRail. CASCADE_SKIP_BELOW é o
+    escore abaixo do qual o modelo não é chamado e CASCADE_SAMPLE_RATE a fração
+    desses textos que ainda vai ao modelo em segundo plano, para auditoria.
+    CASCADE_WEIGHTS_PATH aponta para pesos calibrados contra o BiasCheck.
+    """
+    if not env_bool("CASCADE_ENABLED", False):
+        return None
+    weights_path = os.getenv("CASCADE_WEIGHTS_PATH")
+    return Cascade(
+        "bias_guardrail",
+        partial(bias_score, weights=load_bias_weights(weights_path)) if weights_path else bias_score,
+        skip_below=env_float("CASCADE_SKIP_BELOW", 0.1),
+        sample_rate=env_float("CASCADE_SAMPLE_RATE", 0.05),
+    )
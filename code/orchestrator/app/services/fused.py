@@ -0,0 +1,37 @@
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable
+
+
+@dataclass(frozen=True)
+class FusedStages:
+    """Etapas baratas do pipeline executadas no próprio processo do orquestrador."""
+    sanitize: Callable[[str], tuple[str, str]]
+    apply_guardrails: Callable[[str], dict]
+    rule_store: Any = None
+    rules_version: Callable[[], str] | None = None
+
+
+def load_fused_stages(service_paths: list[str]) -> FusedStages:
+    """
+    Importa `sanitize` do Sanitizer e `apply_guardrails` do GuardRail.
+    `service_paths` são os diretórios raiz dos serviços (os que contêm `app/`).
+    Como nenhum `app/` tem __init__.py, o pacote `app` é um namespace package e
+    os módulos de app/services de cada serviço ficam acessíveis lado a lado.
+    """
+    for path in service_paths:
+        if path not in sys.path:
+            sys.path.append(path)
+    try:
+        from app.services.sanitizer import sanitize
+        from app.services.guardrail import apply_guardrails, current_rules_version, rule_store
+    except ImportError as e:
+        raise RuntimeError(
+            f"Modo fused requer o código do Sanitizer e do GuardRail em FUSED_SERVICE_PATHS: {e}"
+        ) from e
+    return FusedStages(
+        sanitize=sanitize,
+        apply_guardrails=apply_guardrails,
+        rule_store=rule_store,
+        rules_version=current_rules_version,
+    )
@@ -0,0 +1,180 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+
+from app.config import env_bool, env_float, env_int
+from app.services.metrics import HEDGED_REQUESTS
+
+T = TypeVar("T")
+
+# Falhas antes de a requisição chegar à réplica: é seguro repeti-la em outra
+FAILOVER_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class LatencyWindow:
+    """Latências das últimas `size` chamadas, para estimar percentis."""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """
+    Chamadas a um serviço com várias réplicas.
+
+    As réplicas são usadas em rodízio. Com hedging ligado, se a réplica escolhida
+    não responde dentro do p95 recente de latência, a mesma requisição vai também
+    para a réplica seguinte e vale a primeira resposta; a outra é cancelada. Assim
+    uma réplica lenta afeta só o p95, não o p99. O p95 vem da latência de todas
+    as tentativas, inclusive das canceladas (o tempo até o cancelamento, um
+    limite inferior): contar só as vencedoras o faria cair a cada hedge.
+
+    Para não dobrar a carga num serviço todo lento, cada chamada rende
+    `max_ratio` de crédito de hedge e cada hedge gasta um; o crédito acumulado
+    não passa de `max_burst`, para que um longo período sem hedges não libere
+    uma rajada deles. Se a
+    réplica recusa a conexão, a requisição vai na hora para a seguinte, com ou
+    sem hedging, até esgotar as réplicas.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        urls: list[str],
+        enabled: bool = False,
+        quantile: float = 0.95,
+        min_delay: float = 0.01,
+        initial_delay: float = 0.5,
+        min_samples: int = 20,
+        max_ratio: float = 0.1,
+        max_burst: float = 10.0,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        if not urls:
+            raise ValueError(f"Nenhuma URL configurada para {stage}")
+        self.stage = stage
+        self.urls = urls
+        self.enabled = enabled and len(urls) > 1
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.max_burst = max(1.0, max_burst)
+        self.clock = clock
+        self.latencies = LatencyWindow()
+        self.calls = 0
+        self.hedges = 0
+        self._budget = 0.0
+        self._next = itertools.cycle(range(len(urls)))
+
+    def delay(self) -> float:
+        """Quanto esperar pela primeira réplica antes de tentar a segunda."""
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.latencies.percentile(self.quantile))
+
+    def _take_hedge(self) -> bool:
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        self.hedges += 1
+        return True
+
+    async def run(self, attempt: Callable[[str], Awaitable[T]]) -> T:
+        """Executa `attempt(url)` numa réplica (ou em mais de uma, com hedging ou failover)."""
+        first = next(self._next)
+        self.calls += 1
+        self._budget = min(self.max_burst, self._budget + self.max_ratio)
+        started = {}
+
+        def launch(index: int) -> asyncio.Future:
+            task = asyncio.ensure_future(attempt(self.urls[index % len(self.urls)]))
+            started[task] = self.clock()
+            return task
+
+        primary = launch(first)
+        tasks = {primary}
+        hedge = None
+        tried = 1
+        try:
+            if self.enabled:
+                done, _ = await asyncio.wait(tasks, timeout=self.delay())
+                if not done and self._take_hedge():
+                    tried += 1
+                    HEDGED_REQUESTS.labels(self.stage, "sent").inc()
+                    hedge = launch(first + 1)
+                    tasks.add(hedge)
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if t.exception() is None), None)
+                tasks -= done
+                for task in done:
+                    # Recusa de conexão não diz nada sobre o tempo de resposta da réplica
+                    if not isinstance(task.exception(), FAILOVER_ERRORS):
+                        self.latencies.observe(self.clock() - started[task])
+                if winner is None and tried < len(self.urls):
+                    # Réplica recusou a conexão: tenta logo a próxima, sem esperar o hedge
+                    failed = next((t for t in done if isinstance(t.exception(), FAILOVER_ERRORS)), None)
+                    if failed is not None:
+                        tasks.add(launch(first + tried))
+                        tried += 1
+                        HEDGED_REQUESTS.labels(self.stage, "failover").inc()
+                # Uma réplica que falhou não decide sozinha se a outra ainda pode responder
+                if winner is not None or not tasks:
+                    break
+            if winner is None:
+                return next(iter(done)).result()
+            if winner is hedge:
+                HEDGED_REQUESTS.labels(self.stage, "won").inc()
+            return winner.result()
+        finally:
+            for task in tasks:
+                # A tentativa perdedora levaria pelo menos até aqui
+                self.latencies.observe(self.clock() - started[task])
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.urls),
+            "hedging": self.enabled,
+            "delay_seconds": self.delay() if self.enabled else None,
+            "calls": self.calls,
+            "hedges": self.hedges,
+        }
+
+
+def hedger_from_env(stage: str, default_url: str) -> Hedger:
+    """
+    <SERVIÇO>_URLS lista as réplicas separadas por vírgula (padrão: a URL única do
+    serviço). HEDGING_ENABLED (ou <SERVIÇO>_HEDGING) liga o hedging; HEDGE_QUANTILE,
+    HEDGE_MIN_DELAY_MS, HEDGE_INITIAL_DELAY_MS, HEDGE_MAX_RATIO e HEDGE_MAX_BURST o ajustam.
+    """
+    prefix = stage.upper()
+    urls = [url.strip() for url in os.getenv(f"{prefix}_URLS", "").split(",") if url.strip()] or [default_url]
+    return Hedger(
+        stage,
+        urls,
+        enabled=env_bool(f"{prefix}_HEDGING", env_bool("HEDGING_ENABLED", False)),
+        quantile=env_float("HEDGE_QUANTILE", 0.95),
+        min_delay=env_float("HEDGE_MIN_DELAY_MS", 10) / 1000,
+        initial_delay=env_float("HEDGE_INITIAL_DELAY_MS", 500) / 1000,
+        min_samples=env_int("HEDGE_MIN_SAMPLES", 20),
+        max_ratio=env_float("HEDGE_MAX_RATIO", 0.1),
+        max_burst=env_float("HEDGE_MAX_BURST", 10),
+    )
@@ -0,0 +1,59 @@
+import httpx
+from opentelemetry import propagate
+
+from app.config import HTTPClientSettings, http_client_settings
+
+DOWNSTREAM_SERVICES = ("sanitizer", "guardrail", "bias_guardrail", "output_guardrail")
+
+
+async def inject_trace_context(request: httpx.Request):
+    """Propaga o trace atual (header W3C `traceparent`) para o serviço downstream."""
+    propagate.inject(request.headers)
+
+
+def build_client(settings: HTTPClientSettings) -> httpx.AsyncClient:
+    """Cria um AsyncClient com keep-alive, limites de pool e timeout do serviço."""
+    return httpx.AsyncClient(
+        event_hooks={"request": [inject_trace_context]},
+        timeout=httpx.Timeout(settings.timeout, connect=settings.connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry,
+        ),
+        http2=settings.http2,
+    )
+
+
+class DownstreamClients:
+    """
+    Um cliente HTTP de longa duração por serviço downstream.
+    Os clientes são abertos no lifespan da aplicação e reutilizados entre requisições,
+    evitando uma nova conexão TCP a cada etapa do pipeline.
+    """
+
+    def __init__(self, services=DOWNSTREAM_SERVICES):
+        self.services = tuple(services)
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def start(self):
+        for service in self.services:
+            self.get(service)
+
+    def get(self, service: str) -> httpx.AsyncClient:
+        # Criação preguiçosa: permite uso fora do lifespan (ex.: testes sem startup)
+        client = self._clients.get(service)
+        if client is None or client.is_closed:
+            client = build_client(http_client_settings(service))
+            self._clients[service] = client
+        return client
+
+    def set(self, service: str, client: httpx.AsyncClient):
+        """Substitui o cliente de um serviço (ex.: transport mockado em testes)."""
+        client.event_hooks["request"].append(inject_trace_context)
+        self._clients[service] = client
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
@@ -0,0 +1,133 @@
+import os
+import time
+
+from fastapi import FastAPI, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter(
+    "http_requests_total", "Requisições HTTP atendidas", ["route", "method", "outcome"]
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requisições HTTP em andamento", multiprocess_mode="livesum"
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Latência das requisições HTTP", ["route", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def outcome(status_code: int) -> str:
+    if status_code < 400:
+        return "success"
+    if status_code < 500:
+        return "rejected"
+    return "error"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mede cada requisição pelo template da rota (ex.: /check),
+    não pelo caminho bruto, para manter a cardinalidade baixa. Funciona também
+    com as rotas em streaming: a latência vai até o fim do corpo da resposta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            result = outcome(status["code"])
+            REQUESTS.labels(path, scope["method"], result).inc()
+            LATENCY.labels(path, result).observe(time.perf_counter() - started)
+
+
+def metrics_endpoint():
+    # Com vários workers (gunicorn), soma as métricas gravadas por todos os processos
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument(app: FastAPI):
+    """Adiciona o middleware de métricas e a rota /metrics (formato Prometheus)."""
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
+# Métricas do pipeline do orquestrador
+DOWNSTREAM_LATENCY = Histogram(
+    "orchestrator_downstream_duration_seconds", "Latência de cada etapa downstream", ["stage", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+PIPELINE_LATENCY = Histogram(
+    "orchestrator_pipeline_duration_seconds", "Latência total do pipeline", ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "orchestrator_cache_lookups_total", "Consultas ao cache de veredictos", ["stage", "result"]
+)
+CASCADE_DECISIONS = Counter(
+    "orchestrator_cascade_decisions_total", "Decisões da cascata antes da etapa com modelo", ["stage", "decision"]
+)
+CASCADE_MODEL_SECONDS_SAVED = Counter(
+    "orchestrator_cascade_model_seconds_saved_total", "Tempo de modelo estimado economizado pela cascata", ["stage"]
+)
+CASCADE_SAMPLES = Counter(
+    "orchestrator_cascade_samples_total", "Amostras aprovadas pela cascata conferidas pelo modelo", ["stage", "result"]
+)
+ADMISSION_LIMIT = Gauge(
+    "orchestrator_admission_limit", "Limite de concorrência atual", ["scope"], multiprocess_mode="livesum"
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "orchestrator_admission_in_flight", "Requisições admitidas em andamento", ["scope"], multiprocess_mode="livesum"
+)
+ADMISSION_QUEUED = Gauge(
+    "orchestrator_admission_queued", "Requisições esperando vaga", ["scope"], multiprocess_mode="livesum"
+)
+ADMISSION_SHED = Counter(
+    "orchestrator_admission_shed_total", "Requisições descartadas pelo controle de admissão", ["scope", "priority", "reason"]
+)
+BREAKER_STATE = Gauge(
+    "orchestrator_breaker_state", "Estado do circuit breaker (0 fechado, 1 meio-aberto, 2 aberto)", ["stage"],
+    multiprocess_mode="max",
+)
+BREAKER_TRANSITIONS = Counter(
+    "orchestrator_breaker_transitions_total", "Mudanças de estado dos circuit breakers", ["stage", "state"]
+)
+BREAKER_REJECTED = Counter(
+    "orchestrator_breaker_rejected_total", "Chamadas não feitas por circuito aberto", ["stage", "mode"]
+)
+HEDGED_REQUESTS = Counter(
+    "orchestrator_hedged_requests_total", "Requisições duplicadas para outra réplica", ["stage", "result"]
+)
@@ -0,0 +1,47 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Etapa do pipeline. `run` recebe o dicionário com os resultados das etapas já
+    concluídas; `deps` lista as etapas cujo resultado ela precisa.
+    """
+    name: str
+    run: Callable[[dict], Awaitable[Any]]
+    deps: tuple[str, ...] = ()
+
+
+async def run_stages(stages: list[Stage]) -> dict[str, Any]:
+    """
+    Executa um DAG de etapas com o máximo de concorrência possível.
+
+    Cada etapa começa assim que suas dependências terminam. Se alguma etapa
+    levanta exceção (ex.: HTTPException de conteúdo bloqueado), as etapas ainda
+    em execução são canceladas e a exceção é propagada imediatamente.
+    """
+    order = {stage.name: i for i, stage in enumerate(stages)}
+    pending = {stage.name: stage for stage in stages}
+    running: dict[asyncio.Task, str] = {}
+    results: dict[str, Any] = {}
+    try:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(dep in results for dep in stage.deps):
+                    del pending[name]
+                    running[asyncio.create_task(stage.run(results))] = name
+            if not running:
+                raise ValueError(f"Dependências não satisfeitas: {sorted(pending)}")
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            # Etapas concluídas ao mesmo tempo são tratadas na ordem de declaração
+            for task in sorted(done, key=lambda t: order[running[t]]):
+                name = running.pop(task)
+                results[name] = task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    return results
@@ -0,0 +1,64 @@
+import codecs
+import json
+import re
+
+_TOKEN = re.compile(r"\S+\s*|\s+")
+# Fim de sentença: ., ! ou ? seguidos de espaço, ou quebra de linha (o mesmo do Output GuardRail)
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Formata um evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def llm_tokens(text: str):
+    """
+    Stream de tokens da resposta do LLM. Enquanto o LLM é simulado, a resposta
+    pronta é quebrada em palavras; um cliente de LLM real entra aqui.
+    """
+    for token in _TOKEN.findall(text):
+        yield token.encode("utf-8")
+
+
+class SentenceBuffer:
+    """
+    Acumula tokens de uma resposta em streaming e libera sentenças completas
+    assim que o limite de sentença chega. O que sobra é liberado em `flush`.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, chunk: bytes | str) -> list[str]:
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        self._buffer += chunk
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(self._buffer):
+            # Um limite no fim do buffer pode ser só parte do espaço; espera mais texto
+            if match.end() == len(self._buffer) and not match.group(0).endswith("\n"):
+                break
+            sentence = self._buffer[start:match.start()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> list[str]:
+        rest = (self._buffer + self._decoder.decode(b"", final=True)).strip()
+        self._buffer = ""
+        return [rest] if rest else []
+
+
+async def llm_sentences(chunks):
+    """Agrupa o stream de tokens do LLM em sentenças, liberando cada uma assim que termina."""
+    buffer = SentenceBuffer()
+    async for chunk in chunks:
+        for sentence in buffer.feed(chunk):
+            yield sentence
+    for sentence in buffer.flush():
+        yield sentence
@@ -6,6 +6,7 @@ então testes completos requerem os serviços rodando ou mocks complexos.
 Aqui incluímos testes básicos de validação.
 """
 import pytest
+from pathlib import Path
 
 
 class TestDataModels:
@@ -145,3 +146,1081 @@ class TestErrorHandling:
         exc = HTTPException(status_code=400, detail="Conteúdo bloqueado")
         assert exc.status_code == 400
 
+
+
+class TestHTTPClients:
+    """Testes para os clientes HTTP compartilhados"""
+
+    def test_client_is_reused_between_calls(self):
+        """O mesmo pool é reutilizado para o mesmo serviço"""
+        from app.services.http_clients import DownstreamClients
+
+        clients = DownstreamClients()
+        assert clients.get("sanitizer") is clients.get("sanitizer")
+        assert clients.get("sanitizer") is not clients.get("guardrail")
+
+    def test_per_service_timeout_from_env(self, monkeypatch):
+        """Timeout pode ser configurado por serviço via variável de ambiente"""
+        from app.config import http_client_settings
+
+        monkeypatch.setenv("BIAS_GUARDRAIL_TIMEOUT", "3.5")
+        monkeypatch.setenv("HTTP_MAX_CONNECTIONS", "7")
+
+        settings = http_client_settings("bias_guardrail")
+        assert settings.timeout == 3.5
+        assert settings.max_connections == 7
+        assert http_client_settings("sanitizer").timeout != 3.5
+
+    def test_lifespan_opens_and_closes_clients(self):
+        """Os clientes são abertos no startup e fechados no shutdown"""
+        from fastapi.testclient import TestClient
+        from app.main import app, clients
+
+        with TestClient(app):
+            client = clients.get("guardrail")
+            assert not client.is_closed
+        assert client.is_closed
+
+
+class TestFusedPipeline:
+    """Testes para o modo fused (Sanitizer e GuardRail em processo)"""
+
+    CODE_DIR = Path(__file__).resolve().parents[2]
+    SERVICE_PATHS = [str(CODE_DIR / "sanitizer"), str(CODE_DIR / "guardrail")]
+
+    def test_load_fused_stages(self):
+        """Importa as funções dos serviços sem conflito com o app do orquestrador"""
+        from app.services.fused import load_fused_stages
+        import app.main
+
+        stages = load_fused_stages(self.SERVICE_PATHS)
+        cleaned, status = stages.sanitize("Olá\u200bmundo")
+        assert cleaned == "Olámundo"
+        assert status == "ok"
+        assert not stages.apply_guardrails("jailbreak now")["allowed"]
+        assert app.main.app.title == "Orchestrator API"
+
+    @pytest.mark.asyncio
+    async def test_fused_stages_match_remote_shape(self, monkeypatch):
+        """As etapas em processo devolvem o mesmo formato das respostas HTTP"""
+        from app.services.fused import load_fused_stages
+        import app.main as main
+
+        monkeypatch.setattr(main, "fused", load_fused_stages(self.SERVICE_PATHS))
+        sanitize_data = await main.call_sanitizer("Olá\u200bmundo")
+        assert sanitize_data == {"status": "ok", "clean_prompt": "Olámundo"}
+
+        guardrail_data = await main.call_guardrail("my email is a@b.com")
+        assert guardrail_data["allowed"]
+        assert guardrail_data["safe_output"] == "my email is [EMAIL_REMOVED]"
+
+
+def mock_downstreams(main, monkeypatch, calls, bias_valid=True):
+    """Substitui os quatro serviços por um transport HTTP em memória"""
+    import json
+    import httpx
+    from app.services.http_clients import DownstreamClients
+
+    def handler(request):
+        service = request.url.host
+        calls.append(service)
+        body = json.loads(request.content)
+        if service == "sanitizer":
+            return httpx.Response(200, json={"status": "ok", "clean_prompt": body["prompt"].strip()})
+        if service == "guardrail":
+            return httpx.Response(200, json={
+                "allowed": True, "reason": "ok", "safe_output": body["text"], "rules_version": "r1"
+            })
+        if service == "bias_guardrail" and not bias_valid:
+            return httpx.Response(422, json={"detail": {"valid": False, "error": "viés detectado"}})
+        return httpx.Response(200, json={"valid": True, "prompt": body["prompt"]})
+
+    clients = DownstreamClients()
+    for service in clients.services:
+        clients.set(service, httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "clients", clients)
+
+
+class TestVerdictCache:
+    """Testes para o cache de veredictos"""
+
+    def test_lru_eviction_and_ttl(self):
+        """Evicção por tamanho e expiração por TTL"""
+        import asyncio
+        from app.services.cache import InMemoryCache
+
+        now = [0.0]
+        cache = InMemoryCache(max_entries=2, ttl=10, clock=lambda: now[0])
+
+        async def run():
+            await cache.set("a", {"v": 1})
+            await cache.set("b", {"v": 2})
+            await cache.get("a")
+            await cache.set("c", {"v": 3})
+            assert await cache.get("b") is None
+            assert await cache.get("a") == {"v": 1}
+            now[0] = 11
+            assert await cache.get("a") is None
+
+        asyncio.run(run())
+        assert cache.evictions == 1
+
+    def test_key_uses_nfkc_and_version(self):
+        """Textos equivalentes em NFKC compartilham a chave; a versão a separa"""
+        from app.services.cache import VerdictCache
+
+        assert VerdictCache.key("guardrail", "ｆｕｌｌ", "r1") == VerdictCache.key("guardrail", "full", "r1")
+        assert VerdictCache.key("guardrail", "full", "r1") != VerdictCache.key("guardrail", "full", "r2")
+
+    def test_repeated_prompt_skips_downstream_calls(self, monkeypatch):
+        """Um prompt repetido é respondido pelo cache"""
+        from fastapi.testclient import TestClient
+        from app.services.cache import InMemoryCache, VerdictCache
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", VerdictCache(InMemoryCache()))
+        monkeypatch.setitem(main.stage_versions, "guardrail", None)
+        calls = []
+        mock_downstreams(main, monkeypatch, calls)
+        client = TestClient(main.app)
+
+        payload = {"prompt": " Olá ", "llm_response": "Tudo bem."}
+        first = client.post("/process", json=payload)
+        assert first.status_code == 200
+        assert len(calls) == 4
+
+        second = client.post("/process", json=payload)
+        assert second.json() == first.json()
+        assert len(calls) == 4
+        assert client.get("/cache/stats").json()["hits"] == 4
+
+    def test_rules_reload_invalidates_guardrail_entries(self, monkeypatch):
+        """A versão consultada em /rules/version troca a chave sem esperar um miss"""
+        import asyncio
+        import httpx
+        from app.services.cache import InMemoryCache, VerdictCache
+        from app.services.http_clients import DownstreamClients
+        import app.main as main
+
+        version = ["r1"]
+        checks = []
+
+        def handler(request):
+            if request.url.path == "/rules/version":
+                return httpx.Response(200, json={"rules_version": version[0]})
+            checks.append(request.url.path)
+            return httpx.Response(200, json={
+                "allowed": True, "reason": "ok", "safe_output": "oi", "rules_version": version[0]
+            })
+
+        clients = DownstreamClients()
+        clients.set("guardrail", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(main, "clients", clients)
+        monkeypatch.setattr(main, "cache", VerdictCache(InMemoryCache()))
+        monkeypatch.setitem(main.stage_versions, "guardrail", None)
+
+        async def run():
+            await main.refresh_guardrail_version()
+            await main.cached_stage("guardrail", "oi", main.call_guardrail)
+            await main.cached_stage("guardrail", "oi", main.call_guardrail)
+            assert len(checks) == 1
+            version[0] = "r2"
+            await main.refresh_guardrail_version()
+            await main.cached_stage("guardrail", "oi", main.call_guardrail)
+            assert len(checks) == 2
+
+        asyncio.run(run())
+
+    def test_verdict_without_semantic_detector_is_not_cached(self, monkeypatch):
+        """Aprovação dada com o detector semântico carregando não vai para o cache"""
+        import asyncio
+        import httpx
+        from app.services.cache import InMemoryCache, VerdictCache
+        from app.services.http_clients import DownstreamClients
+        import app.main as main
+
+        semantic = ["unavailable"]
+        checks = []
+
+        def handler(request):
+            checks.append(request.url.path)
+            data = {"allowed": True, "reason": "ok", "safe_output": "oi", "rules_version": "r1"}
+            if semantic[0]:
+                data["semantic"] = semantic[0]
+            return httpx.Response(200, json=data)
+
+        clients = DownstreamClients()
+        clients.set("guardrail", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(main, "clients", clients)
+        monkeypatch.setattr(main, "cache", VerdictCache(InMemoryCache()))
+        monkeypatch.setitem(main.stage_versions, "guardrail", "r1")
+
+        async def run():
+            await main.cached_stage("guardrail", "oi", main.call_guardrail)
+            await main.cached_stage("guardrail", "oi", main.call_guardrail)
+            assert len(checks) == 2
+            semantic[0] = None
+            await main.cached_stage("guardrail", "oi", main.call_guardrail)
+            await main.cached_stage("guardrail", "oi", main.call_guardrail)
+            assert len(checks) == 3
+
+        asyncio.run(run())
+
+    def test_budget_exceeded_block_is_not_cached(self, monkeypatch):
+        """Bloqueio por tempo de verificação excedido não vai para o cache"""
+        import asyncio
+        import httpx
+        from app.services.cache import InMemoryCache, VerdictCache
+        from app.services.http_clients import DownstreamClients
+        import app.main as main
+
+        slow = [True]
+        checks = []
+
+        def handler(request):
+            checks.append(request.url.path)
+            if slow[0]:
+                data = {"allowed": False, "reason": "Conteúdo bloqueado: tempo de verificação excedido",
+                        "safe_output": None, "rules_version": "r1", "budget_exceeded": True}
+            else:
+                data = {"allowed": True, "reason": "ok", "safe_output": "oi", "rules_version": "r1"}
+            return httpx.Response(200, json=data)
+
+        clients = DownstreamClients()
+        clients.set("guardrail", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(main, "clients", clients)
+        monkeypatch.setattr(main, "cache", VerdictCache(InMemoryCache()))
+        monkeypatch.setitem(main.stage_versions, "guardrail", "r1")
+
+        async def run():
+            assert (await main.cached_stage("guardrail", "oi", main.call_guardrail))["allowed"] is False
+            slow[0] = False
+            assert (await main.cached_stage("guardrail", "oi", main.call_guardrail))["allowed"] is True
+            await main.cached_stage("guardrail", "oi", main.call_guardrail)
+            assert len(checks) == 2
+
+        asyncio.run(run())
+
+    def test_pii_values_are_not_cached(self):
+        """Só posição e tipo dos dados sensíveis vão para o cache, nunca o valor"""
+        import asyncio
+        from app.services.cache import InMemoryCache, VerdictCache
+
+        backend = InMemoryCache()
+        cache = VerdictCache(backend)
+        verdict = {
+            "allowed": True,
+            "safe_output": "CPF [CPF_REMOVED]",
+            "pii": [{"start": 4, "end": 18, "type": "cpf", "value": "123.456.789-00"}],
+        }
+
+        async def run():
+            await cache.set("guardrail", "CPF 123.456.789-00", verdict, "r1")
+            return await cache.get("guardrail", "CPF 123.456.789-00", "r1")
+
+        assert asyncio.run(run())["pii"] == [{"start": 4, "end": 18, "type": "cpf"}]
+        assert verdict["pii"][0]["value"] == "123.456.789-00"
+        assert "123.456.789-00" not in repr(backend._data)
+
+    def test_redis_stats_are_unknown(self):
+        """Evicções e tamanho do Redis não são conhecidos pelo orquestrador"""
+        from app.services.cache import RedisCache, VerdictCache
+
+        stats = VerdictCache(RedisCache("redis://localhost:6379/0")).stats()
+        assert stats["evictions"] is None
+        assert stats["size"] is None
+
+    def test_bias_rejection_message_is_preserved(self, monkeypatch):
+        """A mensagem de reprovação do Bias GuardRail chega ao cliente"""
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        mock_downstreams(main, monkeypatch, [], bias_valid=False)
+        response = TestClient(main.app).post("/process", json={"prompt": "x", "llm_response": "y"})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "viés detectado"
+
+
+class TestCascade:
+    """Testes para a cascata de decisão antes do Bias GuardRail"""
+
+    def test_cheap_score_separates_benign_from_suspicious(self):
+        """Textos curtos e neutros ficam abaixo do limiar; generalizações sobre grupos, acima"""
+        from app.services.cascade import bias_score
+
+        for text in ("how is the weather?", "Como fazer um bolo de chocolate?"):
+            assert bias_score(text) < 0.1
+        for text in ("women are worse drivers", "Todos os imigrantes são preguiçosos"):
+            assert bias_score(text) > 0.5
+
+    @pytest.mark.parametrize("text", [
+        "Fat people are disgusting and ugly",
+        "Nerds are socially awkward losers",
+        "Gordos são nojentos",
+        "People from the north are lazy",
+    ])
+    def test_biased_examples_route_to_model(self, text):
+        """Rótulos pejorativos sobre um coletivo vão ao modelo, mesmo sem grupo conhecido"""
+        from app.services.cascade import Cascade, bias_score
+
+        cascade = Cascade("bias_guardrail", bias_score, sample_rate=0.0)
+        assert cascade.decide(text).action == "model"
+
+    def test_calibration_fits_weights_and_reports_false_skips(self, tmp_path, monkeypatch):
+        """A calibração ajusta os pesos aos rótulos e mede a taxa de falso pulo"""
+        import json
+        from app import cascade_calibration
+        from app.services.cascade import bias_score, cascade_from_env
+
+        # Rótulos do "BiasCheck": os enviesados não têm nenhum termo conhecido, só caixa alta
+        records = [{"prompt": f"How do I cook dish number {i}?", "biased": False} for i in range(20)]
+        records += [{"prompt": f"THOSE PEOPLE FROM REGION {i} RUIN EVERYTHING", "biased": True} for i in range(5)]
+        path = tmp_path / "prompts.jsonl"
+        path.write_text("\n".join(json.dumps(record) for record in records), encoding="utf-8")
+        out = tmp_path / "weights.json"
+
+        assert cascade_calibration.main([str(path), "--out", str(out), "--max-false-skip", "1"]) == 0
+        report = json.loads(out.read_text(encoding="utf-8"))
+        assert report["default"]["false_skip_rate"] == 1.0
+        assert report["fitted"]["false_skip_rate"] == 0.0
+        assert report["fitted"]["skip_rate"] == 0.8
+
+        monkeypatch.setenv("CASCADE_ENABLED", "true")
+        monkeypatch.setenv("CASCADE_WEIGHTS_PATH", str(out))
+        cascade = cascade_from_env()
+        assert cascade.decide("THOSE PEOPLE FROM REGION 9 RUIN EVERYTHING").action == "model"
+        assert bias_score("THOSE PEOPLE FROM REGION 9 RUIN EVERYTHING") < 0.1
+
+    def test_calibration_rejected_weights_are_not_written(self, tmp_path, monkeypatch):
+        """Pesos acima de --max-false-skip só são gravados com --force"""
+        import json
+        from app import cascade_calibration
+        from app.services.cascade import BIAS_WEIGHTS
+
+        records = [{"prompt": "How do I cook rice?", "biased": False},
+                   {"prompt": "THOSE PEOPLE RUIN EVERYTHING", "biased": True}]
+        path = tmp_path / "prompts.jsonl"
+        path.write_text("\n".join(json.dumps(record) for record in records), encoding="utf-8")
+        out = tmp_path / "weights.json"
+        # Os pesos padrão deixam o texto enviesado pular o modelo
+        monkeypatch.setattr(cascade_calibration, "fit_weights", lambda *args, **kwargs: dict(BIAS_WEIGHTS))
+
+        assert cascade_calibration.main([str(path), "--out", str(out)]) == 1
+        assert not out.exists()
+        assert cascade_calibration.main([str(path), "--out", str(out), "--force"]) == 1
+        assert json.loads(out.read_text(encoding="utf-8"))["fitted"]["false_skip_rate"] == 1.0
+
+    def test_calibration_labels_with_bias_check(self):
+        """Registros sem rótulo são classificados pelo Bias GuardRail (422 = enviesado)"""
+        import httpx
+        from app import cascade_calibration
+
+        def handler(request):
+            biased = b"lazy" in request.content
+            return httpx.Response(422 if biased else 200, json={"valid": not biased})
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        labels = cascade_calibration.label_with_bias_check(["oi", "they are lazy"], "http://bias/validate", client)
+        assert labels == [False, True]
+
+    def test_decide_skip_sample_and_model(self):
+        """Abaixo do limiar decide entre pular e amostrar; acima, chama o modelo"""
+        import random
+        from app.services.cascade import Cascade
+
+        cascade = Cascade("bias_guardrail", lambda text: float(text), skip_below=0.1, sample_rate=0.5,
+                          rng=random.Random(1))
+        assert cascade.decide("0.9").action == "model"
+        actions = {cascade.decide("0.01").action for _ in range(50)}
+        assert actions == {"skip", "sample"}
+        assert cascade.decide("0.05").confidence == pytest.approx(0.95)
+
+    def test_skip_avoids_bias_call(self, monkeypatch):
+        """Prompt claramente benigno não chega ao Bias GuardRail; o suspeito chega"""
+        from fastapi.testclient import TestClient
+        from app.services.cascade import Cascade, bias_score
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        monkeypatch.setattr(main, "cascade", Cascade("bias_guardrail", bias_score, sample_rate=0.0))
+        calls = []
+        mock_downstreams(main, monkeypatch, calls)
+        client = TestClient(main.app)
+
+        response = client.post("/process", json={"prompt": "how is the weather?", "llm_response": "Sunny."})
+        assert response.status_code == 200
+        assert response.json()["sanitized_prompt"] == "how is the weather?"
+        assert "bias_guardrail" not in calls
+
+        client.post("/process", json={"prompt": "women are worse drivers", "llm_response": "No."})
+        assert calls.count("bias_guardrail") == 1
+        stats = client.get("/cascade/stats").json()
+        assert (stats["skip"], stats["model"]) == (1, 1)
+        assert stats["model_latency_seconds"] is not None
+
+    def test_sampled_disagreement_is_counted(self, monkeypatch):
+        """A amostra roda o modelo em segundo plano sem mudar a resposta e registra a discordância"""
+        import time
+        from fastapi.testclient import TestClient
+        from app.services.cascade import Cascade, bias_score
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        monkeypatch.setattr(main, "cascade", Cascade("bias_guardrail", bias_score, sample_rate=1.0))
+        calls = []
+        mock_downstreams(main, monkeypatch, calls, bias_valid=False)
+        with TestClient(main.app) as client:
+            response = client.post("/process", json={"prompt": "oi", "llm_response": "Olá."})
+            assert response.status_code == 200
+            for _ in range(100):
+                if main.cascade.counts["disagree"]:
+                    break
+                time.sleep(0.01)
+            stats = client.get("/cascade/stats").json()
+        assert stats["sample"] == 1
+        assert stats["disagree"] == 1
+        assert stats["disagreement_rate"] == 1.0
+        assert calls.count("bias_guardrail") == 1
+
+
+class TestAdmissionControl:
+    """Testes para o controle de admissão (limites, filas e prioridades)"""
+
+    TIMEOUTS = {"interactive": 1.0, "bulk": 1.0}
+
+    def test_aimd_increases_slowly_and_backs_off_once_per_window(self):
+        """Respostas rápidas somam ~1 por janela; uma rajada lenta reduz uma vez só"""
+        from app.services.admission import AIMDLimit
+
+        now = [0.0]
+        limit = AIMDLimit(initial=10, latency_target=0.5, clock=lambda: now[0])
+        for _ in range(10):
+            limit.update(0.1, dropped=False)
+        assert limit.limit == 10 and limit.value > 10.9
+        for _ in range(5):
+            limit.update(2.0, dropped=False)
+        assert limit.limit == 7
+        now[0] = 1.0
+        limit.update(0.0, dropped=True)
+        assert limit.limit == 5
+
+    @pytest.mark.asyncio
+    async def test_interactive_waiters_are_served_before_bulk(self):
+        """Com a vaga ocupada, a interativa que chegou depois passa na frente da de lote"""
+        import asyncio
+        from app.services.admission import PriorityLimiter
+
+        limiter = PriorityLimiter("test", 1, 4, self.TIMEOUTS)
+        order = []
+
+        async def worker(name, priority):
+            async with limiter.slot(priority):
+                order.append(name)
+
+        await limiter.acquire()
+        tasks = [asyncio.create_task(worker("bulk", "bulk"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(worker("interactive", "interactive")))
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == {"interactive": 1, "bulk": 1}
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "bulk"]
+        assert limiter.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_full_queue_sheds_and_interactive_preempts_bulk(self):
+        """Fila cheia descarta na hora; uma interativa toma o lugar de uma de lote"""
+        import asyncio
+        from app.services.admission import PriorityLimiter, Shed
+
+        limiter = PriorityLimiter("test", 1, 1, self.TIMEOUTS)
+        await limiter.acquire()
+        bulk = asyncio.create_task(limiter.acquire("bulk"))
+        await asyncio.sleep(0)
+        with pytest.raises(Shed):
+            await limiter.acquire("bulk")
+
+        interactive = asyncio.create_task(limiter.acquire("interactive"))
+        await asyncio.sleep(0)
+        with pytest.raises(Shed) as shed:
+            await bulk
+        assert shed.value.reason == "preempted"
+        limiter.release()
+        await interactive
+        assert limiter.in_flight == 1
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_sheds_and_frees_the_queue(self):
+        """Quem espera além do tempo da sua classe é descartado e sai da fila"""
+        from app.services.admission import PriorityLimiter, Shed
+
+        limiter = PriorityLimiter("test", 1, 4, {"interactive": 0.01, "bulk": 0.01})
+        await limiter.acquire()
+        with pytest.raises(Shed) as shed:
+            await limiter.acquire()
+        assert shed.value.reason == "queue_timeout"
+        assert limiter.queued == 0
+
+    def test_saturated_pipeline_returns_429(self, monkeypatch):
+        """Sem vaga no pipeline e sem fila a resposta é 429 com Retry-After"""
+        from fastapi.testclient import TestClient
+        from app.services.admission import AdmissionControl, PriorityLimiter
+        import app.main as main
+
+        calls = []
+        mock_downstreams(main, monkeypatch, calls)
+        monkeypatch.setattr(main, "admission", AdmissionControl(PriorityLimiter("pipeline", 0, 0, self.TIMEOUTS), {}))
+        response = TestClient(main.app).post("/process", json={"prompt": "oi"})
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == main.RETRY_AFTER_SECONDS
+        assert calls == []
+
+    def test_saturated_downstream_returns_503(self, monkeypatch):
+        """Sem vaga no Bias GuardRail a etapa falha rápido com 503, sem chamá-lo"""
+        from fastapi.testclient import TestClient
+        from app.services.admission import AdmissionControl, PriorityLimiter
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        calls = []
+        mock_downstreams(main, monkeypatch, calls)
+        monkeypatch.setattr(main, "admission", AdmissionControl(
+            PriorityLimiter("pipeline", 8, 8, self.TIMEOUTS),
+            {"bias_guardrail": PriorityLimiter("bias_guardrail", 0, 0, self.TIMEOUTS)},
+        ))
+        client = TestClient(main.app)
+        response = client.post("/process", json={"prompt": "oi"})
+        assert response.status_code == 503
+        assert "bias_guardrail" not in calls
+        assert client.get("/admission/stats").json()["pipeline"]["in_flight"] == 0
+
+
+class TestCircuitBreakers:
+    """Testes para os circuit breakers e o hedging entre réplicas"""
+
+    def test_breaker_opens_half_opens_and_closes(self):
+        """Falhas seguidas abrem o circuito; após o intervalo, uma chamada de teste o fecha"""
+        from app.services.breaker import BreakerPolicy, CircuitBreaker, CircuitOpen
+
+        now = [0.0]
+        breaker = CircuitBreaker("bias_guardrail", BreakerPolicy(failure_threshold=2, open_seconds=5), clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.check()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpen) as opened:
+            breaker.check()
+        assert opened.value.retry_after == 5
+
+        now[0] = 5.0
+        breaker.check()
+        assert breaker.state == "half_open"
+        with pytest.raises(CircuitOpen):
+            breaker.check()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_failed_probe_reopens(self):
+        """Falha na chamada de teste reabre o circuito por mais um intervalo"""
+        from app.services.breaker import BreakerPolicy, CircuitBreaker
+
+        now = [0.0]
+        breaker = CircuitBreaker("guardrail", BreakerPolicy(failure_threshold=1, open_seconds=5), clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 6.0
+        breaker.check()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert breaker.retry_after == 5
+
+    def test_stuck_probe_times_out(self):
+        """Chamada de teste sem resultado depois de probe_timeout reabre o circuito"""
+        from app.services.breaker import BreakerPolicy, CircuitBreaker, CircuitOpen
+
+        now = [0.0]
+        breaker = CircuitBreaker("guardrail", BreakerPolicy(failure_threshold=1, open_seconds=5, probe_timeout=2),
+                                 clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 6.0
+        breaker.check()
+        now[0] = 7.0
+        with pytest.raises(CircuitOpen):
+            breaker.check()
+        assert breaker.state == "half_open"
+        now[0] = 8.0
+        with pytest.raises(CircuitOpen):
+            breaker.check()
+        assert breaker.state == "open"
+        now[0] = 13.0
+        breaker.check()
+        assert breaker.state == "half_open"
+
+    def test_unexpected_error_frees_probe(self, monkeypatch):
+        """Resposta que não é JSON conta como falha e devolve a vaga da chamada de teste"""
+        import httpx
+        from fastapi.testclient import TestClient
+        from app.services.breaker import BreakerPolicy, CircuitBreaker
+        import app.main as main
+
+        now = [0.0]
+        breaker = CircuitBreaker("bias_guardrail", BreakerPolicy(1, 5), clock=lambda: now[0])
+        monkeypatch.setattr(main, "cache", None)
+        monkeypatch.setitem(main.breakers, "bias_guardrail", breaker)
+        calls = []
+        mock_downstreams(main, monkeypatch, calls)
+
+        def handler(request):
+            calls.append("bias_guardrail")
+            return httpx.Response(200, text="<html>proxy</html>")
+
+        main.clients.set("bias_guardrail", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        client = TestClient(main.app, raise_server_exceptions=False)
+
+        assert client.post("/process", json={"prompt": "oi", "llm_response": "Olá."}).status_code == 500
+        assert breaker.state == "open"
+        now[0] = 6.0
+        assert client.post("/process", json={"prompt": "oi", "llm_response": "Olá."}).status_code == 500
+        assert breaker.state == "open"
+        assert calls.count("bias_guardrail") == 2
+
+    def failing_bias(self, main, monkeypatch, calls):
+        import httpx
+        mock_downstreams(main, monkeypatch, calls)
+
+        def handler(request):
+            calls.append("bias_guardrail")
+            return httpx.Response(500, text="modelo travado")
+
+        main.clients.set("bias_guardrail", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    def test_open_circuit_fails_fast(self, monkeypatch):
+        """Com o circuito aberto o serviço não é chamado e a resposta é 503 com Retry-After"""
+        from fastapi.testclient import TestClient
+        from app.services.breaker import BreakerPolicy, CircuitBreaker
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        monkeypatch.setitem(main.breakers, "bias_guardrail", CircuitBreaker("bias_guardrail", BreakerPolicy(2, 30)))
+        calls = []
+        self.failing_bias(main, monkeypatch, calls)
+        client = TestClient(main.app)
+
+        for _ in range(3):
+            response = client.post("/process", json={"prompt": "oi", "llm_response": "Olá."})
+            assert response.status_code == 503
+        assert calls.count("bias_guardrail") == 2
+        assert "circuito aberto" in response.json()["detail"]
+        assert response.headers["retry-after"] == "30"
+        assert client.get("/breakers/stats").json()["bias_guardrail"]["breaker"]["state"] == "open"
+
+    def test_fail_open_stage_approves_without_caching(self, monkeypatch):
+        """Etapa fail-open aprova o texto quando o serviço falha, sem guardar no cache"""
+        from fastapi.testclient import TestClient
+        from app.services.breaker import BreakerPolicy, CircuitBreaker
+        from app.services.cache import InMemoryCache, VerdictCache
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", VerdictCache(InMemoryCache()))
+        monkeypatch.setitem(main.breakers, "bias_guardrail",
+                            CircuitBreaker("bias_guardrail", BreakerPolicy(1, 30, fail_open=True)))
+        calls = []
+        self.failing_bias(main, monkeypatch, calls)
+        client = TestClient(main.app)
+
+        for _ in range(2):
+            response = client.post("/process", json={"prompt": "oi", "llm_response": "Olá."})
+            assert response.status_code == 200
+            assert response.json()["sanitized_prompt"] == "oi"
+        assert calls.count("bias_guardrail") == 1
+        assert not any(key.startswith("bias_guardrail:") for key in main.cache.backend._data)
+
+    @pytest.mark.asyncio
+    async def test_hedge_routes_around_slow_replica(self):
+        """A réplica lenta perde para a cópia enviada à outra após o atraso"""
+        import asyncio
+        from app.services.hedging import Hedger
+
+        hedger = Hedger("bias_guardrail", ["http://lenta", "http://rapida"], enabled=True,
+                        initial_delay=0.01, max_ratio=1.0)
+        cancelled = []
+
+        async def attempt(url):
+            if url == "http://lenta":
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(url)
+                    raise
+            return url
+
+        assert await hedger.run(attempt) == "http://rapida"
+        await asyncio.sleep(0)
+        assert cancelled == ["http://lenta"]
+        assert hedger.hedges == 1
+        # A réplica cancelada também entra na janela, com o tempo até o cancelamento
+        assert len(hedger.latencies) == 2
+        assert hedger.latencies.percentile(1.0) >= 0.01
+
+    @pytest.mark.asyncio
+    async def test_hedge_budget_does_not_accumulate(self):
+        """Muitas chamadas sem hedge rendem no máximo max_burst hedges de uma vez"""
+        import asyncio
+        from app.services.hedging import Hedger
+
+        hedger = Hedger("bias_guardrail", ["a", "b"], enabled=True, min_delay=0.005,
+                        initial_delay=0.005, max_ratio=0.5, max_burst=2)
+
+        async def fast(url):
+            return url
+
+        async def slow(url):
+            await asyncio.sleep(0.03)
+            return url
+
+        for _ in range(100):
+            await hedger.run(fast)
+        assert hedger.hedges == 0
+        for _ in range(4):
+            await hedger.run(slow)
+        # 2 acumulados + 0,5 por chamada: o quarto hedge ainda não tem crédito
+        assert hedger.hedges == 3
+
+    @pytest.mark.asyncio
+    async def test_replicas_rotate_and_failed_hedge_waits_for_other(self):
+        """Sem hedging as réplicas se alternam; com hedging, a falha de uma não descarta a outra"""
+        import asyncio
+        from app.services.hedging import Hedger
+
+        plain = Hedger("sanitizer", ["a", "b"])
+
+        async def echo(url):
+            return url
+
+        assert [await plain.run(echo) for _ in range(3)] == ["a", "b", "a"]
+
+        hedger = Hedger("sanitizer", ["a", "b"], enabled=True, initial_delay=0.01, max_ratio=1.0)
+
+        async def flaky(url):
+            if url == "a":
+                await asyncio.sleep(0.05)
+                return url
+            raise RuntimeError("réplica b fora")
+
+        assert await hedger.run(flaky) == "a"
+
+    @pytest.mark.asyncio
+    async def test_refused_replica_fails_over(self):
+        """Réplica que recusa a conexão passa a requisição na hora para a seguinte"""
+        import httpx
+        from app.services.hedging import Hedger
+
+        hedger = Hedger("sanitizer", ["a", "b"])
+        attempts = []
+
+        async def refused(url):
+            attempts.append(url)
+            if url == "a":
+                raise httpx.ConnectError("conexão recusada")
+            return url
+
+        assert await hedger.run(refused) == "b"
+        assert attempts == ["a", "b"]
+
+        async def broken(url):
+            attempts.append(url)
+            raise RuntimeError("resposta inválida")
+
+        attempts.clear()
+        with pytest.raises(RuntimeError):
+            await hedger.run(broken)
+        assert attempts == ["b"]
+
+        async def down(url):
+            raise httpx.ConnectError("conexão recusada")
+
+        with pytest.raises(httpx.ConnectError):
+            await hedger.run(down)
+
+
+class TestStageScheduler:
+    """Testes para o agendador de etapas em DAG"""
+
+    @pytest.mark.asyncio
+    async def test_independent_stages_run_concurrently(self):
+        """Etapas independentes rodam em paralelo"""
+        import asyncio
+        import time
+        from app.services.scheduler import Stage, run_stages
+
+        async def slow(value):
+            await asyncio.sleep(0.1)
+            return value
+
+        stages = [
+            Stage("a", lambda r: slow(1)),
+            Stage("b", lambda r: slow(r["a"] + 1), ("a",)),
+            Stage("c", lambda r: slow(3)),
+        ]
+        started = time.perf_counter()
+        results = await run_stages(stages)
+        assert results == {"a": 1, "b": 2, "c": 3}
+        assert time.perf_counter() - started < 0.3
+
+    @pytest.mark.asyncio
+    async def test_block_cancels_pending_stages(self):
+        """Um bloqueio cancela as etapas ainda em execução"""
+        import asyncio
+        from fastapi import HTTPException
+        from app.services.scheduler import Stage, run_stages
+
+        cancelled = []
+
+        async def blocked(results):
+            raise HTTPException(status_code=400, detail="bloqueado")
+
+        async def slow(results):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with pytest.raises(HTTPException):
+            await run_stages([Stage("slow", slow), Stage("blocked", blocked)])
+        assert cancelled == [True]
+
+    def test_output_check_waits_for_input_without_llm_response(self):
+        """Sem llm_response, o Output GuardRail depende da validação de entrada"""
+        from app.main import PromptRequest, pipeline_stages
+
+        stages = {s.name: s for s in pipeline_stages(PromptRequest(prompt="oi"))}
+        assert stages["output_guardrail"].deps == ("bias_guardrail",)
+        stages = {s.name: s for s in pipeline_stages(PromptRequest(prompt="oi", llm_response="olá"))}
+        assert stages["output_guardrail"].deps == ()
+
+
+class TestProcessStream:
+    """Testes para o endpoint /process_stream"""
+
+    def test_stream_validates_each_sentence(self, monkeypatch):
+        """Valida a entrada e cada sentença da resposta, emitindo eventos SSE"""
+        import json
+        import httpx
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        mock_downstreams(main, monkeypatch, [])
+        received = []
+
+        def output_handler(request):
+            prompt = json.loads(request.content)["prompt"]
+            received.append(prompt)
+            if prompt == "asdf qwer.":
+                return httpx.Response(422, json={"detail": {"valid": False, "error": "gibberish"}})
+            return httpx.Response(200, json={"valid": True, "prompt": prompt})
+
+        main.clients.set("output_guardrail", httpx.AsyncClient(transport=httpx.MockTransport(output_handler)))
+        client = TestClient(main.app)
+        response = client.post("/process_stream", json={"prompt": "oi", "llm_response": "Tudo bem. Até logo."})
+
+        assert response.status_code == 200
+        assert received == ["Tudo bem.", "Até logo."]
+        assert response.text.startswith("event: prompt\n")
+        assert response.text.count("event: sentence") == 2
+        assert response.text.rstrip().endswith('data: {"valid": true}')
+
+        blocked = client.post("/process_stream", json={"prompt": "oi", "llm_response": "asdf qwer. Depois."})
+        assert "event: blocked" in blocked.text
+        assert "Depois." not in received
+
+    def test_first_sentence_arrives_before_last_token(self, monkeypatch):
+        """A primeira sentença é emitida antes de o LLM produzir o último token"""
+        import asyncio
+        import json
+        import httpx
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        mock_downstreams(main, monkeypatch, [])
+
+        def output_handler(request):
+            return httpx.Response(200, json={"valid": True, "prompt": json.loads(request.content)["prompt"]})
+
+        main.clients.set("output_guardrail", httpx.AsyncClient(transport=httpx.MockTransport(output_handler)))
+
+        async def run():
+            released = asyncio.Event()
+
+            async def tokens(text):
+                yield b"Primeira frase. "
+                yield b"Segunda "
+                await released.wait()
+                yield b"frase."
+
+            monkeypatch.setattr(main, "llm_tokens", tokens)
+            response = await main.process_prompt_stream(main.PromptRequest(prompt="oi", llm_response="x"))
+            events = response.body_iterator
+            assert (await anext(events)).startswith("event: prompt")
+            first = await asyncio.wait_for(anext(events), timeout=2)
+            assert "Primeira frase." in first
+            released.set()
+            rest = [event async for event in events]
+            assert "Segunda frase." in rest[0]
+            assert rest[-1].startswith("event: done")
+
+        asyncio.run(run())
+
+    def test_stream_input_block_returns_http_error(self, monkeypatch):
+        """Bloqueio na entrada continua sendo um erro HTTP"""
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        mock_downstreams(main, monkeypatch, [], bias_valid=False)
+        response = TestClient(main.app).post("/process_stream", json={"prompt": "x"})
+        assert response.status_code == 400
+
+
+class TestBulkScreening:
+    """Testes para a triagem em lote"""
+
+    @staticmethod
+    async def fake_screen(record):
+        if "error" in record:
+            return {"line": record["line"], "allowed": False}
+        return {"line": record["line"], "allowed": "bomb" not in record["prompt"]}
+
+    def test_bulk_endpoint_streams_ordered_verdicts(self, monkeypatch):
+        """O endpoint devolve um veredicto por linha, na ordem da entrada"""
+        import json
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        mock_downstreams(main, monkeypatch, [])
+        body = '{"prompt": "oi"}\n\n{"prompt": "tudo bem?"}\nnão é json\n'
+        response = TestClient(main.app).post("/process_bulk", content=body)
+
+        verdicts = [json.loads(line) for line in response.text.splitlines()]
+        # Linhas em branco contam na numeração, como em app.screen
+        assert [v["line"] for v in verdicts] == [1, 3, 4]
+        assert [v["allowed"] for v in verdicts] == [True, True, False]
+        assert verdicts[0]["sanitized_prompt"] == "oi"
+
+    @pytest.mark.asyncio
+    async def test_unexpected_error_becomes_verdict(self, monkeypatch):
+        """Um erro de conexão vira o veredicto do registro em vez de interromper o lote"""
+        import httpx
+        import app.main as main
+
+        async def fail(req):
+            raise httpx.ConnectError("connection refused")
+
+        monkeypatch.setattr(main, "process_prompt", fail)
+        verdict = await main.screen_record({"line": 1, "id": "a", "prompt": "oi"})
+        assert verdict["allowed"] is False
+        assert verdict["status_code"] == 503
+        assert verdict["line"] == 1
+
+    @pytest.mark.asyncio
+    async def test_screen_file_resumes_from_checkpoint(self, tmp_path):
+        """Retomar a partir do checkpoint não repete nem perde registros"""
+        import json
+        from app.screen import screen_file, write_checkpoint
+
+        source = tmp_path / "in.jsonl"
+        output = tmp_path / "out.jsonl"
+        source.write_text("".join(json.dumps({"prompt": f"p{i}"}) + "\n" for i in range(5)) +
+                          json.dumps({"prompt": "bomb"}) + "\n")
+
+        assert await screen_file(str(source), str(output), self.fake_screen, concurrency=2, checkpoint_every=2) == 6
+        complete = output.read_text()
+
+        # Simula uma interrupção após o checkpoint do segundo registro, com lixo parcial na saída
+        lines = complete.splitlines(keepends=True)
+        output.write_text("".join(lines[:2]) + '{"parcial')
+        offset = len(open(source, "rb").readline()) * 2
+        write_checkpoint(str(output) + ".ckpt", {
+            "input_offset": offset, "output_offset": len("".join(lines[:2]).encode()), "line": 2, "records": 2
+        })
+
+        assert await screen_file(str(source), str(output), self.fake_screen, resume=True) == 6
+        assert output.read_text() == complete
+        assert json.loads(complete.splitlines()[-1]) == {"line": 6, "allowed": False}
+
+
+class TestMetrics:
+    """Testes para o endpoint /metrics"""
+
+    def test_metrics_exposes_route_and_stage_latency(self, monkeypatch):
+        """Registra latência por rota, por etapa e do pipeline"""
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        mock_downstreams(main, monkeypatch, [])
+        client = TestClient(main.app)
+        client.post("/process", json={"prompt": "oi"})
+
+        body = client.get("/metrics").text
+        assert 'http_requests_total{method="POST",outcome="success",route="/process"}' in body
+        assert 'orchestrator_downstream_duration_seconds_count{outcome="success",stage="bias_guardrail"}' in body
+        assert 'orchestrator_pipeline_duration_seconds_count{outcome="success"}' in body
+
+
+class TestTracing:
+    """Testes para a propagação de trace context (W3C)"""
+
+    def test_traceparent_propagated_to_downstreams(self, monkeypatch):
+        """O trace id recebido chega a todos os serviços e volta na resposta"""
+        import httpx
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        mock_downstreams(main, monkeypatch, [])
+        seen = []
+
+        async def record(request):
+            seen.append(request.headers.get("traceparent"))
+
+        for service in main.clients.services:
+            main.clients.get(service).event_hooks["request"].append(record)
+
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+        response = TestClient(main.app).post(
+            "/process",
+            json={"prompt": "oi"},
+            headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["x-trace-id"] == trace_id
+        assert len(seen) == 4
+        assert all(header and header.split("-")[1] == trace_id for header in seen)
+
+    def test_trace_started_without_incoming_traceparent(self, monkeypatch):
+        """Sem traceparent na requisição um trace novo é criado e propagado (exportador none)"""
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "cache", None)
+        mock_downstreams(main, monkeypatch, [])
+        seen = []
+
+        async def record(request):
+            seen.append(request.headers.get("traceparent"))
+
+        for service in main.clients.services:
+            main.clients.get(service).event_hooks["request"].append(record)
+
+        response = TestClient(main.app).post("/process", json={"prompt": "oi"})
+
+        assert response.status_code == 200
+        trace_id = response.headers["x-trace-id"]
+        assert trace_id != "0" * 32
+        assert len(seen) == 4
+        assert all(header and header.split("-")[1] == trace_id for header in seen)
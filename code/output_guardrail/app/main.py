@@ -1,9 +1,110 @@
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from guardrails.hub import GibberishText
 from guardrails import Guard
+from guardrails.errors import ValidationError
+
+from app.services.metrics import (
+    BATCH_SIZE,
+    INFERENCE_LATENCY,
+    POOL_PENDING,
+    SENTENCE_CACHE,
+    SENTENCE_CACHE_SIZE,
+    instrument,
+)
+from app.services.onnx_backend import backend_from_env, use_onnx
+from app.services.pool import PoolSaturated, pool_from_env
+from app.services.tracing import setup_tracing
+from app.services.sentence_cache import sentence_cache_from_env
+from app.services.sentences import SentenceBuffer, sse_event, validator_sentences
+
+logger = logging.getLogger(__name__)
+
+RETRY_AFTER_SECONDS = os.getenv("RETRY_AFTER_SECONDS", "1")
+THRESHOLD = 0.5
+
+# INFERENCE_BACKEND=onnx troca o PyTorch pelo ONNX Runtime (modelo int8); ver onnx_backend.py
+backend = backend_from_env()
+
+# Pool limitado para a inferência, fora do event loop
+pool = pool_from_env()
+POOL_PENDING.set_function(lambda: pool.pending)
+
+# Veredicto por sentença: respostas de LLM repetem muito texto (saudações, avisos)
+sentence_cache = sentence_cache_from_env()
+SENTENCE_CACHE_SIZE.set_function(lambda: len(sentence_cache) if sentence_cache is not None else 0)
+
+# Guard (e o modelo por trás dele) é criado uma única vez e reutilizado entre requisições
+guard: Guard | None = None
+# Carregado no processo mestre do gunicorn antes do fork (ver gunicorn.conf.py)
+preloaded: Guard | None = None
+
+def build_validator(use_backend: bool = True, use_local: bool | None = None) -> GibberishText:
+    """
+    `use_local` força o modelo local mesmo com a inferência remota configurada
+    (`guardrails configure --enable-remote-inferencing` na imagem). O backend
+    ONNX troca o pipeline local do validador, então sempre o exige.
+    """
+    if use_backend and backend is not None:
+        use_local = True
+    local = {} if use_local is None else {"use_local": use_local}
+    validator = GibberishText(threshold=THRESHOLD, validation_method="sentence", on_fail="exception", **local)
+    if use_backend and backend is not None:
+        use_onnx(validator, backend)
+    return validator
+
+def build_guard(gibberish_validator: GibberishText | None = None) -> Guard:
+    return Guard().use(
+        gibberish_validator or build_validator()
+    )
+
+def preload_guard():
+    """
+    Carrega os pesos antes do fork para que os workers os compartilhem copy-on-write.
+    O aquecimento fica para cada worker: inferência no processo mestre inicia os
+    pools de threads do PyTorch/OpenMP, que não sobrevivem ao fork.
+    """
+    global preloaded
+    try:
+        preloaded = build_guard()
+    except Exception:
+        logger.exception("Falha ao pré-carregar o modelo; cada worker carregará o seu")
+
+def load_guard():
+    """Cria o guard (ou usa o pré-carregado) e faz uma inferência de aquecimento."""
+    global guard
+    if preloaded is not None:
+        new_guard = preloaded
+    else:
+        try:
+            new_guard = build_guard()
+        except Exception:
+            logger.exception("Falha ao carregar o modelo; o serviço continuará não pronto")
+            return
+    try:
+        new_guard.validate("Azure is a cloud computing service created by Microsoft.")
+    except Exception:
+        # Falha de validação no aquecimento não impede o uso do modelo
+        logger.warning("Aquecimento do GibberishText não aprovou o texto de exemplo")
+    guard = new_guard
 
-app = FastAPI(title="Output GuardRail Microservice")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Carrega em segundo plano para que / responda enquanto o modelo aquece
+    loading = asyncio.create_task(asyncio.to_thread(load_guard))
+    yield
+    loading.cancel()
+    pool.shutdown()
+
+app = FastAPI(title="Output GuardRail Microservice", lifespan=lifespan)
+instrument(app)
+tracer = setup_tracing(app, "output_guardrail")
 
 class PromptRequest(BaseModel):
     prompt: str
@@ -12,27 +113,136 @@ class PromptRequest(BaseModel):
 def root():
     return {"message": "Output GuardRail running", "status": "healthy"}
 
+@app.get("/ready")
+def ready():
+    """Readiness: só fica pronto depois que o modelo foi carregado e aquecido."""
+    if guard is None:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready"}
+
 @app.post("/validate")
 async def validate(data: PromptRequest):
+    if guard is None:
+        raise HTTPException(status_code=503, detail="Modelo ainda carregando")
     try:
-        output = validate_prompt(data.prompt)
+        output = await pool.run(validate_prompt, data.prompt)
         return {
             "valid": True,
             "prompt": output
         }
-    except Exception as e:
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Serviço sobrecarregado, tente novamente",
+            headers={"Retry-After": RETRY_AFTER_SECONDS}
+        )
+    except ValidationError as e:
+        # Só a reprovação pelo validador vira 422; falhas do modelo ou do pool viram 5xx
         raise HTTPException(
             status_code=422,
             detail={"valid": False, "error": str(e)}
         )
 
-def validate_prompt(prompt: str):
-    guard = Guard().use(
-        GibberishText, threshold=0.5, validation_method="sentence", on_fail="exception"
-    )
+async def validate_sentences(chunks):
+    """
+    Valida uma resposta de LLM recebida aos pedaços. Cada sentença é validada assim
+    que termina e, se aprovada, devolvida na hora como evento SSE `sentence`. Uma
+    sentença reprovada encerra o stream com o evento `blocked`; ao final de uma
+    resposta aprovada vem o evento `done`.
+    """
+    buffer = SentenceBuffer()
 
-    validated = guard.validate(prompt)
-    return validated.validated_output
+    async def check(sentence: str) -> tuple[str, bool]:
+        try:
+            output = await pool.run(validate_prompt, sentence)
+        except PoolSaturated:
+            return sse_event("error", {"valid": False, "error": "Serviço sobrecarregado, tente novamente"}), False
+        except ValidationError as e:
+            return sse_event("blocked", {"valid": False, "error": str(e)}), False
+        except Exception:
+            logger.exception("Falha ao validar a sentença")
+            return sse_event("error", {"valid": False, "error": "Falha na validação, tente novamente"}), False
+        return sse_event("sentence", {"valid": True, "sentence": output}), True
+
+    async for chunk in chunks:
+        for sentence in buffer.feed(chunk):
+            event, ok = await check(sentence)
+            yield event
+            if not ok:
+                return
+    for sentence in buffer.flush():
+        event, ok = await check(sentence)
+        yield event
+        if not ok:
+            return
+    yield sse_event("done", {"valid": True})
 
+class SentenceStreamEndpoint:
+    """
+    POST /validate_stream: corpo chunked com os tokens (texto puro), resposta SSE.
+    É um endpoint ASGI puro porque o StreamingResponse do Starlette consome as
+    mensagens de `receive` para detectar desconexão, e aqui o corpo precisa ser
+    lido enquanto a resposta já está sendo enviada.
+    """
 
+    async def __call__(self, scope, receive, send):
+        if guard is None:
+            response = JSONResponse(status_code=503, content={"detail": "Modelo ainda carregando"})
+            await response(scope, receive, send)
+            return
+
+        async def body_chunks():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                yield message.get("body", b"")
+                if not message.get("more_body", False):
+                    return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+        })
+        async for event in validate_sentences(body_chunks()):
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+app.router.add_route("/validate_stream", SentenceStreamEndpoint(), methods=["POST"])
+
+def guard_validate(text: str):
+    """Chama o modelo. Levanta exceção se o texto for considerado gibberish."""
+    BATCH_SIZE.labels("gibberish_text").observe(1)
+    with tracer.start_as_current_span("inference gibberish_text"), INFERENCE_LATENCY.labels("gibberish_text").time():
+        validated = (guard or build_guard()).validate(text)
+    return validated.validated_output
+
+def validate_prompt(prompt: str):
+    """
+    Valida o texto sentença a sentença, consultando o cache antes do modelo:
+    só sentenças ainda não vistas são enviadas ao GibberishText. As sentenças são
+    as do próprio validador, então o texto aprovado sentença a sentença é o mesmo
+    que o guard aprovaria; se alguma foi reprovada, o guard roda no texto completo
+    para gerar a mesma mensagem de erro. Só reprovações do validador
+    (ValidationError) vão para o cache; outras falhas (modelo, pool) são
+    propagadas sem virar veredicto. Acertos e erros do cache são contados em
+    SENTENCE_CACHE.
+    """
+    sentences = validator_sentences(prompt) if sentence_cache is not None else None
+    if not sentences:
+        return guard_validate(prompt)
 
+    for sentence in sentences:
+        valid = sentence_cache.get(sentence)
+        SENTENCE_CACHE.labels("miss" if valid is None else "hit").inc()
+        if valid is None:
+            try:
+                guard_validate(sentence)
+                valid = True
+            except ValidationError:
+                valid = False
+            sentence_cache.set(sentence, valid)
+        if not valid:
+            return guard_validate(prompt)
+    return prompt
@@ -0,0 +1,57 @@
+"""
+Confere se o backend ONNX (int8) dá os mesmos veredictos que o PyTorch.
+
+    python -m app.onnx_parity
+    python -m app.onnx_parity --examples prompts.txt --min-agreement 0.99
+
+Roda o mesmo corpus pelo GibberishText original e pelo exportado para ONNX (com as
+configurações ONNX_* do ambiente), mostra a concordância e a latência média de
+cada um e termina com código 1 se a concordância ficar abaixo do mínimo.
+"""
+import argparse
+import json
+import sys
+
+from app.main import build_guard, build_validator
+from app.services.onnx_backend import onnx_settings_from_env, parity_report, use_onnx
+
+# Corpus padrão: respostas limpas e texto sem sentido, em inglês (língua do modelo) e português
+DEFAULT_TEXTS = [
+    "Azure is a cloud computing service created by Microsoft.",
+    "It's a significant competitor to AWS.",
+    "The meeting was moved to Thursday afternoon.",
+    "Photosynthesis converts light energy into chemical energy.",
+    "Please restart the server after applying the update.",
+    "The quick brown fox jumps over the lazy dog.",
+    "O serviço está disponível em todas as regiões.",
+    "Obrigado pelo contato, retornaremos em breve.",
+    "asdkjh qweoiu zxcmnb lkjhasd poiuqwe.",
+    "Floor tomato purple seven the running.",
+    "xkq zzv bnmqw rtyp lkjz.",
+    "Banana the of if when purple jumping quickly sky.",
+    "jjjjj kkkkk lllll mmmmm.",
+    "qwerty uiop asdf ghjkl zxcvbnm.",
+]
+
+
+def read_texts(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Paridade entre os backends PyTorch e ONNX do GibberishText")
+    parser.add_argument("--examples", help="arquivo com um texto por linha (padrão: corpus embutido)")
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args(argv)
+
+    texts = read_texts(args.examples) if args.examples else DEFAULT_TEXTS
+    reference = build_guard(build_validator(use_backend=False, use_local=True))
+    candidate = build_guard(use_onnx(build_validator(use_backend=False, use_local=True), onnx_settings_from_env()))
+    report = parity_report(texts, reference, candidate)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["agreement"] >= args.min_agreement else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolSaturated(Exception):
+    """Todos os workers ocupados e a fila de espera cheia."""
+
+
+class InferencePool:
+    """
+    Executa a inferência (síncrona e pesada em CPU) fora do event loop, em um
+    pool de threads limitado. O PyTorch libera o GIL durante a inferência,
+    então threads bastam e o modelo é compartilhado sem cópias.
+
+    No máximo `workers + queue_depth` chamadas ficam pendentes; acima disso
+    `run` falha imediatamente com PoolSaturated em vez de esperar até o timeout.
+    """
+
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    async def run(self, fn, *args):
+        if self.pending >= self.capacity:
+            raise PoolSaturated(f"{self.pending} inferências pendentes (limite {self.capacity})")
+        self.pending += 1
+        try:
+            # Copia o contexto (trace atual) para a thread do worker
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def pool_from_env() -> InferencePool:
+    return InferencePool(
+        workers=int(os.getenv("INFERENCE_WORKERS", "2")),
+        queue_depth=int(os.getenv("INFERENCE_QUEUE_DEPTH", "32")),
+    )
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+
+class SentenceCache:
+    """
+    Cache LRU com TTL do veredicto do modelo por sentença (hash SHA-256 → aprovada?).
+    É acessado pelas threads do pool de inferência, por isso usa um lock.
+    """
+
+    def __init__(self, max_entries: int = 50000, ttl: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self._data: OrderedDict[bytes, tuple[float, bool]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    @staticmethod
+    def key(sentence: str) -> bytes:
+        return hashlib.sha256(sentence.encode("utf-8")).digest()
+
+    def get(self, sentence: str) -> bool | None:
+        key = self.key(sentence)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, sentence: str, valid: bool):
+        key = self.key(sentence)
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, valid)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+
+def sentence_cache_from_env() -> SentenceCache | None:
+    """SENTENCE_CACHE_MAX_ENTRIES=0 desliga o cache."""
+    max_entries = int(os.getenv("SENTENCE_CACHE_MAX_ENTRIES", "50000"))
+    if max_entries <= 0:
+        return None
+    return SentenceCache(max_entries, float(os.getenv("SENTENCE_CACHE_TTL", "3600")))
@@ -0,0 +1,58 @@
+import codecs
+import json
+import re
+
+# Fim de sentença: ., ! ou ? seguidos de espaço, ou quebra de linha
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class SentenceBuffer:
+    """
+    Acumula tokens de uma resposta em streaming e libera sentenças completas
+    assim que o limite de sentença chega. O que sobra é liberado em `flush`.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, chunk: bytes | str) -> list[str]:
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        self._buffer += chunk
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(self._buffer):
+            # Um limite no fim do buffer pode ser só parte do espaço; espera mais texto
+            if match.end() == len(self._buffer) and not match.group(0).endswith("\n"):
+                break
+            sentence = self._buffer[start:match.start()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> list[str]:
+        rest = (self._buffer + self._decoder.decode(b"", final=True)).strip()
+        self._buffer = ""
+        return [rest] if rest else []
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Formata um evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def validator_sentences(text: str) -> list[str] | None:
+    """
+    Quebra o texto nas mesmas sentenças que o GibberishText valida com
+    validation_method="sentence" (nltk.sent_tokenize). Retorna None se o nltk ou
+    os dados do tokenizador não estiverem disponíveis: com outro tokenizador o
+    veredicto por sentença poderia divergir do veredicto do guard.
+    """
+    try:
+        import nltk
+        return nltk.sent_tokenize(text)
+    except (ImportError, LookupError):
+        return None
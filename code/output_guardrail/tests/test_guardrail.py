@@ -0,0 +1,276 @@
+import pytest
+
+
+def fake_tokenizer(text):
+    """Tokenizador de sentenças do validador falso (diferente do regex do streaming)"""
+    return [part.strip() + ";" for part in text.split(";") if part.strip()]
+
+
+class FakeGibberishGuard:
+    """Guard com validation_method="sentence": reprova se alguma sentença do validador for gibberish"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text):
+        self.calls.append(text)
+        bad = [s for s in fake_tokenizer(text) if "asdf" in s]
+        if bad:
+            from guardrails.errors import ValidationError
+            raise ValidationError(f"Sentenças gibberish: {bad}")
+        return text
+
+
+def cache_count(result):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value("gibberish_sentence_cache_total", {"result": result}) or 0
+
+
+class TestSentenceCache:
+    """Testes para o cache de veredictos por sentença"""
+
+    @pytest.fixture
+    def fake_guard(self, monkeypatch):
+        import app.main as main
+        from app.services.sentence_cache import SentenceCache
+
+        guard = FakeGibberishGuard()
+        monkeypatch.setattr(main, "guard_validate", guard)
+        monkeypatch.setattr(main, "validator_sentences", fake_tokenizer)
+        monkeypatch.setattr(main, "sentence_cache", SentenceCache())
+        return guard
+
+    def verdict(self, text):
+        import app.main as main
+        try:
+            return True, main.validate_prompt(text)
+        except Exception as e:
+            return False, str(e)
+
+    def test_cached_and_uncached_verdicts_match(self, fake_guard, monkeypatch):
+        """O caminho com cache dá o mesmo veredicto e a mesma saída do guard no texto completo"""
+        import app.main as main
+
+        texts = [
+            "Tudo bem; até logo",
+            "Mr. Smith foi embora. asdf qwer; tchau",
+            "asdf; Tudo bem",
+            "Tudo bem; até logo",
+            "Dr. Silva chegou; asdf",
+        ]
+        cached = [self.verdict(text) for text in texts]
+        monkeypatch.setattr(main, "sentence_cache", None)
+        uncached = [self.verdict(text) for text in texts]
+        assert cached == uncached
+        assert [ok for ok, _ in cached] == [True, False, False, True, False]
+
+    def test_only_unseen_sentences_reach_the_model(self, fake_guard):
+        """Sentenças repetidas são respondidas pelo cache e cada consulta é contada uma vez"""
+        hits, misses = cache_count("hit"), cache_count("miss")
+
+        assert self.verdict("Olá; Tudo bem") == (True, "Olá; Tudo bem")
+        assert fake_guard.calls == ["Olá;", "Tudo bem;"]
+        assert (cache_count("hit") - hits, cache_count("miss") - misses) == (0, 2)
+
+        assert self.verdict("Tudo bem; Olá") == (True, "Tudo bem; Olá")
+        assert fake_guard.calls == ["Olá;", "Tudo bem;"]
+        assert (cache_count("hit") - hits, cache_count("miss") - misses) == (2, 2)
+
+    def test_rejection_runs_guard_on_full_text(self, fake_guard):
+        """Uma sentença reprovada gera a mensagem de erro do guard no texto completo"""
+        ok, error = self.verdict("Olá; asdf")
+        assert not ok
+        assert "asdf;" in error
+        assert fake_guard.calls == ["Olá;", "asdf;", "Olá; asdf"]
+
+        # Reprovada de novo direto do cache: o modelo só roda no texto completo
+        ok, _ = self.verdict("asdf")
+        assert not ok
+        assert fake_guard.calls[3:] == ["asdf"]
+
+    def test_without_validator_tokenizer_uses_full_guard(self, fake_guard, monkeypatch):
+        """Sem o tokenizador do validador (nltk ausente) o cache não é usado"""
+        import app.main as main
+
+        monkeypatch.setattr(main, "validator_sentences", lambda text: None)
+        assert self.verdict("Olá; Tudo bem") == (True, "Olá; Tudo bem")
+        assert fake_guard.calls == ["Olá; Tudo bem"]
+        assert len(main.sentence_cache) == 0
+
+
+    def test_infrastructure_errors_are_not_cached(self, fake_guard, monkeypatch):
+        """Falha do modelo (não uma reprovação) é propagada e não vira veredicto no cache"""
+        import app.main as main
+
+        def broken(text):
+            raise RuntimeError("modelo indisponível")
+
+        monkeypatch.setattr(main, "guard_validate", broken)
+        with pytest.raises(RuntimeError):
+            main.validate_prompt("Olá; Tudo bem")
+        assert len(main.sentence_cache) == 0
+
+        monkeypatch.setattr(main, "guard_validate", fake_guard)
+        assert self.verdict("Olá; Tudo bem") == (True, "Olá; Tudo bem")
+
+    def test_validate_route_maps_only_rejections_to_422(self, fake_guard, monkeypatch):
+        """Reprovação responde 422; falha do modelo responde 5xx"""
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "guard", object())
+        client = TestClient(main.app, raise_server_exceptions=False)
+        assert client.post("/validate", json={"prompt": "Olá; asdf"}).status_code == 422
+
+        def broken(text):
+            raise RuntimeError("modelo indisponível")
+
+        monkeypatch.setattr(main, "guard_validate", broken)
+        assert client.post("/validate", json={"prompt": "Tudo certo; até"}).status_code == 500
+        assert len(main.sentence_cache) == 2
+
+
+class TestValidatorSentences:
+    """Testes para o tokenizador de sentenças do GibberishText"""
+
+    def test_matches_nltk(self):
+        nltk = pytest.importorskip("nltk")
+        from app.services.sentences import validator_sentences
+        try:
+            expected = nltk.sent_tokenize("Mr. Smith went home. Then he slept.")
+        except LookupError:
+            pytest.skip("dados do tokenizador punkt não instalados")
+        assert validator_sentences("Mr. Smith went home. Then he slept.") == expected
+
+
+class FakeInput:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeSession:
+    """Sessão do ONNX Runtime que devolve logits fixos, um por texto do lote"""
+
+    def __init__(self, logits):
+        self.logits = logits
+        self.feeds = []
+
+    def get_inputs(self):
+        return [FakeInput("input_ids"), FakeInput("attention_mask")]
+
+    def run(self, names, feed):
+        self.feeds.append(feed)
+        return [self.logits[: len(feed["input_ids"])]]
+
+
+def fake_onnx_tokenizer(texts, **kwargs):
+    import numpy as np
+    ids = np.ones((len(texts), 4), dtype=np.int32)
+    return {"input_ids": ids, "attention_mask": ids, "token_type_ids": ids}
+
+
+class TestOnnxBackend:
+    """Testes do classificador ONNX (sessão falsa) e da exportação atômica"""
+
+    def classifier(self):
+        import numpy as np
+        from app.services.onnx_backend import OnnxTextClassifier
+        classifier = OnnxTextClassifier("model.onnx", fake_onnx_tokenizer, {"0": "NEG", "1": "POS"})
+        classifier._session = FakeSession(np.array([[0.0, 2.0], [3.0, 0.0]], dtype=np.float32))
+        return classifier
+
+    def test_top_k_one_returns_a_dict_per_text(self):
+        """top_k=1: um dicionário por texto, mesmo para uma string"""
+        classifier = self.classifier()
+        assert [r["label"] for r in classifier(["a", "b"])] == ["POS", "NEG"]
+        single = classifier("a")
+        assert isinstance(single, list) and len(single) == 1
+        assert single[0]["label"] == "POS"
+        assert single[0]["score"] == pytest.approx(0.8808, abs=1e-4)
+        # Só as entradas que o modelo declara, em int64
+        assert set(classifier._session.feeds[0]) == {"input_ids", "attention_mask"}
+        assert classifier._session.feeds[0]["input_ids"].dtype.name == "int64"
+
+    def test_top_k_none_returns_all_labels(self):
+        """top_k=None: todos os rótulos ordenados; lista plana para uma string"""
+        classifier = self.classifier()
+        single = classifier("a", top_k=None)
+        assert [r["label"] for r in single] == ["POS", "NEG"]
+        assert sum(r["score"] for r in single) == pytest.approx(1.0)
+        batch = classifier(["a", "b"], top_k=None)
+        assert [[r["label"] for r in row] for row in batch] == [["POS", "NEG"], ["NEG", "POS"]]
+
+    def test_top_k_two_and_empty_input(self):
+        """top_k=2: uma lista por texto; entrada vazia não chama a sessão"""
+        classifier = self.classifier()
+        assert [len(row) for row in classifier(["a", "b"], top_k=2)] == [2, 2]
+        assert classifier([]) == []
+        assert classifier._session.feeds == [classifier._session.feeds[0]]
+
+    def pipe(self):
+        from types import SimpleNamespace
+        return SimpleNamespace(model=SimpleNamespace(config=SimpleNamespace(name_or_path="org/model")))
+
+    def test_export_is_atomic_and_runs_once(self, tmp_path, monkeypatch):
+        """A exportação é publicada inteira e reaproveitada; uma falha não deixa restos"""
+        from app.services import onnx_backend
+        from app.services.onnx_backend import OnnxSettings, export_onnx
+
+        exports = []
+
+        def fail(pipe, model_id, fp32_path):
+            fp32_path.write_bytes(b"parcial")
+            raise RuntimeError("export interrompido")
+
+        def export(pipe, model_id, fp32_path):
+            exports.append(fp32_path)
+            fp32_path.write_bytes(b"onnx")
+
+        settings = OnnxSettings(str(tmp_path), quantize=False, intra_op_threads=0)
+        monkeypatch.setattr(onnx_backend, "_export_fp32", fail)
+        with pytest.raises(RuntimeError):
+            export_onnx(self.pipe(), settings)
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["org__model.lock"]
+
+        monkeypatch.setattr(onnx_backend, "_export_fp32", export)
+        path = export_onnx(self.pipe(), settings)
+        assert path == tmp_path / "org__model" / "model.onnx"
+        assert path.read_bytes() == b"onnx"
+        assert export_onnx(self.pipe(), settings) == path
+        assert len(exports) == 1
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["org__model", "org__model.lock"]
+
+    def test_onnx_backend_builds_local_validator(self, tmp_path, monkeypatch):
+        """Com INFERENCE_BACKEND=onnx o validador é local, mesmo com a inferência remota configurada"""
+        import app.main as main
+        from app.services.onnx_backend import OnnxSettings
+
+        built, converted = [], []
+
+        class Validator:
+            def __init__(self, **kwargs):
+                built.append(kwargs)
+
+        monkeypatch.setattr(main, "GibberishText", Validator)
+        monkeypatch.setattr(main, "use_onnx", lambda validator, settings: converted.append(settings))
+        monkeypatch.setattr(main, "backend", OnnxSettings(str(tmp_path), quantize=True, intra_op_threads=0))
+        main.build_validator()
+        assert built[-1]["use_local"] is True
+        assert converted == [main.backend]
+
+        monkeypatch.setattr(main, "backend", None)
+        main.build_validator()
+        assert "use_local" not in built[-1]
+        main.build_validator(use_backend=False, use_local=True)
+        assert built[-1]["use_local"] is True
+        assert len(converted) == 1
+
+    def test_onnx_backend_matches_other_service(self):
+        """onnx_backend.py é o mesmo arquivo em bias_guardrail e output_guardrail"""
+        from pathlib import Path
+        services = Path(__file__).resolve().parents[2]
+        other = services / "bias_guardrail" / "app" / "services" / "onnx_backend.py"
+        if not other.exists():
+            pytest.skip("cópia do outro serviço não disponível (imagem do serviço)")
+        mine = services / "output_guardrail" / "app" / "services" / "onnx_backend.py"
+        assert mine.read_text(encoding="utf-8") == other.read_text(encoding="utf-8")
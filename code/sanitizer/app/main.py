@@ -1,9 +1,13 @@
 from fastapi import FastAPI
 from app.routers import sanitize
+from app.services.metrics import instrument
+from app.services.tracing import setup_tracing
 
 app = FastAPI(title="Sanitizer API")
 
 app.include_router(sanitize.router)
+instrument(app)
+setup_tracing(app, "sanitizer")
 
 @app.get("/")
 def root():
@@ -0,0 +1,104 @@
+import re
+import unicodedata
+
+# Code points com a propriedade Default_Ignorable_Code_Point (DerivedCoreProperties.txt):
+# zero-width, controles bidi, soft hyphen, seletores de variação, tag characters, etc.
+DEFAULT_IGNORABLE_RANGES = (
+    (0x00AD, 0x00AD),
+    (0x034F, 0x034F),
+    (0x061C, 0x061C),
+    (0x115F, 0x1160),
+    (0x17B4, 0x17B5),
+    (0x180B, 0x180F),
+    (0x200B, 0x200F),
+    (0x202A, 0x202E),
+    (0x2060, 0x206F),
+    (0x3164, 0x3164),
+    (0xFE00, 0xFE0F),
+    (0xFEFF, 0xFEFF),
+    (0xFFA0, 0xFFA0),
+    (0xFFF0, 0xFFF8),
+    (0x1BCA0, 0x1BCA3),
+    (0x1D173, 0x1D17A),
+    (0xE0000, 0xE0FFF),
+)
+
+# Homoglifos de letras latinas (subconjunto de confusables.txt do UTS #39) que o
+# NFKC não resolve: cirílico, grego, armênio e alguns símbolos do IPA.
+CONFUSABLES = {
+    # cirílico
+    "а": "a", "в": "b", "е": "e", "һ": "h", "і": "i", "ј": "j", "ӏ": "l",
+    "о": "o", "р": "p", "ԛ": "q", "с": "c", "ѕ": "s", "у": "y", "ԝ": "w",
+    "х": "x", "ԁ": "d", "ү": "y",
+    "А": "A", "В": "B", "Е": "E", "Н": "H", "І": "I", "Ј": "J", "К": "K",
+    "М": "M", "О": "O", "Р": "P", "Ԛ": "Q", "С": "C", "Ѕ": "S", "Т": "T",
+    "Х": "X", "Ү": "Y", "Ԝ": "W", "Ӏ": "I",
+    # grego
+    "α": "a", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "υ": "u",
+    "χ": "x", "γ": "y",
+    "Α": "A", "Β": "B", "Ε": "E", "Ζ": "Z", "Η": "H", "Ι": "I", "Κ": "K",
+    "Μ": "M", "Ν": "N", "Ο": "O", "Ρ": "P", "Τ": "T", "Υ": "Y", "Χ": "X",
+    # armênio
+    "օ": "o", "ս": "u", "հ": "h", "ց": "g", "ք": "f",
+    # latim estendido / IPA
+    "ı": "i", "ɑ": "a", "ɡ": "g", "ɩ": "i", "ʏ": "y",
+}
+
+
+def build_translation_table() -> dict[int, str | None]:
+    """
+    Monta a tabela para `str.translate` que, numa única passada, remove os
+    caracteres ignoráveis e troca homoglifos pela letra latina equivalente.
+    Os ignoráveis mapeiam para None; os demais itens são os homoglifos.
+
+    Letras acentuadas sobre um homoglifo (ё, ά) e caracteres de compatibilidade
+    que o NFKC transformaria em homoglifo (𝚨 → Α) também entram na tabela, já
+    decompostos e dobrados; o NFKC aplicado depois recompõe os acentos.
+    """
+    table: dict[int, str | None] = {}
+    for start, end in DEFAULT_IGNORABLE_RANGES:
+        for cp in range(start, end + 1):
+            table[cp] = None
+    table.update({ord(char): latin for char, latin in CONFUSABLES.items()})
+
+    for cp in range(0x80, 0x20000):
+        if cp in table:
+            continue
+        char = chr(cp)
+        decomposed = unicodedata.normalize("NFKD", char)
+        if decomposed != char and any(ord(c) in table for c in decomposed):
+            table[cp] = decomposed.translate(table)
+    return table
+
+
+def char_class(code_points) -> str:
+    """Classe de caracteres de regex com os code points agrupados em faixas."""
+    ranges = []
+    for cp in sorted(code_points):
+        if ranges and cp == ranges[-1][1] + 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    parts = [
+        re.escape(chr(start)) if start == end else f"{re.escape(chr(start))}-{re.escape(chr(end))}"
+        for start, end in ranges
+    ]
+    return "[" + "".join(parts) + "]"
+
+
+def ignorable_code_points() -> list[int]:
+    """Code points com a propriedade Default_Ignorable_Code_Point."""
+    return [cp for start, end in DEFAULT_IGNORABLE_RANGES for cp in range(start, end + 1)]
+
+
+def is_latin_letter(char: str) -> bool:
+    """Letra latina, inclusive acentuada, de largura total ou matemática (𝐁)."""
+    if not char.isalpha():
+        return False
+    base = unicodedata.normalize("NFKD", char)[:1]
+    return (base.isascii() and base.isalpha()) or "LATIN" in unicodedata.name(char, "")
+
+
+def latin_letter_code_points(exclude=()) -> list[int]:
+    """Code points das letras latinas (ver `is_latin_letter`) fora de `exclude`."""
+    return [cp for cp in range(0x20000) if cp not in exclude and is_latin_letter(chr(cp))]
@@ -1,7 +1,120 @@
 import unicodedata
 import re
 
+from .confusables import build_translation_table, char_class, ignorable_code_points, latin_letter_code_points
+
+MAX_LENGTH = 3000
+# Entrada lida no máximo: o que passa disso nunca chegaria à saída, a não ser que
+# mais de 7/8 do início sumisse na limpeza (ignoráveis, composição do NFKC)
+MAX_INPUT_LENGTH = 8 * MAX_LENGTH
+
+# Montada uma vez na importação: homoglifo → letra latina equivalente
+HOMOGLYPHS = {cp: latin for cp, latin in build_translation_table().items() if latin is not None}
+# Para `str.translate`, cada caractere ausente da tabela custa um KeyError;
+# mapear o latim para si mesmo deixa a tradução das palavras quase 2x mais rápida
+FOLD_TABLE = {cp: cp for cp in range(0x250) if cp not in HOMOGLYPHS} | HOMOGLYPHS
+
+ASTRAL = re.compile('[\U00010000-\U0010ffff]')
+# Fronteiras de palavra: espaço, pontuação e dígitos ASCII e ideogramas CJK
+WORD_SEPARATORS = r'\s!-@\[-`{-~\u4e00-\u9fff'
+
+
+def _patterns(bmp_only: bool) -> tuple[re.Pattern, ...]:
+    """
+    (homoglifos, letras latinas, outros caracteres de palavra, palavras só de
+    homoglifos, palavras mistas). Classes só com o plano básico viram
+    bitmaps no `re` e são bem mais rápidas; as completas só são usadas quando o
+    texto tem caracteres fora dele (raro).
+    """
+    def cls(code_points):
+        return char_class(cp for cp in code_points if not bmp_only or cp <= 0xFFFF)
+
+    homoglyph = cls(HOMOGLYPHS)
+    latin = cls(latin_letter_code_points(exclude=HOMOGLYPHS))
+    return (
+        re.compile(homoglyph),
+        re.compile(latin),
+        re.compile(f'[^{WORD_SEPARATORS}{latin[1:-1]}{homoglyph[1:-1]}]'),
+        re.compile(f'(?<![^{WORD_SEPARATORS}]){homoglyph}+(?![^{WORD_SEPARATORS}])'),
+        re.compile(
+            f'(?<![^{WORD_SEPARATORS}])(?=[^{WORD_SEPARATORS}]*?{homoglyph})(?=[^{WORD_SEPARATORS}]*?{latin})'
+            f'[^{WORD_SEPARATORS}]+'
+        ),
+    )
+
+
+PATTERNS_BMP = _patterns(bmp_only=True)
+PATTERNS_FULL = _patterns(bmp_only=False)
+IGNORABLE = re.compile(char_class(cp for cp in ignorable_code_points() if cp <= 0xFFFF))
+# Tag characters e afins: removidos antes de escolher as classes, para que um
+# texto com eles não caia nas classes completas só por causa deles
+IGNORABLE_ASTRAL = re.compile(char_class(cp for cp in ignorable_code_points() if cp > 0xFFFF))
+
+# Caracteres que nunca se combinam com o que vem antes nem mudam com o NFKC
+# (ASCII e ideogramas CJK): cortar o texto logo antes de um deles não altera
+# a normalização do trecho anterior, nem a dobra das palavras anteriores.
+SAFE_BOUNDARY = re.compile(r'[\x00-\x7f\u4e00-\u9fff][^\x00-\x7f\u4e00-\u9fff]*\Z')
+
+
+def _is_latin1(text: str) -> bool:
+    try:
+        text.encode("latin-1")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _translate(text: str):
+    """
+    Remove os ignoráveis e dobra, com uma única tabela, os homoglifos das
+    palavras que também têm letras latinas. Palavras inteiras em cirílico,
+    grego etc. ficam como estão, então textos nessas línguas passam sem alteração.
+    """
+    if _is_latin1(text):
+        # Em Latin-1 o único ignorável é o soft hyphen e não há homoglifos
+        return text.replace('\xad', '') if '\xad' in text else text
+    text = IGNORABLE.sub('', text)
+    if ASTRAL.search(text):
+        text = IGNORABLE_ASTRAL.sub('', text)
+    homoglyph, latin, other, unmixed, mixed = PATTERNS_FULL if ASTRAL.search(text) else PATTERNS_BMP
+    if text.isascii() or homoglyph.search(text) is None or latin.search(text) is None:
+        return text
+    # Só latim e homoglifos, sem palavra só de homoglifos (o caso de um ataque):
+    # toda palavra com homoglifo é mista e o texto é dobrado de uma vez
+    if other.search(text) is None and unmixed.search(text) is None:
+        return text.translate(FOLD_TABLE)
+    return mixed.sub(lambda match: match[0].translate(FOLD_TABLE), text)
+
+
+def _normalize_clean(text: str):
+    if not unicodedata.is_normalized("NFKC", text):
+        text = unicodedata.normalize("NFKC", text)
+    return text
+
+
 def normalize(text: str):
-    text = re.sub(r'[\u200B-\u200F\u202A-\u202E]', '', text)
-    text = unicodedata.normalize("NFKC", text)
-    return text[:3000]
+    """
+    Remove caracteres invisíveis, troca homoglifos pela letra latina nas
+    palavras em escrita mista, aplica NFKC e limita a MAX_LENGTH caracteres.
+
+    Texto ASCII já está limpo e normalizado, então só é truncado. Nos demais,
+    só os primeiros MAX_INPUT_LENGTH caracteres são lidos, e o trabalho é feito
+    sobre um prefixo que cresce em dobro até produzir MAX_LENGTH caracteres,
+    cortado numa fronteira segura: o custo é proporcional ao limite, não ao
+    tamanho da entrada, e o resultado é idêntico ao de normalizar esses
+    MAX_INPUT_LENGTH caracteres e truncar.
+    """
+    if text.isascii():
+        return text[:MAX_LENGTH]
+    text = text[:MAX_INPUT_LENGTH]
+
+    window = 2 * MAX_LENGTH
+    while window < len(text):
+        head = _translate(text[:window])
+        boundary = SAFE_BOUNDARY.search(head)
+        if boundary is not None:
+            clean = _normalize_clean(head[:boundary.start()])
+            if len(clean) >= MAX_LENGTH:
+                return clean[:MAX_LENGTH]
+        window *= 2
+    return _normalize_clean(_translate(text))[:MAX_LENGTH]
@@ -0,0 +1,87 @@
+import os
+
+from fastapi import FastAPI
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+
+def build_exporter(kind: str):
+    """
+    Exportador de spans escolhido por TRACING_EXPORTER:
+    - none (padrão): nenhum span é exportado, mas o contexto W3C continua sendo propagado
+    - console: spans em JSON na saída padrão
+    - file: um span JSON por linha em TRACING_FILE (padrão traces.jsonl)
+    - otlp: envia para um coletor OpenTelemetry (requer opentelemetry-exporter-otlp-proto-http)
+    """
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "file":
+        out = open(os.getenv("TRACING_FILE", "traces.jsonl"), "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    return None
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que continua o trace recebido no header `traceparent` (ou
+    inicia um novo), abre um span de servidor por requisição e devolve o trace id
+    no header `x-trace-id` para correlacionar logs e respostas.
+    """
+
+    def __init__(self, app, tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        parent = propagate.extract(carrier)
+        with self.tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}", context=parent, kind=SpanKind.SERVER
+        ) as span:
+            span_context = span.get_span_context()
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    span.set_attribute("http.status_code", status)
+                    if status >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                    if span_context.is_valid:
+                        headers = list(message.get("headers", []))
+                        headers.append((b"x-trace-id", format(span_context.trace_id, "032x").encode()))
+                        message = {**message, "headers": headers}
+                await send(message)
+
+            span.set_attribute("http.method", scope["method"])
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{scope['method']} {route.path}")
+                    span.set_attribute("http.route", route.path)
+
+
+def setup_tracing(app: FastAPI, service_name: str):
+    """Configura o provedor de traces do serviço e instala o middleware. Retorna o tracer."""
+    # O provedor do SDK é instalado mesmo sem exportador: o tracer no-op da API não
+    # gera ids, e requisições sem `traceparent` ficariam sem trace para propagar
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}))
+    exporter = build_exporter(os.getenv("TRACING_EXPORTER", "none"))
+    if exporter is not None:
+        processor = SimpleSpanProcessor(exporter) if os.getenv("TRACING_EXPORTER") == "file" else BatchSpanProcessor(exporter)
+        provider.add_span_processor(processor)
+    trace.set_tracer_provider(provider)
+    tracer = trace.get_tracer(service_name)
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    return tracer
@@ -0,0 +1,47 @@
+"""
+Servidor de produção: gunicorn gerenciando N processos com workers uvicorn.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+- WEB_CONCURRENCY: número de processos; "auto" usa um por núcleo (padrão 1)
+- PORT: porta de escuta
+- GRACEFUL_TIMEOUT: segundos para concluir as requisições em andamento após o SIGTERM
+- PROMETHEUS_MULTIPROC_DIR: diretório das métricas compartilhadas entre os processos
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+
+
+def workers_from_env() -> int:
+    value = os.getenv("WEB_CONCURRENCY", "1")
+    return multiprocessing.cpu_count() if value == "auto" else max(1, int(value))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = workers_from_env()
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = 5
+
+# Arquivos de métricas de uma execução anterior somariam aos novos; limpa antes
+# de o app ser importado (preload_app)
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def when_ready(server):
+    # O app já foi importado no processo mestre (preload_app). Objetos criados até
+    # aqui não são mais visitados pelo GC nos workers, o que evita copiar as
+    # páginas compartilhadas só para atualizar os cabeçalhos
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)